@@ -0,0 +1,66 @@
+"""
+多行程篩選效能比較 - 事件迴圈內計算 vs. 共享記憶體行程池
+
+用法 (於 backend 目錄):
+    python -m benchmarks.bench_process_pool --stocks 2000 --days 300 --processes 4
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.convergence_engine import ConvergenceIndex, PriceMatrix
+from services.process_screener import ProcessScreenPool
+
+
+def make_matrix(n_stocks: int, n_days: int, seed: int = 0) -> PriceMatrix:
+    """產生隨機漫步收盤價矩陣"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2020-01-01", periods=n_days, tz="Asia/Taipei")
+    vol = rng.uniform(0.002, 0.03, n_stocks)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 1, (n_days, n_stocks)) * vol, axis=0))
+    return PriceMatrix(dates, [str(1000 + i) for i in range(n_stocks)], close)
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+async def main(args) -> None:
+    matrix = make_matrix(args.stocks, args.days)
+    ma_periods = [5, 10, 20, 60]
+
+    inline = best_of(args.repeat, lambda: ConvergenceIndex.build(matrix, ma_periods, args.max_days))
+
+    pool = ProcessScreenPool(args.processes, min_stocks=0)
+    try:
+        await pool.build_index(matrix, ma_periods, args.max_days)  # 啟動工作行程
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            await pool.build_index(matrix, ma_periods, args.max_days)
+            timings.append(time.perf_counter() - start)
+        pooled = min(timings)
+    finally:
+        pool.shutdown()
+
+    print(f"股票 {args.stocks} 支 × {args.days} 天，均線 {ma_periods}，索引 {args.max_days} 天")
+    print(f"事件迴圈內: {inline * 1000:8.1f} ms")
+    print(f"行程池 ({args.processes}): {pooled * 1000:8.1f} ms  ({inline / pooled:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stocks", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=300)
+    parser.add_argument("--max-days", type=int, default=30)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,327 @@
+"""
+篩選與 K 線效能基準測試
+
+以合成資料 (SyntheticProvider) 或錄製資料 (ReplayProvider) 執行，不需網路：
+
+- scan: 全市場篩選 (冷啟動 / 重新計算 / 結果快取命中) 與尖峰記憶體
+- check_convergence: 單檔糾結檢查 (整段重算 vs. 增量狀態)
+- kline: 各週期 K 線序列化吞吐量
+- cache: 記憶體快取命中路徑延遲
+
+結果寫成 JSON，可跨 commit 比較。用法 (於 backend 目錄):
+
+    python -m benchmarks.suite run --sizes 100,1000,2000
+    python -m benchmarks.suite run --provider replay --replay-dir data/replay
+    python -m benchmarks.suite compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from services.data_provider import DataProvider, ReplayProvider, SyntheticProvider, synthetic_universe
+from services.fetch_executor import FetchExecutor
+from services.frame_cache import FrameCache
+from services.incremental_ma import IncrementalIndicatorCache
+from services.kline_serializer import build_kline_payload, encode_json
+from services.ma_calculator import MACalculator
+from services.ohlcv_store import OHLCVStore, TIMEZONE
+from services.result_cache import ScreenResultCache
+from services.screener import MAConvergenceScreener
+from services.stock_data import StockDataService
+from services.symbol_registry import SymbolRegistry
+from services.tvdata_service import resample_bars
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+MA_PERIODS = [5, 10, 20, 60]
+KLINE_INTERVALS = ["15m", "1h", "4h", "1d", "1wk"]
+
+# 比較時超過此比例視為退步
+REGRESSION_THRESHOLD = 0.10
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict:
+    """執行 repeat 次並回傳最佳、平均秒數"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {"best": min(timings), "mean": sum(timings) / len(timings), "repeat": repeat}
+
+
+async def measure_async(fn, repeat: int) -> Dict:
+    """measure 的非同步版本"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+    return {"best": min(timings), "mean": sum(timings) / len(timings), "repeat": repeat}
+
+
+def make_service(registry: SymbolRegistry, provider: DataProvider, store_dir: str) -> StockDataService:
+    return StockDataService(
+        executor=FetchExecutor(max_workers=8),
+        store=OHLCVStore(store_dir),
+        cache=FrameCache(),
+        registry=registry,
+        provider=provider
+    )
+
+
+def make_screener(service: StockDataService) -> MAConvergenceScreener:
+    return MAConvergenceScreener(
+        service, MACalculator(),
+        indicators=IncrementalIndicatorCache(), results=ScreenResultCache()
+    )
+
+
+async def bench_scan(size: int, provider: DataProvider, repeat: int) -> Dict[str, Dict]:
+    """全市場篩選：冷啟動 (含抓取與寫入本地儲存)、重新計算、結果快取命中"""
+    registry = SymbolRegistry.from_records(synthetic_universe(size))
+    results = {}
+    with tempfile.TemporaryDirectory() as store_dir:
+        service = make_service(registry, provider, store_dir)
+        screener = make_screener(service)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        matched = await screener.screen()
+        cold = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[f"scan.cold.{size}"] = {
+            "best": cold, "mean": cold, "repeat": 1,
+            "peak_bytes": peak, "matched": len(matched)
+        }
+
+        async def recompute():
+            screener.results.clear()
+            screener._indexes.clear()
+            screener._matrices.clear()
+            await screener.screen()
+
+        results[f"scan.compute.{size}"] = await measure_async(recompute, repeat)
+        results[f"scan.result_hit.{size}"] = await measure_async(screener.screen, repeat)
+
+        # 只換門檻：由糾結索引查詢
+        async def rethreshold():
+            screener.results.clear()
+            await screener.screen(convergence_pct=2.0, convergence_days=10)
+
+        results[f"scan.rethreshold.{size}"] = await measure_async(rethreshold, repeat)
+    return results
+
+
+def bench_check_convergence(provider: DataProvider, repeat: int, calls: int = 200) -> Dict[str, Dict]:
+    """單檔糾結檢查：整段重算 vs. 增量狀態 (無新 K 棒、新增一根)"""
+    df = provider.history("90000.TW", "1d", pd.Timestamp.now(tz=TIMEZONE) - pd.Timedelta(days=550))
+    results = {}
+
+    full = measure(
+        lambda: [MACalculator.check_convergence(df.copy(), MA_PERIODS, 3.0, 5) for _ in range(calls)],
+        repeat
+    )
+    results["check.full"] = per_call(full, calls)
+
+    cache = IncrementalIndicatorCache()
+    cache.sync("90000", "1d", df, MA_PERIODS, 5)
+    unchanged = measure(
+        lambda: [cache.sync("90000", "1d", df, MA_PERIODS, 5).check(3.0) for _ in range(calls)],
+        repeat
+    )
+    results["check.incremental_unchanged"] = per_call(unchanged, calls)
+
+    head = df.iloc[:-1]
+
+    def append_one():
+        for _ in range(calls):
+            cache.sync("90000", "1d", head, MA_PERIODS, 5)
+            cache.sync("90000", "1d", df, MA_PERIODS, 5).check(3.0)
+
+    results["check.incremental_append"] = per_call(measure(append_one, repeat), calls * 2)
+    return results
+
+
+def per_call(result: Dict, calls: int) -> Dict:
+    return {**result, "best": result["best"] / calls, "mean": result["mean"] / calls, "calls": calls}
+
+
+def bench_kline(provider: DataProvider, repeat: int) -> Dict[str, Dict]:
+    """各週期 K 線序列化 (列式與欄式) 的耗時與每秒 K 棒數"""
+    now = pd.Timestamp.now(tz=TIMEZONE)
+    intraday = provider.history("90000.TW", "15m", now - pd.Timedelta(days=59))
+    daily = provider.history("90000.TW", "1d", now - pd.Timedelta(days=3650))
+    frames = {
+        "15m": intraday,
+        "1h": resample_bars(intraday, "1h"),
+        "4h": resample_bars(intraday, "4h"),
+        "1d": daily,
+        "1wk": resample_bars(daily, "1wk"),
+    }
+
+    results = {}
+    for interval in KLINE_INTERVALS:
+        df = frames[interval]
+        for columnar in (False, True):
+            def serialize():
+                encode_json(build_kline_payload(df, interval, MA_PERIODS, columnar=columnar))
+
+            result = measure(serialize, repeat)
+            result["bars"] = len(df)
+            result["bars_per_second"] = len(df) / result["best"] if result["best"] else None
+            results[f"kline.{interval}.{'columnar' if columnar else 'rows'}"] = result
+    return results
+
+
+async def bench_cache(provider: DataProvider, repeat: int, calls: int = 1000) -> Dict[str, Dict]:
+    """記憶體快取命中路徑：標準歷史切片與 FrameCache.get"""
+    registry = SymbolRegistry.from_records(synthetic_universe(1))
+    with tempfile.TemporaryDirectory() as store_dir:
+        service = make_service(registry, provider, store_dir)
+        await service.get_stock_history("90000")
+
+        async def history_hits():
+            for _ in range(calls):
+                await service.get_stock_history("90000")
+
+        results = {"cache.history_hit": per_call(await measure_async(history_hits, repeat), calls)}
+
+        key = ("bars", "90000.TW", "1d")
+        results["cache.frame_get"] = per_call(
+            measure(lambda: [service.cache.get(key) for _ in range(calls)], repeat), calls
+        )
+    return results
+
+
+async def run_suite(
+    sizes: List[int],
+    provider: DataProvider,
+    repeat: int,
+    only: Optional[List[str]] = None
+) -> Dict:
+    """執行所有 (或 only 指定群組的) 基準測試"""
+    groups = only or ["scan", "check", "kline", "cache"]
+    results: Dict[str, Dict] = {}
+    if "scan" in groups:
+        for size in sizes:
+            results.update(await bench_scan(size, provider, repeat))
+    if "check" in groups:
+        results.update(bench_check_convergence(provider, repeat))
+    if "kline" in groups:
+        results.update(bench_kline(provider, repeat))
+    if "cache" in groups:
+        results.update(await bench_cache(provider, repeat))
+    return {"meta": environment(provider), "results": results}
+
+
+def environment(provider: DataProvider) -> Dict:
+    """記錄執行環境，方便比較不同 commit 的結果"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {
+        "commit": commit,
+        "timestamp": datetime.now().astimezone().isoformat(),
+        "provider": provider.name,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(old: Dict, new: Dict, threshold: float = REGRESSION_THRESHOLD) -> List[Dict]:
+    """
+    比較兩次結果的最佳時間
+
+    Returns:
+        每個共同項目的 {"name", "old", "new", "ratio", "regression"}
+    """
+    rows = []
+    for name, result in new["results"].items():
+        before = old["results"].get(name)
+        if before is None or not before["best"]:
+            continue
+        ratio = result["best"] / before["best"]
+        rows.append({
+            "name": name,
+            "old": before["best"],
+            "new": result["best"],
+            "ratio": ratio,
+            "regression": ratio > 1 + threshold,
+        })
+    return rows
+
+
+def create_provider(name: str, replay_dir: Optional[str]) -> DataProvider:
+    if name == "replay":
+        return ReplayProvider(replay_dir) if replay_dir else ReplayProvider()
+    return SyntheticProvider()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="篩選與 K 線效能基準測試")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="執行基準測試並寫出 JSON")
+    run.add_argument("--sizes", default="100,1000,2000", help="全市場篩選的股票數，逗號分隔")
+    run.add_argument("--repeat", type=int, default=5)
+    run.add_argument("--provider", choices=["synthetic", "replay"], default="synthetic")
+    run.add_argument("--replay-dir")
+    run.add_argument("--only", help="只執行指定群組 (scan,check,kline,cache)")
+    run.add_argument("--output", help="輸出路徑，預設 benchmarks/results/<commit>.json")
+
+    cmp = sub.add_parser("compare", help="比較兩個結果檔")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        rows = compare(old, new, args.threshold)
+        for row in rows:
+            flag = "  <-- 退步" if row["regression"] else ""
+            print(f"{row['name']:40s} {row['old'] * 1000:10.3f} ms -> {row['new'] * 1000:10.3f} ms "
+                  f"({row['ratio']:.2f}x){flag}")
+        return 1 if any(row["regression"] for row in rows) else 0
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    only = args.only.split(",") if args.only else None
+    report = asyncio.run(run_suite(sizes, create_provider(args.provider, args.replay_dir), args.repeat, only))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    for name, result in report["results"].items():
+        print(f"{name:40s} {result['best'] * 1000:10.3f} ms")
+    print(f"結果已寫入 {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
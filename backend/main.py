@@ -1,22 +1,71 @@
 """
 台股均線糾結篩選器 - FastAPI 主程式
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import itertools
+import json
+from datetime import date, datetime, timezone
+from email.utils import format_datetime
 import os
 
 from services.stock_data import StockDataService
 from services.ma_calculator import MACalculator
 from services.screener import MAConvergenceScreener
-from services.tvdata_service import get_tv_service
+from services.tvdata_service import get_tv_service, INTERVAL_MAP
+from services.fetch_executor import get_fetch_executor, fetch_deadline
+from services.fetch_scheduler import fetch_priority, BACKGROUND
+from services.frame_cache import get_frame_cache
+from services.single_flight import get_single_flight
+from services.incremental_ma import get_indicator_cache
+from services.kline_serializer import build_kline_payload, encode_json
+from services.snapshot_scheduler import SnapshotScheduler, SNAPSHOT_ENABLED, snapshot_key
+from services.result_cache import make_etag, etag_matches
+from services.worker_coordinator import get_worker_coordinator
+from services.metrics import (
+    registry as metrics_registry, stage, stats_collector, get_loop_monitor, RequestTimingMiddleware
+)
+
+# 單次篩選請求的抓取截止時間 (秒)；冷啟動的全市場分鐘 K 需時較長，見 fetch_scheduler 的容量估算
+SCREEN_DEADLINE = float(os.environ.get("SCREEN_DEADLINE", "120"))
+# 參數掃描最多的參數組數
+SWEEP_MAX_SETS = int(os.environ.get("SWEEP_MAX_SETS", "500"))
+# 檢查客戶端是否斷線的間隔 (秒)
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    應用程式生命週期：由領導者 worker 啟動快照排程，
+    關閉時停止排程並釋放抓取執行緒池與篩選行程池
+    """
+    coordinator = get_worker_coordinator()
+    if SNAPSHOT_ENABLED:
+        # 多個 uvicorn worker 時只有領導者執行背景更新，避免上游抓取隨 worker 數倍增
+        coordinator.start(snapshots.start)
+    loop_monitor = get_loop_monitor()
+    loop_monitor.start()
+    yield
+    await loop_monitor.stop()
+    await coordinator.stop()
+    await snapshots.stop()
+    get_fetch_executor().shutdown()
+    if screener.pool is not None:
+        screener.pool.shutdown()
+
 
 app = FastAPI(
     title="台股均線糾結篩選器",
     description="篩選均線糾結的台股，顯示 K 線圖",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS 設定
@@ -26,12 +75,53 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 讓前端 (開發時跨來源) 能讀取 ETag 進行重新驗證
+    expose_headers=["ETag", "Last-Modified", "X-Screen-Source", "X-Screen-As-Of", "Server-Timing"],
 )
 
+
+# 請求延遲與 Server-Timing (最外層，涵蓋 CORS 處理)
+app.add_middleware(RequestTimingMiddleware)
+
 # 初始化服務
 stock_service = StockDataService()
 ma_calculator = MACalculator()
 screener = MAConvergenceScreener(stock_service, ma_calculator)
+# 快照寫在共用的儲存目錄，非領導者的 worker 也能讀取
+snapshots = SnapshotScheduler(screener, directory=os.path.join(stock_service.store.root, "snapshots"))
+
+# 快取命中率等既有統計在 /api/metrics 輸出時讀取
+metrics_registry.register_collector(stats_collector(
+    "screener_frame_cache", "K-line frame cache", get_frame_cache().stats,
+    counters=["hits", "misses"], gauges=["entries", "bytes"]
+))
+metrics_registry.register_collector(stats_collector(
+    "screener_result_cache", "Screen result cache", screener.results.stats,
+    counters=["hits", "misses"], gauges=["entries"]
+))
+metrics_registry.register_collector(stats_collector(
+    "screener_indicator_cache", "Incremental indicator state", screener.indicators.stats,
+    counters=["rebuilds", "appended", "unchanged"], gauges=["entries"]
+))
+metrics_registry.register_collector(stats_collector(
+    "screener_ma_series", "Shared moving average series", stock_service.ma_cache.stats,
+    counters=["computed", "reused", "published"]
+))
+if get_fetch_executor().scheduler is not None:
+    metrics_registry.register_collector(stats_collector(
+        "screener_fetch_scheduler", "Upstream fetch scheduler", get_fetch_executor().scheduler.stats,
+        counters=["granted_interactive", "granted_background", "errors", "throttled", "backoffs"],
+        gauges=["limit", "tokens", "in_flight", "waiting_interactive", "waiting_background"]
+    ))
+metrics_registry.register_collector(stats_collector(
+    "screener_single_flight", "Coalesced fetches", get_single_flight().stats,
+    counters=["calls", "executions", "saved"], gauges=["in_flight"]
+))
+metrics_registry.register_collector(stats_collector(
+    "screener_fetch_executor", "Fetch executor", get_fetch_executor().stats,
+    counters=["submitted", "completed", "failed", "timed_out", "cancelled"],
+    gauges=["queue_depth", "in_flight"]
+))
 
 
 # ==================== 請求/回應模型 ====================
@@ -43,6 +133,48 @@ class ScreenRequest(BaseModel):
     convergence_days: int = 5
     market: Optional[str] = "all"  # all, TW, TWO
     interval: str = "1d"  # K線週期: 15m, 30m, 1h, 4h, 1d, 1wk, 1mo
+    as_of: Optional[date] = None  # 以過去某日為基準篩選 (僅日K)
+
+
+class ScreenHistoryRequest(BaseModel):
+    """歷史區間篩選請求 (日K)"""
+    ma_periods: List[int] = [5, 10, 20, 60]
+    convergence_pct: float = 3.0
+    convergence_days: int = 5
+    market: Optional[str] = "all"  # all, TW, TWO
+    start: date
+    end: date
+
+
+class SweepRequest(BaseModel):
+    """參數掃描請求：各軸的所有組合 (笛卡兒積) 各篩選一次"""
+    ma_periods: List[List[int]] = [[5, 10, 20], [5, 10, 20, 60]]
+    convergence_pct: List[float] = [2.0, 3.0, 5.0]
+    convergence_days: List[int] = [3, 5]
+    market: Optional[str] = "all"  # all, TW, TWO
+    interval: str = "1d"
+
+
+class MultiScreenRequest(BaseModel):
+    """多週期篩選請求"""
+    ma_periods: List[int] = [5, 10, 20, 60]
+    convergence_pct: float = 3.0
+    convergence_days: int = 5
+    market: Optional[str] = "all"  # all, TW, TWO
+    intervals: List[str] = ["1h", "1d"]  # 需同時符合的週期
+
+
+class BacktestRequest(BaseModel):
+    """糾結訊號回測請求"""
+    ma_periods: List[int] = [5, 10, 20, 60]
+    convergence_pct: float = 3.0
+    convergence_days: int = 5
+    market: Optional[str] = "all"  # all, TW, TWO
+    years: int = 5  # 回溯年數
+    horizons: List[int] = [5, 20, 60]  # 持有天數 (交易日)
+    start: Optional[date] = None  # 只統計此日 (含) 之後的訊號
+    end: Optional[date] = None  # 只統計此日 (含) 之前的訊號
+    entries_only: bool = False  # 只計每段連續糾結的第一天
 
 
 class StockInfo(BaseModel):
@@ -50,10 +182,16 @@ class StockInfo(BaseModel):
     code: str
     name: str
     market: str
+    industry: Optional[str] = None
     close: Optional[float] = None
     convergence_pct: Optional[float] = None
 
 
+class MultiStockInfo(StockInfo):
+    """多週期篩選結果 (intervals 為各週期的糾結幅度)"""
+    intervals: Dict[str, float] = {}
+
+
 class KlineData(BaseModel):
     """K 線數據"""
     time: str
@@ -72,27 +210,125 @@ class StockKlineResponse(BaseModel):
     ma_lines: dict
 
 
+# ==================== 輔助函式 ====================
+
+async def run_until_disconnected(request: Request, coro):
+    """
+    執行協程，若客戶端中途斷線則取消
+
+    取消會一路傳遞到 FetchExecutor，尚未開始的抓取工作會直接從佇列移除。
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def conditional_response(
+    http_request: Request,
+    response: Response,
+    etag: str,
+    last_modified: datetime
+) -> Optional[Response]:
+    """
+    設定 ETag / Last-Modified 標頭，If-None-Match 相符時回傳 304 回應
+
+    Cache-Control: no-cache 讓瀏覽器與 Service Worker 每次都以 ETag 重新驗證。
+    """
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    response.headers.update(headers)
+    if etag_matches(http_request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=dict(response.headers))
+    return None
+
+
+async def snapshot_events(params: Dict, snapshot: Dict, if_none_match: Optional[str] = None):
+    """以快照回應串流篩選：只送出一個 done (或 not_modified) 事件"""
+    etag = make_etag(snapshot_key(params), "snapshot", snapshot["version"])
+    if etag_matches(if_none_match, etag):
+        yield {"type": "not_modified", "etag": etag}
+        return
+    yield {
+        "type": "done", "results": snapshot["results"], "scanned": 0, "errors": 0,
+        "etag": etag, "cached": True, "source": "snapshot",
+        "as_of": snapshot["as_of"].isoformat()
+    }
+
+
+async def stream_screen_events(
+    request: ScreenRequest,
+    sse: bool,
+    if_none_match: Optional[str] = None,
+    snapshot: Optional[Dict] = None
+):
+    """
+    將篩選事件轉成串流格式
+    
+    - sse=True: Server-Sent Events (event: <type> / data: <json>)
+    - sse=False: NDJSON (每行一個 JSON 事件)
+    - if_none_match: 用戶端快取的 ETag，結果未變時以 not_modified 事件取代最後的 done
+    - snapshot: 符合條件的快照，有快照時不重新篩選
+    """
+    with fetch_deadline(SCREEN_DEADLINE), fetch_priority(BACKGROUND):
+        if snapshot is not None:
+            events = snapshot_events(request.model_dump(exclude={"as_of"}), snapshot, if_none_match)
+        else:
+            events = screener.screen_stream(
+                ma_periods=request.ma_periods,
+                convergence_pct=request.convergence_pct,
+                convergence_days=request.convergence_days,
+                market=request.market,
+                interval=request.interval,
+                if_none_match=if_none_match
+            )
+        async for event in events:
+            data = json.dumps(event, ensure_ascii=False)
+            if sse:
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+            else:
+                yield data + "\n"
+
+
 # ==================== API 端點 ====================
 
 
 
 @app.get("/api/stocks", response_model=List[StockInfo])
-async def get_stocks(market: str = "all", limit: int = 100):
+async def get_stocks(market: str = "all", limit: int = 100, industry: Optional[str] = None):
     """
     取得股票列表
     
     - market: all, TW (上市), TWO (上櫃)
     - limit: 回傳筆數限制
+    - industry: 產業類別, 如 半導體業
     """
     try:
-        stocks = stock_service.get_stock_list(market=market, limit=limit)
+        stocks = stock_service.get_stock_list(market=market, limit=limit, industry=industry)
         return stocks
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/industries", response_model=List[str])
+async def get_industries():
+    """取得所有產業類別"""
+    return stock_service.registry.industries()
+
+
 @app.post("/api/screen", response_model=List[StockInfo])
-async def screen_stocks(request: ScreenRequest):
+async def screen_stocks(request: ScreenRequest, http_request: Request, response: Response):
     """
     篩選均線糾結股票
     
@@ -100,16 +336,234 @@ async def screen_stocks(request: ScreenRequest):
     - convergence_pct: 糾結幅度百分比, 如 3.0 表示 3%
     - convergence_days: 連續糾結天數
     - market: all, TW, TWO
+    
+    預先計算過的條件直接回傳快照；回應標頭 `X-Screen-As-Of` 為資料時間，
+    `X-Screen-Source` 為 snapshot、cache 或 live。
+    
+    相同條件且 K 線沒有新資料時沿用上次的結果；回應帶有 ETag / Last-Modified，
+    以 If-None-Match 重新驗證時若結果未變回傳 304。
+    
+    - as_of: 以過去某日為基準 (僅日K)，`X-Screen-Source` 為 history，
+      `X-Screen-As-Of` 為實際使用的交易日
+    """
+    if request.as_of is not None:
+        return await screen_as_of(request, http_request, response)
+    
+    params = request.model_dump(exclude={"as_of"})
+    snapshot = snapshots.lookup(params)
+    if snapshot is not None:
+        response.headers["X-Screen-Source"] = "snapshot"
+        response.headers["X-Screen-As-Of"] = snapshot["as_of"].isoformat()
+        response.headers["X-Screen-Version"] = str(snapshot["version"])
+        etag = make_etag(snapshot_key(params), "snapshot", snapshot["version"])
+        not_modified = conditional_response(http_request, response, etag, snapshot["as_of"])
+        return not_modified or snapshot["results"]
+    
+    try:
+        with fetch_deadline(SCREEN_DEADLINE), fetch_priority(BACKGROUND):
+            entry = await run_until_disconnected(http_request, screener.screen_versioned(
+                ma_periods=request.ma_periods,
+                convergence_pct=request.convergence_pct,
+                convergence_days=request.convergence_days,
+                market=request.market,
+                interval=request.interval
+            ))
+        response.headers["X-Screen-Source"] = "cache" if entry["cached"] else "live"
+        response.headers["X-Screen-As-Of"] = entry["last_modified"].isoformat()
+        not_modified = conditional_response(
+            http_request, response, entry["etag"], entry["last_modified"]
+        )
+        return not_modified or entry["results"]
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def screen_as_of(request: ScreenRequest, http_request: Request, response: Response):
+    """/api/screen 的 as_of 模式：以本地歷史回放當日的篩選結果"""
+    if request.interval != "1d":
+        raise HTTPException(status_code=400, detail="as_of 僅支援日K")
+    
+    try:
+        with fetch_deadline(SCREEN_DEADLINE), fetch_priority(BACKGROUND):
+            history = await run_until_disconnected(http_request, screener.screen_history(
+                ma_periods=request.ma_periods,
+                convergence_pct=request.convergence_pct,
+                convergence_days=request.convergence_days,
+                market=request.market,
+                start=request.as_of
+            ))
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    response.headers["X-Screen-Source"] = "history"
+    if not history:
+        return []
+    response.headers["X-Screen-As-Of"] = history[0]["date"]
+    return history[0]["results"]
+
+
+@app.post("/api/screen/history")
+async def screen_stocks_history(request: ScreenHistoryRequest, http_request: Request):
+    """
+    歷史區間篩選：回傳 start 至 end 之間每個交易日的篩選結果 (日K)
+    
+    所有日期由同一份價格矩陣一次計算。回應為 `[{"date", "results"}]`，
+    results 格式同 `/api/screen`。
     """
+    if request.end < request.start:
+        raise HTTPException(status_code=400, detail="end 不可早於 start")
+    
     try:
-        results = await screener.screen(
-            ma_periods=request.ma_periods,
-            convergence_pct=request.convergence_pct,
-            convergence_days=request.convergence_days,
-            market=request.market,
-            interval=request.interval
+        with fetch_deadline(SCREEN_DEADLINE), fetch_priority(BACKGROUND):
+            return await run_until_disconnected(http_request, screener.screen_history(
+                ma_periods=request.ma_periods,
+                convergence_pct=request.convergence_pct,
+                convergence_days=request.convergence_days,
+                market=request.market,
+                start=request.start,
+                end=request.end
+            ))
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/screen/sweep")
+async def screen_stocks_sweep(request: SweepRequest, http_request: Request):
+    """
+    參數掃描：以 ma_periods × convergence_pct × convergence_days 的每個組合各篩選一次
+    
+    K 線只載入一次，每個不同的均線週期只計算一次，
+    成本隨不同均線週期的數量而非組合數量增加。
+    
+    回應的 `sets` 為各組參數與符合數量；`stocks` 的 `matches[i]` 為該股票在第 i 組的
+    糾結幅度 (不符合時為 null)。
+    """
+    if request.interval not in INTERVAL_MAP:
+        raise HTTPException(status_code=400, detail=f"Unsupported interval: {request.interval}")
+    param_sets = [
+        {"ma_periods": periods, "convergence_pct": pct, "convergence_days": days}
+        for periods, pct, days in itertools.product(
+            request.ma_periods, request.convergence_pct, request.convergence_days
         )
-        return results
+    ]
+    if not param_sets or len(param_sets) > SWEEP_MAX_SETS:
+        raise HTTPException(status_code=400, detail=f"參數組數需介於 1 與 {SWEEP_MAX_SETS}")
+    
+    try:
+        with fetch_deadline(SCREEN_DEADLINE), fetch_priority(BACKGROUND):
+            return await run_until_disconnected(http_request, screener.screen_sweep(
+                param_sets, market=request.market, interval=request.interval
+            ))
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/screen/multi", response_model=List[MultiStockInfo])
+async def screen_stocks_multi(request: MultiScreenRequest, http_request: Request):
+    """
+    多週期篩選：所有指定週期都符合均線糾結條件的股票
+    
+    - intervals: 如 ["1h", "1d"]；分鐘 K 只抓 15m、週/月K 由日K 合併
+    
+    其餘參數同 `/api/screen`。
+    """
+    unknown = [i for i in request.intervals if i not in INTERVAL_MAP]
+    if not request.intervals or unknown:
+        raise HTTPException(status_code=400, detail=f"Unsupported intervals: {unknown}")
+    
+    try:
+        with fetch_deadline(SCREEN_DEADLINE), fetch_priority(BACKGROUND):
+            return await run_until_disconnected(http_request, screener.screen_multi(
+                ma_periods=request.ma_periods,
+                convergence_pct=request.convergence_pct,
+                convergence_days=request.convergence_days,
+                market=request.market,
+                intervals=request.intervals
+            ))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/screen/stream")
+async def screen_stocks_stream(request: ScreenRequest, http_request: Request):
+    """
+    串流篩選均線糾結股票
+    
+    參數同 `/api/screen`。K 線載入期間持續送出 `progress` (已載入/總數/錯誤數)，
+    之後送出每支符合條件股票的 `match` 事件，最後送出排序後的 `done` 事件 (含 `etag`)。
+    
+    與 `/api/screen` 共用快照與結果快取：有快照或資料未變時只送出一個 `done` 事件
+    (`cached` 為 true；快照另含 `source` 與 `as_of`)；
+    帶 If-None-Match 且與結果的 ETag 相符時只送出 `not_modified` 事件。
+    
+    - Accept: text/event-stream 時回傳 SSE，否則回傳 NDJSON
+    """
+    sse = "text/event-stream" in http_request.headers.get("accept", "")
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    snapshot = snapshots.lookup(request.model_dump(exclude={"as_of"}))
+    if snapshot is not None:
+        headers["X-Screen-Source"] = "snapshot"
+        headers["X-Screen-As-Of"] = snapshot["as_of"].isoformat()
+    return StreamingResponse(
+        stream_screen_events(request, sse, http_request.headers.get("if-none-match"), snapshot),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers=headers
+    )
+
+
+@app.post("/api/backtest")
+async def backtest(request: BacktestRequest, http_request: Request):
+    """
+    回測均線糾結訊號
+    
+    找出過去 `years` 年內每個符合條件的 (股票, 交易日)，統計之後各持有天數的
+    平均/中位數報酬、勝率 (報酬 > 0 的比例) 與期間最大回撤 (百分比)，
+    並附上同期間全市場的無條件報酬作為基準。
+    
+    - horizons: 持有天數 (交易日)，如 [5, 20, 60]
+    - start / end: 只統計此區間內的訊號 (均線仍以完整歷史計算)
+    - entries_only: 只計每段連續糾結的第一天
+    
+    `events` 為最近的訊號明細 (依日期由新到舊)。
+    """
+    if not 1 <= request.years <= 20:
+        raise HTTPException(status_code=400, detail="years 需介於 1 與 20")
+    if not request.ma_periods or request.convergence_days <= 0:
+        raise HTTPException(status_code=400, detail="需指定均線週期且 convergence_days 需大於 0")
+    
+    try:
+        with fetch_deadline(SCREEN_DEADLINE), fetch_priority(BACKGROUND):
+            return await run_until_disconnected(http_request, screener.backtest(
+                ma_periods=request.ma_periods,
+                convergence_pct=request.convergence_pct,
+                convergence_days=request.convergence_days,
+                market=request.market,
+                years=request.years,
+                horizons=request.horizons,
+                start=request.start,
+                end=request.end,
+                entries_only=request.entries_only
+            ))
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -119,7 +573,8 @@ async def get_stock_kline(
     code: str,
     days: int = 120,
     ma_periods: str = "5,10,20,60",
-    interval: str = "1d"
+    interval: str = "1d",
+    format: str = "rows"
 ):
     """
     取得個股 K 線數據與均線
@@ -128,15 +583,19 @@ async def get_stock_kline(
     - days: 取幾天的數據 (用於日K以上週期)
     - ma_periods: 要計算的均線週期，逗號分隔
     - interval: K 線週期 (15m, 30m, 1h, 4h, 1d, 1wk, 1mo)
+    - format: rows (每根 K 棒一個物件) 或 columnar (每個欄位一個陣列)
     """
     try:
         # 解析均線週期
         periods = [int(p.strip()) for p in ma_periods.split(",")]
+        if format not in ("rows", "columnar"):
+            raise ValueError(f"Unsupported format: {format}")
+        columnar = format == "columnar"
         
-        # 根據 interval 決定資料來源
+        # 根據 interval 決定資料來源 (抓取走預設的 interactive 通道，優先於背景篩選)
         if interval == "1d":
             # 日K 使用原本的 yfinance (較穩定)
-            result = await stock_service.get_stock_kline(code, days, periods)
+            result = await stock_service.get_stock_kline(code, days, periods, columnar=columnar)
         else:
             # 其他週期使用 TradingView
             tv_service = get_tv_service()
@@ -150,47 +609,30 @@ async def get_stock_kline(
             if df is None or df.empty:
                 raise HTTPException(status_code=404, detail=f"找不到股票 {code} 的 {interval} 資料")
             
-            # 計算均線
-            # 計算均線 (需包含時間與數值)
-            ma_lines = {}
-            for period in periods:
-                if len(df) >= period:
-                    ma_series = df["Close"].rolling(window=period).mean().dropna()
-                    ma_data = []
-                    for idx, val in ma_series.items():
-                        time_val = int(idx.timestamp()) + 28800 if interval not in ["1d", "1wk", "1mo"] else idx.strftime("%Y-%m-%d")
-                         # 修正：加上 28800 (8小時) 確保時區正確，因為 timestamp() 是 UTC，而前端 chart 可能預設 UTC
-                         # 為了保險，這裡直接回傳 timestamp (UTC)，Lightweight Charts 會自動處理本地時區顯示
-                         # 但 yfinance 的 index 如果有 tz，timestamp() 會是準確的 UTC。
-                         # 讓我們保持簡單：int(idx.timestamp())
-                        time_val = int(idx.timestamp()) if interval not in ["1d", "1wk", "1mo"] else idx.strftime("%Y-%m-%d")
-                        ma_data.append({"time": time_val, "value": float(val)})
-                    ma_lines[f"ma{period}"] = ma_data
-            
-            # 格式化 OHLC
-            ohlc = []
-            for idx, row in df.iterrows():
-                ohlc.append({
-                    "time": int(idx.timestamp()) if interval not in ["1d", "1wk", "1mo"] else idx.strftime("%Y-%m-%d"),
-                    "open": float(row["Open"]),
-                    "high": float(row["High"]),
-                    "low": float(row["Low"]),
-                    "close": float(row["Close"]),
-                    "volume": int(row["Volume"]) if "Volume" in row else 0
-                })
-            
+            # 分鐘K 時間為 UTC timestamp，Lightweight Charts 會自動處理本地時區顯示
+            with stage("indicators"):
+                ma_series = stock_service.ma_cache.series(
+                    code, interval, df, [p for p in periods if len(df) >= p]
+                )
+            with stage("serialize"):
+                payload = build_kline_payload(
+                    df, interval, periods, ma_prefix="ma", columnar=columnar, ma_series=ma_series
+                )
             result = {
                 "code": code,
                 "name": stock_service.get_stock_name(code),
-                "ohlc": ohlc,
-                "ma_lines": ma_lines,
+                **payload,
                 "interval": interval
             }
         
         if not result:
             raise HTTPException(status_code=404, detail=f"找不到股票 {code}")
         
-        return result
+        with stage("serialize"):
+            content = encode_json(result)
+        return Response(content=content, media_type="application/json")
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -203,6 +645,122 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/api/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus 格式的效能指標
+
+    包含各階段耗時 (indicators / serialize)、上游抓取延遲 (依資料來源與週期)、
+    請求延遲、事件迴圈延遲，以及各快取的命中與未命中次數。
+    """
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/admin/fetch-executor")
+async def fetch_executor_stats():
+    """抓取執行器狀態 (佇列深度、執行中數量等)"""
+    return get_fetch_executor().stats()
+
+
+@app.get("/api/admin/fetch-scheduler")
+async def fetch_scheduler_stats():
+    """
+    上游抓取排程器狀態
+    
+    - limit: 目前的並行上限 (失敗時減半，延遲正常時逐步提高到 max_limit)
+    - tokens: 令牌桶剩餘令牌，rate 為每秒請求數
+    - waiting_* / granted_*: 各優先通道等待中與已取得名額的抓取數
+    """
+    scheduler = get_fetch_executor().scheduler
+    if scheduler is None:
+        return {"enabled": False}
+    return {"enabled": True, **scheduler.stats()}
+
+
+@app.get("/api/admin/single-flight")
+async def single_flight_stats():
+    """請求合併狀態 (saved 為省下的重複抓取次數)"""
+    return get_single_flight().stats()
+
+
+@app.get("/api/admin/workers")
+async def worker_stats():
+    """本 worker 的協調狀態 (是否為負責背景更新的領導者)"""
+    return get_worker_coordinator().stats()
+
+
+@app.get("/api/admin/process-pool")
+async def process_pool_stats():
+    """多行程篩選狀態 (未啟用時 enabled 為 false)"""
+    if screener.pool is None:
+        return {"enabled": False}
+    return {"enabled": True, **screener.pool.stats()}
+
+
+@app.get("/api/admin/screen-cache")
+async def screen_cache_stats():
+    """篩選結果快取狀態"""
+    return screener.results.stats()
+
+
+@app.delete("/api/admin/screen-cache")
+async def flush_screen_cache():
+    """清除篩選結果快取"""
+    return {"removed": screener.results.clear()}
+
+
+@app.get("/api/admin/indicators")
+async def indicator_stats():
+    """
+    均線狀態
+    
+    - 增量均線 (分鐘 K 等非日K 篩選): appended 為增量餵入的 K 棒數，rebuilds 為重建次數，
+      unchanged 為沒有新 K 棒而直接沿用的次數
+    - ma_series: 篩選與 K 線圖共用的均線 (computed 為實際計算次數，reused 為沿用次數，
+      published 為篩選時整批寫入的序列數)
+    """
+    return {**get_indicator_cache().stats(), "ma_series": stock_service.ma_cache.stats()}
+
+
+@app.get("/api/admin/cache")
+async def cache_stats(entries: bool = False):
+    """
+    K 線快取狀態
+    
+    - entries: 是否列出每筆快取項目
+    """
+    cache = get_frame_cache()
+    result = cache.stats()
+    if entries:
+        result["items"] = cache.entries()
+    return result
+
+
+@app.delete("/api/admin/cache")
+async def flush_cache(namespace: Optional[str] = None):
+    """
+    清除 K 線快取
+    
+    - namespace: bars (各股票各週期的標準歷史)、derived (由較細週期合併的 K 線)、
+      ma (共用的均線序列)，不指定則全部清除
+    """
+    removed = get_frame_cache().clear(namespace)
+    return {"removed": removed}
+
+
+@app.get("/api/admin/snapshots")
+async def snapshot_stats():
+    """取得篩選快照與排程狀態"""
+    return snapshots.stats()
+
+
+@app.post("/api/admin/snapshots/refresh")
+async def refresh_snapshots():
+    """立即重新計算所有預先篩選的快照"""
+    refreshed = await snapshots.refresh_all()
+    return {"refreshed": refreshed}
+
+
 
 # ==================== 靜態檔案服務 (Frontend Integration) ====================
 
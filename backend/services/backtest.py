@@ -0,0 +1,262 @@
+"""
+均線糾結訊號回測
+
+以 PriceMatrix (日期 × 股票) 一次算出全市場每個交易日的糾結狀態，
+找出所有符合條件的 (股票, 日期)，再計算之後 N 個交易日的報酬與期間最大回撤；
+同一份結果也用於回放任意過去日期 (as of) 的篩選。
+全部以陣列運算完成，不逐日或逐檔迴圈。
+"""
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .convergence_engine import ConvergenceEngine, PriceMatrix
+
+# 預設的持有天數 (交易日)
+FORWARD_HORIZONS = (5, 20, 60)
+# 回傳的最近訊號筆數上限
+MAX_EVENTS = 200
+
+
+class ConvergenceBacktest:
+    """向量化糾結訊號回測"""
+
+    @staticmethod
+    def streaks(spread: np.ndarray, convergence_pct: float) -> np.ndarray:
+        """
+        每個時點往回連續糾結 (幅度 <= 門檻) 的天數
+
+        NaN 視為不符合。
+        """
+        with np.errstate(invalid="ignore"):
+            ok = spread <= convergence_pct
+        count = np.cumsum(ok, axis=0)
+        # 最近一次不符合時的累計值，相減即為目前連續天數
+        reset = np.maximum.accumulate(np.where(ok, 0, count), axis=0)
+        return count - reset
+
+    @staticmethod
+    def signal_matrix(
+        packed: np.ndarray,
+        ma_periods: List[int],
+        convergence_pct: float,
+        convergence_days: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        每個時點是否符合糾結條件 (與 ConvergenceEngine.check_convergence 在最後一天的規則相同)
+
+        Args:
+            packed: ConvergenceEngine.pack_to_end 壓縮後的收盤價
+
+        Returns:
+            (是否符合條件, 糾結幅度百分比)，皆與 packed 同形狀
+        """
+        if not ma_periods or convergence_days <= 0 or packed.size == 0:
+            return np.zeros(packed.shape, dtype=bool), np.full(packed.shape, np.nan)
+
+        spread = ConvergenceEngine.spread_pct(ConvergenceEngine.moving_averages(packed, ma_periods))
+        run = ConvergenceBacktest.streaks(spread, convergence_pct)
+        bars = np.cumsum(~np.isnan(packed), axis=0)
+        signals = (run >= convergence_days) & (bars >= max(ma_periods) + convergence_days)
+        return signals, spread
+
+    @classmethod
+    def point_in_time(
+        cls,
+        matrix: PriceMatrix,
+        ma_periods: List[int],
+        convergence_pct: float,
+        convergence_days: int,
+        rows: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        以矩陣的第 rows 列 (日期) 為「現在」一次檢查多個日期的糾結條件
+
+        每支股票使用該日 (含) 之前的最後一根 K 棒，停牌日沿用前一個交易日的狀態，
+        與當天執行 check_convergence 的結果相同。
+
+        Returns:
+            (是否符合條件, 當日糾結幅度百分比, 當日收盤價)，shape = (len(rows), len(matrix))
+        """
+        rows = np.asarray(rows, dtype=int)
+        packed, _ = ConvergenceEngine.pack_to_end(matrix.close)
+        signals, spread = cls.signal_matrix(packed, ma_periods, convergence_pct, convergence_days)
+
+        # 壓縮後有效值依原順序位於底部：第 r 列之前的第 k 根 K 棒位於 T - 總根數 + k - 1
+        valid = ~np.isnan(matrix.close)
+        seen = np.cumsum(valid, axis=0)[rows]
+        packed_rows = np.maximum(packed.shape[0] - valid.sum(axis=0) + seen - 1, 0)
+        cols = np.arange(len(matrix))[None, :]
+
+        has_data = seen > 0
+        matched = signals[packed_rows, cols] & has_data
+        pct = np.where(has_data, spread[packed_rows, cols], np.nan)
+        close = np.where(has_data, packed[packed_rows, cols], np.nan)
+        return matched, pct, close
+
+    @staticmethod
+    def forward_min(values: np.ndarray, window: int) -> np.ndarray:
+        """
+        每欄 values[i+1 : i+1+window] 的最小值，超出資料尾端處為 NaN
+
+        以倍增法 (兩個重疊的 2^k 視窗) 計算，成本為 O(列數 × log window)。
+        """
+        rows = values.shape[0]
+        result = np.full(values.shape, np.nan)
+        if window <= 0 or rows <= window:
+            return result
+
+        # level[i] = min(values[i : i + span])
+        level, span = values, 1
+        while span * 2 <= window:
+            level = np.minimum(level[:-span], level[span:])
+            span *= 2
+
+        result[:rows - window] = np.minimum(
+            level[1:rows - window + 1],
+            level[1 + window - span:rows - span + 1]
+        )
+        return result
+
+    @classmethod
+    def run(
+        cls,
+        matrix: PriceMatrix,
+        ma_periods: List[int],
+        convergence_pct: float,
+        convergence_days: int,
+        horizons: Sequence[int] = FORWARD_HORIZONS,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        entries_only: bool = False,
+        max_events: int = MAX_EVENTS
+    ) -> Dict:
+        """
+        回測糾結訊號
+
+        均線以完整歷史計算，只統計 [start, end] 內的訊號。
+
+        Args:
+            horizons: 持有天數 (交易日)
+            entries_only: 只計每段連續糾結的第一天，避免同一段訊號重複計算
+            max_events: 回傳最近幾筆訊號明細
+
+        Returns:
+            {"signals", "symbols", "horizons": {天數: 統計}, "events": [...]}；
+            報酬與回撤為百分比，hit_rate 為報酬大於 0 的比例。
+            baseline_* 為同期間所有 (股票, 日期) 的無條件報酬，作為比較基準。
+        """
+        horizons = sorted({int(h) for h in horizons})
+        if not horizons or horizons[0] <= 0:
+            raise ValueError("horizons 需為正整數")
+
+        packed, order = ConvergenceEngine.pack_to_end(matrix.close)
+        signals, spread = cls.signal_matrix(packed, ma_periods, convergence_pct, convergence_days)
+        if entries_only and signals.size:
+            signals[1:] &= ~signals[:-1]
+
+        # 每格對應的日期 (壓縮後各欄的列順序不同)
+        dates = matrix.dates.values
+        in_range = np.ones(packed.shape, dtype=bool)
+        if packed.size and (start is not None or end is not None):
+            cell_dates = dates[order]
+            if start is not None:
+                in_range &= cell_dates >= _datetime64(start, matrix.dates)
+            if end is not None:
+                in_range &= cell_dates <= _datetime64(end, matrix.dates)
+        signals &= in_range
+
+        rows, cols = np.nonzero(signals)
+        entry = packed[rows, cols]
+
+        stats = {}
+        forward = {}
+        for h in horizons:
+            future = np.full(len(rows), np.nan)
+            available = rows + h < packed.shape[0]
+            future[available] = packed[rows[available] + h, cols[available]]
+            returns = (future / entry - 1) * 100
+            drawdown = np.minimum(cls.forward_min(packed, h)[rows, cols] / entry - 1, 0) * 100
+            forward[h] = returns
+
+            # 無條件基準：同期間所有有完整持有期的 (股票, 日期)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                base = (packed[h:] / packed[:-h] - 1) * 100 if packed.shape[0] > h else np.empty((0,))
+            if base.size:
+                base = base[in_range[:-h] & ~np.isnan(base)]
+            stats[str(h)] = _summarize(returns, drawdown, base)
+
+        return {
+            "signals": int(len(rows)),
+            "symbols": int(len(np.unique(cols))),
+            "universe": len(matrix),
+            "horizons": stats,
+            "events": cls._events(matrix, packed, spread, order, rows, cols, forward, max_events),
+        }
+
+    @staticmethod
+    def _events(
+        matrix: PriceMatrix,
+        packed: np.ndarray,
+        spread: np.ndarray,
+        order: np.ndarray,
+        rows: np.ndarray,
+        cols: np.ndarray,
+        forward: Dict[int, np.ndarray],
+        max_events: int
+    ) -> List[Dict]:
+        """最近 max_events 筆訊號明細 (依日期由新到舊)"""
+        if max_events <= 0 or len(rows) == 0:
+            return []
+
+        positions = order[rows, cols]
+        latest = np.argsort(-positions, kind="stable")[:max_events]
+
+        events = []
+        for k in latest:
+            row, col = rows[k], cols[k]
+            events.append({
+                "code": matrix.codes[col],
+                "date": matrix.dates[positions[k]].strftime("%Y-%m-%d"),
+                "close": round(float(packed[row, col]), 2),
+                "convergence_pct": round(float(spread[row, col]), 2),
+                "returns": {
+                    str(h): None if np.isnan(values[k]) else round(float(values[k]), 2)
+                    for h, values in forward.items()
+                },
+            })
+        return events
+
+
+def _datetime64(value: date, index: pd.Index) -> np.datetime64:
+    """轉為與 index.values 可比較的 datetime64 (時區與 index 一致)"""
+    ts = pd.Timestamp(value)
+    tz = getattr(index, "tz", None)
+    if tz is not None:
+        ts = ts.tz_localize(tz) if ts.tz is None else ts.tz_convert(tz)
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    elif ts.tz is not None:
+        ts = ts.tz_localize(None)
+    return np.datetime64(ts.to_datetime64())
+
+
+def _summarize(returns: np.ndarray, drawdown: np.ndarray, baseline: np.ndarray) -> Dict:
+    """單一持有天數的統計"""
+    valid = ~np.isnan(returns)
+    returns, drawdown = returns[valid], drawdown[valid]
+
+    def pct(value):
+        return round(float(value), 2) if value is not None and np.isfinite(value) else None
+
+    return {
+        "count": int(len(returns)),
+        "mean_return": pct(returns.mean()) if len(returns) else None,
+        "median_return": pct(np.median(returns)) if len(returns) else None,
+        "hit_rate": round(float((returns > 0).mean()), 4) if len(returns) else None,
+        "mean_drawdown": pct(drawdown.mean()) if len(drawdown) else None,
+        "worst_drawdown": pct(drawdown.min()) if len(drawdown) else None,
+        "baseline_mean_return": pct(baseline.mean()) if len(baseline) else None,
+        "baseline_hit_rate": round(float((baseline > 0).mean()), 4) if len(baseline) else None,
+    }
@@ -0,0 +1,313 @@
+"""
+向量化均線糾結引擎
+
+將所有股票的收盤價疊成 (日期 × 股票) 的二維陣列，
+一次計算全市場的均線、糾結幅度與連續天數條件。
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+
+
+class PriceMatrix:
+    """對齊日期後的收盤價矩陣"""
+
+    def __init__(self, dates: pd.Index, codes: List[str], close: np.ndarray):
+        """
+        Args:
+            dates: 所有股票日期的聯集 (已排序)
+            codes: 股票代碼，順序對應 close 的欄
+            close: shape = (len(dates), len(codes))，無資料處為 NaN
+        """
+        self.dates = dates
+        self.codes = codes
+        self.close = close
+
+    @classmethod
+    def from_frames(cls, frames: Dict[str, pd.DataFrame], column: str = "Close") -> "PriceMatrix":
+        """
+        由 {股票代碼: OHLCV DataFrame} 建立矩陣
+
+        Args:
+            frames: 各股票歷史數據
+            column: 使用的價格欄位
+        """
+        codes = [
+            code for code, df in frames.items()
+            if df is not None and not df.empty and column in df.columns
+        ]
+        if not codes:
+            return cls(pd.DatetimeIndex([]), [], np.empty((0, 0)))
+
+        series = {}
+        for code in codes:
+            s = frames[code][column]
+            # yfinance 偶爾會重複最後一根 K 棒，對齊前先去除
+            if s.index.has_duplicates:
+                s = s[~s.index.duplicated(keep="last")]
+            series[code] = s
+        aligned = pd.concat(series, axis=1, sort=True)
+        return cls(aligned.index, codes, aligned.to_numpy(dtype=np.float64))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+class ConvergenceEngine:
+    """向量化均線糾結計算器"""
+
+    @staticmethod
+    def pack_to_end(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        將每欄的有效值依原順序推到底部，NaN 留在上方
+
+        每支股票只以自己的 K 棒計算均線 (停牌日不會中斷視窗)，
+        結果與逐檔 rolling() 相同。
+
+        Returns:
+            (壓縮後陣列, 列索引對照表)；packed[i, j] = values[order[i, j], j]
+        """
+        valid = ~np.isnan(values)
+        order = np.argsort(valid, axis=0, kind="stable")
+        return np.take_along_axis(values, order, axis=0), order
+
+    @staticmethod
+    def rolling_mean(values: np.ndarray, period: int) -> np.ndarray:
+        """
+        以累積和計算每欄的移動平均
+
+        視窗內只要有 NaN 結果即為 NaN，與 pandas rolling(window).mean() 相同。
+        """
+        rows = values.shape[0]
+        result = np.full(values.shape, np.nan)
+        if period <= 0 or rows < period:
+            return result
+
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+
+        zeros = np.zeros((1,) + values.shape[1:])
+        csum = np.concatenate([zeros, np.cumsum(filled, axis=0)])
+        ccount = np.concatenate([zeros, np.cumsum(valid, axis=0)])
+
+        window_sum = csum[period:] - csum[:-period]
+        window_count = ccount[period:] - ccount[:-period]
+
+        result[period - 1:] = np.where(window_count == period, window_sum / period, np.nan)
+        return result
+
+    @staticmethod
+    def moving_averages(values: np.ndarray, ma_periods: List[int]) -> np.ndarray:
+        """
+        計算多條均線
+
+        Returns:
+            shape = (len(ma_periods),) + values.shape
+        """
+        return np.stack([ConvergenceEngine.rolling_mean(values, p) for p in ma_periods])
+
+    @staticmethod
+    def spread_pct(mas: np.ndarray) -> np.ndarray:
+        """
+        計算每個時點的均線糾結幅度 (最大值與最小值差距佔最小值的百分比)
+
+        任一均線為 NaN 時結果為 NaN。
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ma_max = mas.max(axis=0)
+            ma_min = mas.min(axis=0)
+            return (ma_max - ma_min) / ma_min * 100
+
+    @staticmethod
+    def check_convergence(
+        matrix: PriceMatrix,
+        ma_periods: List[int],
+        convergence_pct: float,
+        convergence_days: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        對整個矩陣檢查均線糾結條件 (與 MACalculator.check_convergence 相同規則)
+
+        Returns:
+            (是否符合條件, 當前糾結幅度百分比, 最新收盤價)，皆為長度 len(matrix) 的陣列
+        """
+        n = len(matrix)
+        if n == 0 or not ma_periods:
+            return np.zeros(n, dtype=bool), np.zeros(n), np.full(n, np.nan)
+
+        packed, _ = ConvergenceEngine.pack_to_end(matrix.close)
+        bars = (~np.isnan(packed)).sum(axis=0)
+        last_close = packed[-1]
+
+        enough = bars >= max(ma_periods) + convergence_days
+        if convergence_days <= 0 or packed.shape[0] < convergence_days:
+            return np.zeros(n, dtype=bool), np.zeros(n), last_close
+
+        # 只需最後 max_period + days 列即可得到最近 days 天的均線
+        tail = packed[-(max(ma_periods) + convergence_days - 1):]
+        spread = ConvergenceEngine.spread_pct(
+            ConvergenceEngine.moving_averages(tail, ma_periods)
+        )
+        recent = spread[-convergence_days:]
+
+        with np.errstate(invalid="ignore"):
+            within = (recent <= convergence_pct).all(axis=0)
+        is_converged = enough & within
+
+        current_pct = np.where(enough, np.round(recent[-1], 2), 0.0)
+        return is_converged, current_pct, last_close
+
+
+class ConvergenceIndex:
+    """
+    與門檻無關的糾結索引
+
+    對固定的均線組合，預先計算每支股票「最近 d 天糾結幅度的最大值」(d = 1..max_days)，
+    並依每個 d 排序。任意 (幅度, 天數) 條件都只需一次二分搜尋：
+    最近 d 天最大幅度 <= 門檻的股票即為符合條件。
+    """
+
+    def __init__(
+        self,
+        codes: List[str],
+        window_max: np.ndarray,
+        current_pct: np.ndarray,
+        last_close: np.ndarray
+    ):
+        """
+        Args:
+            codes: 股票代碼
+            window_max: shape = (max_days, len(codes))，第 d-1 列為最近 d 天的最大糾結幅度，
+                資料不足 (K 棒少於最長均線 + d) 時為 inf
+            current_pct: 最新一天的糾結幅度 (已四捨五入)
+            last_close: 最新收盤價
+        """
+        self.codes = codes
+        self.max_days = window_max.shape[0]
+        self.current_pct = current_pct
+        self.last_close = last_close
+        self._order = np.argsort(window_max, axis=1, kind="stable")
+        self._sorted = np.take_along_axis(window_max, self._order, axis=1)
+
+    @classmethod
+    def build(cls, matrix: PriceMatrix, ma_periods: List[int], max_days: int) -> "ConvergenceIndex":
+        """由價格矩陣建立索引 (與 ConvergenceEngine.check_convergence 相同規則)"""
+        return cls(list(matrix.codes), *cls.compute(matrix.close, ma_periods, max_days))
+
+    @classmethod
+    def from_shards(
+        cls,
+        shards: List[Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]],
+        max_days: int
+    ) -> "ConvergenceIndex":
+        """
+        依欄合併分批計算的索引內容 (結果與整個矩陣一次建立相同)
+
+        Args:
+            shards: [(codes, window_max, current_pct, last_close), ...]，後三者為 compute() 的結果
+        """
+        if not shards:
+            return cls([], np.full((max(max_days, 0), 0), np.inf), np.zeros(0), np.full(0, np.nan))
+        return cls(
+            [code for shard in shards for code in shard[0]],
+            np.concatenate([shard[1] for shard in shards], axis=1),
+            np.concatenate([shard[2] for shard in shards]),
+            np.concatenate([shard[3] for shard in shards])
+        )
+
+    @staticmethod
+    def compute(
+        close: np.ndarray,
+        ma_periods: List[int],
+        max_days: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        計算索引內容；各欄 (股票) 互相獨立，可分片計算後再依欄合併
+
+        Returns:
+            (window_max, current_pct, last_close)
+        """
+        n = close.shape[1] if close.ndim == 2 else 0
+        if n == 0 or not ma_periods or max_days <= 0 or close.shape[0] == 0:
+            return np.full((max(max_days, 0), n), np.inf), np.zeros(n), np.full(n, np.nan)
+
+        packed, _ = ConvergenceEngine.pack_to_end(close)
+        bars = (~np.isnan(packed)).sum(axis=0)
+        last_close = packed[-1].copy()
+        max_period = max(ma_periods)
+
+        tail = packed[-(max_period + max_days - 1):]
+        spread = ConvergenceEngine.spread_pct(ConvergenceEngine.moving_averages(tail, ma_periods))
+        return ConvergenceIndex._from_spread(spread, bars, last_close, max_period, max_days)
+
+    @classmethod
+    def build_many(
+        cls,
+        matrix: PriceMatrix,
+        period_sets: List[Tuple[int, ...]],
+        max_days: int
+    ) -> Dict[Tuple[int, ...], "ConvergenceIndex"]:
+        """
+        一次建立多組均線的索引
+
+        每個不同的均線週期只計算一次，各組合再由共用的均線組出糾結幅度，
+        成本隨不同週期的數量而非組合數量增加。
+
+        Returns:
+            {排序後的均線組合: ConvergenceIndex}
+        """
+        sets = list(dict.fromkeys(tuple(sorted(set(s))) for s in period_sets if s))
+        codes = list(matrix.codes)
+        close = matrix.close
+        if len(codes) == 0 or close.shape[0] == 0 or max_days <= 0:
+            return {s: cls(codes, *cls.compute(close, list(s), max_days)) for s in sets}
+
+        packed, _ = ConvergenceEngine.pack_to_end(close)
+        bars = (~np.isnan(packed)).sum(axis=0)
+        last_close = packed[-1].copy()
+
+        longest = max(max(s) for s in sets)
+        tail = packed[-(longest + max_days - 1):]
+        mas = {p: ConvergenceEngine.rolling_mean(tail, p) for p in sorted({p for s in sets for p in s})}
+
+        indexes = {}
+        for s in sets:
+            spread = ConvergenceEngine.spread_pct(np.stack([mas[p] for p in s]))
+            indexes[s] = cls(codes, *cls._from_spread(spread, bars, last_close, max(s), max_days))
+        return indexes
+
+    @staticmethod
+    def _from_spread(
+        spread: np.ndarray,
+        bars: np.ndarray,
+        last_close: np.ndarray,
+        max_period: int,
+        max_days: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """由最近幾天的糾結幅度 (時間 × 股票) 計算索引內容"""
+        n = spread.shape[1]
+        # 由最新一天往回排列，不足 max_days 的部分以 inf 補齊
+        recent = np.full((max_days, n), np.inf)
+        reversed_spread = spread[::-1][:max_days]
+        recent[:len(reversed_spread)] = np.where(np.isnan(reversed_spread), np.inf, reversed_spread)
+        window_max = np.maximum.accumulate(recent, axis=0)
+
+        days = np.arange(1, max_days + 1)[:, None]
+        window_max[bars[None, :] < max_period + days] = np.inf
+
+        current = np.where(np.isfinite(recent[0]), np.round(recent[0], 2), 0.0)
+        return window_max, current, last_close
+
+    def query(self, convergence_pct: float, convergence_days: int) -> np.ndarray:
+        """
+        取得符合條件的股票
+
+        Returns:
+            符合條件股票在 codes 中的位置 (依最近 d 天最大幅度由小到大)
+        """
+        if convergence_days <= 0 or convergence_days > self.max_days:
+            raise ValueError(f"convergence_days 需介於 1 與 {self.max_days}")
+        row = convergence_days - 1
+        count = np.searchsorted(self._sorted[row], convergence_pct, side="right")
+        matched = self._order[row, :count]
+        return matched[np.isfinite(self._sorted[row, :count])]
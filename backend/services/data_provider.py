@@ -0,0 +1,323 @@
+"""
+K 線資料來源 - 可替換的上游提供者
+
+StockDataService 與 MultiTimeframeService 只透過 DataProvider 取得 K 線：
+
+- YFinanceProvider: 預設，經由 yfinance 向 Yahoo Finance 抓取
+- ReplayProvider: 讀取事先錄下的 OHLCV (與 OHLCVStore 相同的 .npy 格式)，離線重播
+- SyntheticProvider: 以股票代碼為種子的隨機漫步，可產生任意大小的市場供壓力測試
+
+以環境變數 DATA_PROVIDER (yfinance / replay / synthetic) 選擇。
+所有方法皆為阻塞呼叫，應透過 FetchExecutor.run() 執行。
+"""
+import logging
+import os
+import zlib
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from .ohlcv_store import OHLCVStore, OHLCV_COLUMNS, TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+DATA_PROVIDER = os.environ.get("DATA_PROVIDER", "yfinance")
+DEFAULT_REPLAY_DIR = os.environ.get(
+    "REPLAY_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "replay")
+)
+SYNTHETIC_SEED = int(os.environ.get("SYNTHETIC_SEED", "0"))
+
+# 批次下載保留的欄位 (除權息欄位用來判斷是否需重抓完整歷史)
+BULK_COLUMNS = OHLCV_COLUMNS + ["Dividends", "Stock Splits"]
+
+TimeLike = Union[str, pd.Timestamp]
+
+
+def _timestamp(value: Optional[TimeLike]) -> Optional[pd.Timestamp]:
+    """轉為台北時間的 Timestamp (未帶時區者視為台北時間)"""
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    return ts.tz_localize(TIMEZONE) if ts.tz is None else ts.tz_convert(TIMEZONE)
+
+
+def _between(df: pd.DataFrame, start: Optional[TimeLike], end: Optional[TimeLike]) -> pd.DataFrame:
+    """截取 [start, end) 區間"""
+    start, end = _timestamp(start), _timestamp(end)
+    lo = df.index.searchsorted(start) if start is not None else 0
+    hi = df.index.searchsorted(end) if end is not None else len(df)
+    return df.iloc[lo:hi]
+
+
+class DataProvider:
+    """K 線資料來源介面"""
+
+    name = "base"
+
+    def history(
+        self,
+        symbol: str,
+        interval: str,
+        start: TimeLike,
+        end: Optional[TimeLike] = None
+    ) -> pd.DataFrame:
+        """
+        取得單一股票 [start, end) 的 K 線
+
+        Returns:
+            OHLCV DataFrame (可含 Dividends / Stock Splits)，沒有資料時為空 DataFrame
+        """
+        raise NotImplementedError
+
+    def download(
+        self,
+        symbols: List[str],
+        start: TimeLike,
+        actions: bool = False
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        批次取得多檔股票的日K
+
+        預設逐檔呼叫 history()；支援合併請求的來源應覆寫此方法。
+
+        Returns:
+            {代碼: DataFrame}，沒有資料的股票會被略過
+        """
+        frames = {}
+        for symbol in symbols:
+            df = self.history(symbol, "1d", start)
+            if df is not None and not df.empty:
+                frames[symbol] = df
+        return frames
+
+
+class YFinanceProvider(DataProvider):
+    """經由 yfinance 抓取 Yahoo Finance 資料"""
+
+    name = "yfinance"
+
+    def history(self, symbol, interval, start, end=None):
+        return yf.Ticker(symbol).history(start=start, end=end, interval=interval)
+
+    def download(self, symbols, start, actions=False):
+        wide = yf.download(
+            symbols,
+            start=start,
+            actions=actions,
+            group_by="ticker",
+            auto_adjust=True,
+            ignore_tz=False,
+            threads=False,
+            progress=False
+        )
+        if wide is None or wide.empty:
+            return {}
+        return split_bulk_frame(wide, symbols)
+
+
+class ReplayProvider(DataProvider):
+    """
+    重播事先錄下的 K 線
+
+    錄製目錄與 OHLCVStore 格式相同 (<root>/<interval>/<symbol>.npy)，
+    可直接複製既有的本地儲存，或以 RecordingProvider 錄製。
+    """
+
+    name = "replay"
+
+    def __init__(self, root: str = DEFAULT_REPLAY_DIR):
+        self.store = OHLCVStore(root)
+
+    def history(self, symbol, interval, start, end=None):
+        df = self.store.load(symbol, interval)
+        if df is None:
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+        return _between(df, start, end)
+
+
+class RecordingProvider(DataProvider):
+    """包裝另一個來源，並將取得的 K 線寫入錄製目錄供 ReplayProvider 重播"""
+
+    def __init__(self, inner: DataProvider, root: str = DEFAULT_REPLAY_DIR):
+        self.inner = inner
+        self.store = OHLCVStore(root)
+        self.name = f"recording:{inner.name}"
+
+    def history(self, symbol, interval, start, end=None):
+        df = self.inner.history(symbol, interval, start, end)
+        self._record(symbol, interval, df)
+        return df
+
+    def download(self, symbols, start, actions=False):
+        frames = self.inner.download(symbols, start, actions)
+        for symbol, df in frames.items():
+            self._record(symbol, "1d", df)
+        return frames
+
+    def _record(self, symbol: str, interval: str, df: Optional[pd.DataFrame]) -> None:
+        if df is None or df.empty:
+            return
+        existing = self.store.load(symbol, interval)
+        if existing is not None:
+            # 保留錄製範圍外的較早與較晚資料
+            df = pd.concat([
+                existing[existing.index < df.index[0]],
+                df[[c for c in OHLCV_COLUMNS if c in df.columns]],
+                existing[existing.index > df.index[-1]],
+            ])
+        self.store.save(symbol, interval, df)
+
+
+class SyntheticProvider(DataProvider):
+    """
+    以隨機漫步產生的合成 K 線
+
+    每個 (種子, 代碼, 週期) 的序列自固定起點 EPOCH 產生，不同的 start / end 只是截取同一序列，
+    因此增量更新與完整抓取的結果一致。日K 為週一至週五，分鐘 K 為 09:00-13:30 交易時段。
+    """
+
+    name = "synthetic"
+
+    EPOCH = pd.Timestamp("2015-01-01", tz=TIMEZONE)
+    SESSION_MINUTES = 270
+    INTRADAY_MINUTES = {"15m": 15, "30m": 30, "1h": 60}
+
+    def __init__(self, seed: int = SYNTHETIC_SEED, now: Optional[TimeLike] = None):
+        """
+        Args:
+            seed: 全域種子
+            now: 固定的「現在」時間 (預設為實際時間)，用於可重現的測試
+        """
+        self.seed = seed
+        self.now = _timestamp(now)
+
+    def history(self, symbol, interval, start, end=None):
+        now = self.now or pd.Timestamp.now(tz=TIMEZONE)
+        # 與其他資料來源相同，end 不含在內 ([start, end))；未指定時包含「現在」這根 K 棒
+        last = min(_timestamp(end), now) if end is not None else now
+
+        if interval in ("1wk", "1mo"):
+            # 週/月K 由同一份日K 合併，與本地合併的結果一致
+            from .tvdata_service import resample_bars
+            daily = self._series(symbol, "1d", last)
+            return _between(resample_bars(daily, interval), start, end)
+
+        return _between(self._series(symbol, interval, last), start, end)
+
+    def _series(self, symbol: str, interval: str, end: pd.Timestamp) -> pd.DataFrame:
+        """產生 EPOCH 至 end 的完整序列"""
+        days = pd.bdate_range(self.EPOCH, end.normalize(), tz=TIMEZONE)
+        minutes = self.INTRADAY_MINUTES.get(interval)
+        if minutes is None:
+            index = days
+            scale = 1.0
+        else:
+            offsets = pd.to_timedelta(np.arange(0, self.SESSION_MINUTES, minutes) + 9 * 60, unit="min")
+            stamps = (days.tz_localize(None).values[:, None] + offsets.values[None, :]).ravel()
+            index = pd.DatetimeIndex(stamps).tz_localize(TIMEZONE)
+            scale = np.sqrt(minutes / self.SESSION_MINUTES)
+        index = index[index <= end]
+
+        key = zlib.crc32(f"{self.seed}:{symbol}".encode())
+        profile = np.random.default_rng(key)
+        base = profile.uniform(10, 500)
+        vol = profile.uniform(0.005, 0.03) * scale
+
+        # 每個欄位各用一個亂數流，序列變長時既有的 K 棒不變
+        stream = zlib.crc32(interval.encode())
+        n = len(index)
+        returns = np.random.default_rng([key, stream, 0]).standard_normal(n) * vol
+        noise = np.abs(np.random.default_rng([key, stream, 1]).standard_normal((n, 2))).T * vol * 0.5
+        volume = np.round(np.random.default_rng([key, stream, 2]).lognormal(8, 1, n))
+
+        close = base * np.exp(np.cumsum(returns))
+        open_ = np.concatenate([[base], close[:-1]])
+        return pd.DataFrame({
+            "Open": open_,
+            "High": np.maximum(open_, close) * (1 + noise[0]),
+            "Low": np.minimum(open_, close) * (1 - noise[1]),
+            "Close": close,
+            "Volume": volume,
+        }, index=index)
+
+
+def synthetic_universe(n: int, seed: int = SYNTHETIC_SEED) -> List[Dict]:
+    """
+    產生 n 支合成股票的清單 (可用 SymbolRegistry.from_records 建立註冊表)
+
+    代碼為 5 碼數字，避免與真實股票混淆；上市與上櫃交錯。
+    """
+    rng = np.random.default_rng(seed)
+    industries = ["合成甲", "合成乙", "合成丙", "合成丁"]
+    return [
+        {
+            "code": f"{90000 + i}",
+            "name": f"合成{i}",
+            "market": "TW" if i % 2 == 0 else "TWO",
+            "industry": industries[int(rng.integers(len(industries)))],
+        }
+        for i in range(n)
+    ]
+
+
+def split_bulk_frame(wide: pd.DataFrame, symbols: List[str]) -> Dict[str, pd.DataFrame]:
+    """
+    將 yf.download(group_by="ticker") 的寬表拆成各股票的 OHLCV DataFrame
+
+    Args:
+        wide: 欄位為 (symbol, field) 的 MultiIndex DataFrame
+        symbols: 本次請求的 yfinance 代碼
+
+    Returns:
+        {yfinance 代碼: DataFrame}，整段無資料的股票會被略過
+    """
+    frames = {}
+
+    if not isinstance(wide.columns, pd.MultiIndex):
+        # 舊版 yfinance 單檔請求回傳單層欄位
+        if len(symbols) == 1:
+            wide = pd.concat({symbols[0]: wide}, axis=1)
+        else:
+            return frames
+
+    available = set(wide.columns.get_level_values(0))
+    for symbol in symbols:
+        if symbol not in available:
+            continue
+
+        df = wide[symbol]
+        df = df[[c for c in BULK_COLUMNS if c in df.columns]]
+        df = df.dropna(subset=["Close"]) if "Close" in df.columns else df.iloc[0:0]
+        if df.empty:
+            continue
+
+        df.columns.name = None
+        frames[symbol] = df
+
+    return frames
+
+
+def create_provider(name: str = DATA_PROVIDER) -> DataProvider:
+    """依名稱建立資料來源 (yfinance / replay / synthetic)"""
+    if name == "yfinance":
+        return YFinanceProvider()
+    if name == "replay":
+        return ReplayProvider()
+    if name == "synthetic":
+        return SyntheticProvider()
+    raise ValueError(f"Unknown data provider: {name}")
+
+
+# 單例模式
+_provider = None
+
+def get_data_provider() -> DataProvider:
+    """取得 DATA_PROVIDER 指定的資料來源單例"""
+    global _provider
+    if _provider is None:
+        _provider = create_provider()
+        logger.info(f"資料來源: {_provider.name}")
+    return _provider
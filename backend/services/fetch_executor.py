@@ -0,0 +1,249 @@
+"""
+抓取執行器 - 將 yfinance 等阻塞 I/O 移出事件迴圈
+
+所有對外部資料源的同步呼叫都應透過 FetchExecutor.run() 執行，
+讓事件迴圈在等待網路時仍能處理其他請求 (如健康檢查)。
+設定 FetchScheduler 時，送出前先依優先通道、速率與並行上限取得名額。
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .fetch_scheduler import DeadlineExceeded, FetchScheduler
+from .metrics import fetch_timer
+
+logger = logging.getLogger(__name__)
+
+# 執行緒池大小與單次抓取逾時 (秒)，可由環境變數調整
+DEFAULT_MAX_WORKERS = int(os.environ.get("FETCH_MAX_WORKERS", "16"))
+DEFAULT_TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", "30"))
+
+# 每個請求的截止時間 (time.monotonic() 絕對值)，None 代表不限
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "fetch_deadline", default=None
+)
+
+
+@contextmanager
+def fetch_deadline(seconds: Optional[float]):
+    """
+    設定目前請求的抓取截止時間
+
+    在此區塊內 (包含其建立的 asyncio task) 的所有 FetchExecutor.run()
+    都不會等待超過截止時間；巢狀設定時取較早者。
+    """
+    if seconds is None:
+        yield
+        return
+
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline() -> Optional[float]:
+    """目前請求的截止時間 (time.monotonic() 絕對值)，None 代表不限"""
+    return _deadline.get()
+
+
+def set_deadline(deadline: Optional[float]) -> None:
+    """
+    直接設定目前 context 的截止時間
+
+    一般請求應使用 fetch_deadline()；此函式供 SingleFlight 調整共用工作所屬的 context。
+    """
+    _deadline.set(deadline)
+
+
+class FetchExecutor:
+    """有界的 I/O 執行緒池，附帶佇列與執行中數量統計"""
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        default_timeout: float = DEFAULT_TIMEOUT,
+        scheduler: Optional[FetchScheduler] = None
+    ):
+        """
+        Args:
+            scheduler: 上游抓取排程器，None 代表不限速、不排優先順序
+        """
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self.scheduler = scheduler
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="fetch"
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._cancelled = 0
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        timeout: Optional[float] = None,
+        fetch_labels: Optional[Tuple[str, str]] = None,
+        **kwargs
+    ) -> Any:
+        """
+        在執行緒池中執行阻塞函式
+
+        Args:
+            fn: 阻塞函式 (如 ticker.history)
+            timeout: 單次逾時秒數，預設使用 default_timeout (包含在排程器中等待名額的時間)；
+                     實際等待時間不會超過 fetch_deadline() 設定的截止時間
+            fetch_labels: (資料來源, 週期)，指定時以 fetch_timer() 記錄上游延遲；
+                          只計入取得排程名額之後的抓取時間，不含排隊等待
+
+        Raises:
+            asyncio.TimeoutError: 超過單次逾時
+            DeadlineExceeded: 超過請求截止時間 (asyncio.TimeoutError 的子類別)；
+                              排程器不視為上游失敗，不會降低並行上限
+            asyncio.CancelledError: 呼叫端被取消 (如客戶端斷線)
+        """
+        budget = self.default_timeout if timeout is None else timeout
+        timeout = self._effective_timeout(timeout)
+        # 截止時間比單次逾時更早：此時的逾時是請求本身的時間用完
+        by_deadline = timeout < budget
+        if timeout <= 0:
+            with self._lock:
+                self._timed_out += 1
+            raise DeadlineExceeded("fetch deadline exceeded")
+
+        if self.scheduler is None:
+            return await self._submit(fn, args, kwargs, timeout, fetch_labels)
+
+        started = time.monotonic()
+        try:
+            ticket = await self.scheduler.acquire(timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            logger.warning(f"Fetch {getattr(fn, '__name__', fn)} timed out waiting for a slot")
+            raise
+
+        try:
+            result = await self._submit(
+                fn, args, kwargs, timeout - (time.monotonic() - started), fetch_labels
+            )
+        except asyncio.TimeoutError as e:
+            if not by_deadline:
+                self.scheduler.release(ticket, e)
+                raise
+            error = DeadlineExceeded("fetch deadline exceeded")
+            self.scheduler.release(ticket, error)
+            raise error from e
+        except BaseException as e:
+            self.scheduler.release(ticket, e)
+            raise
+        self.scheduler.release(ticket)
+        return result
+
+    async def _submit(
+        self,
+        fn: Callable[..., Any],
+        args,
+        kwargs,
+        timeout: float,
+        fetch_labels: Optional[Tuple[str, str]] = None
+    ) -> Any:
+        """送入執行緒池並等待結果"""
+        if timeout <= 0:
+            with self._lock:
+                self._timed_out += 1
+            raise asyncio.TimeoutError("fetch deadline exceeded")
+
+        def call():
+            with self._lock:
+                self._queued -= 1
+                self._in_flight += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+        with self._lock:
+            self._queued += 1
+            self._submitted += 1
+
+        future = self._executor.submit(call)
+        future.add_done_callback(self._on_done)
+
+        try:
+            with fetch_timer(*fetch_labels) if fetch_labels else nullcontext():
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            logger.warning(f"Fetch {getattr(fn, '__name__', fn)} timed out after {timeout:.1f}s")
+            raise
+
+    def _effective_timeout(self, timeout: Optional[float]) -> float:
+        """合併單次逾時與請求截止時間"""
+        timeout = self.default_timeout if timeout is None else timeout
+        deadline = _deadline.get()
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        return timeout
+
+    def _on_done(self, future) -> None:
+        """統計完成狀態；尚未開始即被取消的工作要從佇列數扣除"""
+        with self._lock:
+            if future.cancelled():
+                self._queued -= 1
+                self._cancelled += 1
+            elif future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    def stats(self) -> Dict:
+        """取得執行器統計數據"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "default_timeout": self.default_timeout,
+                "queue_depth": self._queued,
+                "in_flight": self._in_flight,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "timed_out": self._timed_out,
+                "cancelled": self._cancelled,
+            }
+
+    def shutdown(self) -> None:
+        """關閉執行緒池並取消尚未開始的工作"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 單例模式
+_executor = None
+
+def get_fetch_executor() -> FetchExecutor:
+    """取得 FetchExecutor 單例 (附帶上游抓取排程器)"""
+    global _executor
+    if _executor is None:
+        _executor = FetchExecutor(scheduler=FetchScheduler(max_concurrency=DEFAULT_MAX_WORKERS))
+    return _executor
@@ -0,0 +1,341 @@
+"""
+抓取排程器 - 控制對上游 (Yahoo) 的請求速率、並行數與優先順序
+
+全市場篩選會在短時間內送出大量抓取，容易被上游限流；
+同時使用者點開個股 K 線時不應排在上百個篩選抓取之後。
+
+- 令牌桶: 限制每秒送出的請求數 (FETCH_RATE)，允許 FETCH_BURST 的短暫突發
+- AIMD 並行數: 上游逾時或被限流 (429) 時並行上限減半，延遲正常時每輪加一；
+  請求自身的截止時間到期 (DeadlineExceeded)、取消與其他錯誤不影響並行上限
+- 優先通道: interactive (個股 K 線等使用者操作) 一律先於 background (篩選、快照) 取得名額，
+  並保留 FETCH_INTERACTIVE_RESERVE 個並行名額只給 interactive 使用
+
+以 fetch_priority() 設定目前請求的通道 (與 fetch_deadline() 相同，以 contextvar 傳遞到子任務)，
+FetchExecutor.run() 在送出前向排程器取得名額。已送出的抓取不會被中斷，
+優先權只決定下一個名額給誰。
+
+容量估算：上游請求數受 FETCH_RATE 限制。預設每秒 5 個請求時，日K 以 BULK_CHUNK_SIZE (50)
+檔一批下載，全市場約 1,800 檔只需約 36 個請求 (不到 10 秒)；分鐘 K 逐檔抓取，
+冷啟動的全市場掃描需約 1,800 / 5 = 360 秒，超過 SCREEN_DEADLINE (預設 120 秒)。
+此時串流篩選會先送出已載入部分的結果，截止後未完成的股票計為錯誤；
+全市場分鐘 K 應以快照排程 (截止時間為 SNAPSHOT_DEADLINE，預設 600 秒) 預先載入，
+或依上游允許的速率調高 FETCH_RATE / SCREEN_DEADLINE。
+"""
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from .metrics import FETCH_QUEUE_SECONDS
+
+# 通道 (依優先順序排列)
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+LANES = (INTERACTIVE, BACKGROUND)
+
+# 每秒請求數與突發量 (FETCH_RATE=0 代表不限速)
+FETCH_RATE = float(os.environ.get("FETCH_RATE", "5"))
+FETCH_BURST = float(os.environ.get("FETCH_BURST", "10"))
+# 並行上限的初始值與下限 (上限為 FetchExecutor 的執行緒數)
+FETCH_INITIAL_CONCURRENCY = int(os.environ.get("FETCH_INITIAL_CONCURRENCY", "4"))
+FETCH_MIN_CONCURRENCY = int(os.environ.get("FETCH_MIN_CONCURRENCY", "1"))
+# 延遲低於此值 (秒) 才提高並行上限
+FETCH_LATENCY_TARGET = float(os.environ.get("FETCH_LATENCY_TARGET", "2.0"))
+# 只給 interactive 使用的並行名額
+FETCH_INTERACTIVE_RESERVE = int(os.environ.get("FETCH_INTERACTIVE_RESERVE", "2"))
+
+# 目前請求的通道；未設定時視為 interactive (使用者直接觸發的單筆抓取)
+_lane: contextvars.ContextVar[str] = contextvars.ContextVar("fetch_lane", default=INTERACTIVE)
+
+
+@contextmanager
+def fetch_priority(lane: str):
+    """
+    設定目前請求的抓取通道
+
+    在此區塊內 (包含其建立的 asyncio task) 的所有 FetchExecutor.run() 都使用此通道。
+    """
+    if lane not in LANES:
+        raise ValueError(f"Unknown fetch lane: {lane}")
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+def set_lane(lane: str) -> None:
+    """
+    直接設定目前 context 的通道
+
+    一般請求應使用 fetch_priority()；此函式供 SingleFlight 調整共用工作所屬的 context。
+    """
+    if lane not in LANES:
+        raise ValueError(f"Unknown fetch lane: {lane}")
+    _lane.set(lane)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """請求的截止時間 (fetch_deadline()) 到期；是請求本身的時間用完，不代表上游變慢"""
+
+
+def is_throttled(error: BaseException) -> bool:
+    """判斷例外是否為上游限流 (HTTP 429 / yfinance YFRateLimitError)"""
+    for obj in (error, getattr(error, "response", None)):
+        if getattr(obj, "status_code", None) == 429 or getattr(obj, "status", None) == 429:
+            return True
+    if "RateLimit" in type(error).__name__:
+        return True
+    message = str(error)
+    return "429" in message or "Too Many Requests" in message
+
+
+class TokenBucket:
+    """令牌桶；rate <= 0 代表不限速"""
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self) -> bool:
+        """有令牌時取用一個並回傳 True"""
+        if self.rate <= 0:
+            return True
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def delay(self) -> float:
+        """距離下一個令牌的秒數"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def drain(self) -> None:
+        """清空令牌 (被限流時暫停一段時間)"""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+
+    @property
+    def tokens(self) -> float:
+        if self.rate <= 0:
+            return float("inf")
+        self._refill()
+        return self._tokens
+
+
+class AIMDLimit:
+    """
+    加法增加、乘法減少的並行上限
+
+    成功且延遲低於目標時每完成「目前上限」個請求加一；
+    失敗時減半，同一個延遲目標時間內只減一次，避免同一批失敗讓上限連續減半。
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        latency_target: float,
+        backoff: float = 0.5,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self._clock = clock
+        self._value = float(min(max(initial, self.minimum), self.maximum))
+        self._last_decrease = None
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._value)
+
+    def on_success(self, latency: float) -> None:
+        if latency <= self.latency_target:
+            self._value = min(self.maximum, self._value + 1 / self._value)
+
+    def on_failure(self) -> None:
+        now = self._clock()
+        if self._last_decrease is not None and now - self._last_decrease < self.latency_target:
+            return
+        self._last_decrease = now
+        self._value = max(self.minimum, self._value * self.backoff)
+        self.decreases += 1
+
+
+# (通道, 取得名額的時間)
+Ticket = Tuple[str, float]
+
+
+class FetchScheduler:
+    """依通道優先順序分配上游抓取名額"""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        rate: float = FETCH_RATE,
+        burst: float = FETCH_BURST,
+        initial_concurrency: int = FETCH_INITIAL_CONCURRENCY,
+        min_concurrency: int = FETCH_MIN_CONCURRENCY,
+        latency_target: float = FETCH_LATENCY_TARGET,
+        interactive_reserve: int = FETCH_INTERACTIVE_RESERVE,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.concurrency = AIMDLimit(
+            initial_concurrency, min_concurrency, max_concurrency, latency_target, clock=clock
+        )
+        self.interactive_reserve = interactive_reserve
+        self._clock = clock
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._active: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._granted: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._errors = 0
+        self._throttled = 0
+
+    async def acquire(self, timeout: Optional[float] = None, lane: Optional[str] = None) -> Ticket:
+        """
+        等待一個抓取名額
+
+        Args:
+            timeout: 最多等待秒數
+            lane: 通道，預設使用 fetch_priority() 設定的通道
+
+        Raises:
+            asyncio.TimeoutError: 超過等待時間仍未取得名額
+        """
+        lane = lane or current_lane()
+        waiter = asyncio.get_running_loop().create_future()
+        queued = self._clock()
+        self._waiters[lane].append(waiter)
+        self._dispatch()
+
+        try:
+            if not waiter.done():
+                await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # 已分配名額但呼叫端放棄 (逾時或取消)，歸還名額
+                self._finish(lane)
+            else:
+                waiter.cancel()
+                self._remove(lane, waiter)
+            raise
+
+        FETCH_QUEUE_SECONDS.observe(self._clock() - queued, lane=lane)
+        return lane, self._clock()
+
+    def release(self, ticket: Ticket, error: Optional[BaseException] = None) -> None:
+        """
+        歸還名額並依結果調整並行上限
+
+        取消與截止時間到期 (DeadlineExceeded) 不視為成功或失敗；
+        只有上游逾時與限流會降低並行上限 (限流時另清空令牌)，其他例外只計入錯誤數。
+        """
+        lane, started = ticket
+        if error is None:
+            self.concurrency.on_success(self._clock() - started)
+        elif not isinstance(error, (asyncio.CancelledError, DeadlineExceeded)):
+            self._errors += 1
+            if is_throttled(error):
+                self._throttled += 1
+                self.bucket.drain()
+                self.concurrency.on_failure()
+            elif isinstance(error, asyncio.TimeoutError):
+                self.concurrency.on_failure()
+        self._finish(lane)
+
+    def _finish(self, lane: str) -> None:
+        self._active[lane] -= 1
+        self._dispatch()
+
+    def _remove(self, lane: str, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters[lane].remove(waiter)
+        except ValueError:
+            pass
+
+    def _capacity(self, lane: str) -> bool:
+        """目前是否還能分配 lane 的名額"""
+        active = sum(self._active.values())
+        limit = self.concurrency.limit
+        if lane == BACKGROUND:
+            limit = max(1, limit - self.interactive_reserve)
+        return active < limit
+
+    def _next_lane(self) -> Optional[str]:
+        """依優先順序找出下一個可分配名額的通道；高優先通道等待中時低優先通道不插隊"""
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            while waiters and waiters[0].done():
+                waiters.popleft()
+            if waiters:
+                return lane if self._capacity(lane) else None
+        return None
+
+    def _dispatch(self) -> None:
+        """依優先順序與令牌分配名額；令牌不足時排定下一次分配"""
+        while True:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            if not self.bucket.try_take():
+                self._schedule(self.bucket.delay())
+                return
+            waiter = self._waiters[lane].popleft()
+            self._active[lane] += 1
+            self._granted[lane] += 1
+            waiter.set_result(None)
+
+    def _schedule(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        if self._timer is not None and self._timer_loop is loop and not self._timer.cancelled():
+            return
+
+        def fire():
+            self._timer = None
+            self._dispatch()
+
+        self._timer = loop.call_later(delay, fire)
+        self._timer_loop = loop
+
+    def stats(self) -> Dict:
+        """取得排程器統計數據"""
+        return {
+            "limit": self.concurrency.limit,
+            "max_limit": self.concurrency.maximum,
+            "rate": self.bucket.rate,
+            "tokens": round(self.bucket.tokens, 2),
+            "in_flight": sum(self._active.values()),
+            "waiting_interactive": len(self._waiters[INTERACTIVE]),
+            "waiting_background": len(self._waiters[BACKGROUND]),
+            "granted_interactive": self._granted[INTERACTIVE],
+            "granted_background": self._granted[BACKGROUND],
+            "errors": self._errors,
+            "throttled": self._throttled,
+            "backoffs": self.concurrency.decreases,
+        }
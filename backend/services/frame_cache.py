@@ -0,0 +1,193 @@
+"""
+有界 LRU / TTL 快取 - 以 DataFrame 實際記憶體用量計算容量
+
+取代各服務各自持有、永不淘汰的 dict 快取。
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Hashable, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 快取容量上限 (bytes)，可由環境變數調整
+DEFAULT_MAX_BYTES = int(os.environ.get("FRAME_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# 各週期資料的有效時間：分鐘 K 變動頻繁，日K 以上較長
+INTERVAL_TTLS = {
+    "15m": timedelta(minutes=5),
+    "30m": timedelta(minutes=5),
+    "1h": timedelta(minutes=5),
+    "4h": timedelta(minutes=5),
+    "1d": timedelta(minutes=30),
+    "1wk": timedelta(minutes=30),
+    "1mo": timedelta(minutes=30),
+}
+DEFAULT_TTL = timedelta(minutes=30)
+
+
+def estimate_size(value: Any) -> int:
+    """估算快取值佔用的記憶體 (bytes)"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(index=True, deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class _Entry:
+    __slots__ = ("value", "size", "interval", "created", "expires")
+
+    def __init__(self, value: Any, size: int, interval: Optional[str], ttl: timedelta):
+        self.value = value
+        self.size = size
+        self.interval = interval
+        self.created = time.monotonic()
+        self.expires = self.created + ttl.total_seconds()
+
+
+class FrameCache:
+    """以位元組數為上限的 LRU 快取，每筆資料依週期設定有效時間"""
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttls: Optional[Dict[str, timedelta]] = None,
+        default_ttl: timedelta = DEFAULT_TTL
+    ):
+        self.max_bytes = max_bytes
+        self.ttls = dict(INTERVAL_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._rejected = 0
+
+    def ttl(self, interval: Optional[str]) -> timedelta:
+        """取得週期對應的有效時間"""
+        return self.ttls.get(interval, self.default_ttl)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """取得快取值，過期或不存在時回傳 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            if time.monotonic() >= entry.expires:
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry.value
+
+    def set(self, key: Hashable, value: Any, interval: Optional[str] = None) -> None:
+        """
+        寫入快取，超過容量時淘汰最久未使用的資料
+
+        單筆大於總容量的資料不會被快取。
+        """
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            if size > self.max_bytes:
+                self._rejected += 1
+                logger.warning(f"Cache entry {key} ({size} bytes) exceeds budget, not cached")
+                return
+
+            self._entries[key] = _Entry(value, size, interval, self.ttl(interval))
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def clear(self, namespace: Optional[str] = None) -> int:
+        """
+        清除快取
+
+        Args:
+            namespace: 只清除 key[0] 等於此值的資料 (如 "bars")，None 代表全部
+
+        Returns:
+            清除的筆數
+        """
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if namespace is None or (isinstance(key, tuple) and key and key[0] == namespace)
+            ]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def stats(self) -> Dict:
+        """取得快取統計數據"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            by_interval: Dict[str, Dict] = {}
+            for entry in self._entries.values():
+                bucket = by_interval.setdefault(entry.interval or "-", {"entries": 0, "bytes": 0})
+                bucket["entries"] += 1
+                bucket["bytes"] += entry.size
+
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "rejected": self._rejected,
+                "by_interval": by_interval,
+            }
+
+    def entries(self) -> List[Dict]:
+        """列出所有快取項目 (由最久未使用到最近使用)"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": [str(part) for part in key] if isinstance(key, tuple) else str(key),
+                    "interval": entry.interval,
+                    "bytes": entry.size,
+                    "age_seconds": round(now - entry.created, 1),
+                    "ttl_remaining_seconds": round(max(entry.expires - now, 0.0), 1),
+                }
+                for key, entry in self._entries.items()
+            ]
+
+
+# 單例模式
+_cache = None
+
+def get_frame_cache() -> FrameCache:
+    """取得 FrameCache 單例"""
+    global _cache
+    if _cache is None:
+        _cache = FrameCache()
+    return _cache
@@ -0,0 +1,244 @@
+"""
+標準歷史快取 - 每個 (股票, 週期) 只保留一份最長的歷史
+
+任何較短的區間都由這份歷史切片取得 (不複製資料)，
+較長的區間則只補抓缺少的較早資料，讓篩選與 K 線圖共用同一份下載。
+"""
+import logging
+from datetime import datetime
+from typing import Optional, Tuple
+
+import pandas as pd
+
+from .data_provider import DataProvider, get_data_provider
+from .fetch_executor import FetchExecutor
+from .frame_cache import FrameCache
+from .ohlcv_store import OHLCVStore, has_corporate_actions, OHLCV_COLUMNS, TIMEZONE
+from .single_flight import SingleFlight, get_single_flight
+from .worker_coordinator import WorkerCoordinator, get_worker_coordinator
+
+logger = logging.getLogger(__name__)
+
+# yfinance 分鐘 K 可回溯的天數上限
+INTRADAY_LIMIT_DAYS = {
+    "15m": 59,
+    "30m": 59,
+    "1h": 720,
+}
+
+
+class HistoryCache:
+    """以 (yfinance 代碼, 週期) 為鍵的標準歷史，依序查詢記憶體快取、本地儲存、網路"""
+
+    def __init__(
+        self,
+        executor: FetchExecutor,
+        store: OHLCVStore,
+        cache: FrameCache,
+        flight: Optional[SingleFlight] = None,
+        coordinator: Optional[WorkerCoordinator] = None,
+        provider: Optional[DataProvider] = None
+    ):
+        self.executor = executor
+        self.store = store
+        self.cache = cache
+        self.flight = flight or get_single_flight()
+        self.coordinator = coordinator or get_worker_coordinator()
+        self.provider = provider or get_data_provider()
+
+    async def get_bars(
+        self,
+        symbol: str,
+        interval: str,
+        start: pd.Timestamp
+    ) -> Optional[pd.DataFrame]:
+        """
+        取得 start 之後的 K 線
+
+        Args:
+            symbol: yfinance 代碼 (如 2330.TW)
+            interval: yfinance 週期 (15m, 30m, 1h, 1d, 1wk, 1mo)
+            start: 需要的最早時間 (台北時間)
+
+        Returns:
+            標準歷史的切片，沒有資料時回傳 None
+        """
+        cached = self.cached(symbol, interval, start)
+        if cached is not None:
+            return cached
+
+        # 相同 (股票, 週期, 區間) 的並行請求共用同一次載入
+        df = await self.flight.do(
+            ("bars", symbol, interval, start),
+            lambda: self._load_and_put(symbol, interval, start)
+        )
+        if df is None:
+            return None
+        return self._slice(df, start)
+
+    async def _load_and_put(
+        self,
+        symbol: str,
+        interval: str,
+        start: pd.Timestamp
+    ) -> Optional[pd.DataFrame]:
+        """載入完整歷史並寫入快取"""
+        # 其他 worker 正在抓取同一檔時等待，取得鎖後 _load 會先讀到剛更新的本地儲存
+        async with self.coordinator.symbol_lock(symbol, interval):
+            df, coverage = await self._load(symbol, interval, start)
+        if df is None or df.empty:
+            return None
+
+        self.put(symbol, interval, df, coverage)
+        return df
+
+    def cached(
+        self,
+        symbol: str,
+        interval: str,
+        start: pd.Timestamp
+    ) -> Optional[pd.DataFrame]:
+        """只查詢記憶體快取；快取不存在或未涵蓋 start 時回傳 None"""
+        entry = self.cache.get(("bars", symbol, interval))
+        if entry is None:
+            return None
+
+        df, coverage = entry
+        if coverage > start:
+            return None
+        return self._slice(df, start)
+
+    def put(
+        self,
+        symbol: str,
+        interval: str,
+        df: pd.DataFrame,
+        coverage: Optional[pd.Timestamp] = None
+    ) -> None:
+        """寫入標準歷史 (coverage 為這份歷史請求涵蓋的起始時間)"""
+        if coverage is None:
+            coverage = df.index[0]
+        self.cache.set(("bars", symbol, interval), (df, coverage), interval=interval)
+
+    @staticmethod
+    def _slice(df: pd.DataFrame, start: pd.Timestamp) -> pd.DataFrame:
+        """截取 start 之後的資料 (不複製)"""
+        return df.iloc[df.index.searchsorted(start):]
+
+    async def _load(
+        self,
+        symbol: str,
+        interval: str,
+        start: pd.Timestamp
+    ) -> Tuple[Optional[pd.DataFrame], Optional[pd.Timestamp]]:
+        """
+        由本地儲存或網路載入完整歷史
+
+        Returns:
+            (完整歷史, 涵蓋起始時間)
+        """
+        stored, fresh = self.store.load_covering(symbol, interval, start, self.cache.ttl(interval))
+
+        if stored is None:
+            # 本地資料起始太晚：只補抓較早的區間
+            stored = await self._extend(symbol, interval, start)
+            fresh = stored is not None and self._is_fresh(symbol, interval)
+
+        if stored is not None and not fresh:
+            stored = await self.refresh(symbol, interval, stored)
+
+        if stored is not None:
+            return stored, self.store.coverage_start(symbol, interval)
+
+        logger.info(f"Fetching {symbol} with interval {interval}")
+        return await self._fetch_full(symbol, interval, start)
+
+    async def _fetch(
+        self,
+        symbol: str,
+        interval: str,
+        start: pd.Timestamp,
+        end: Optional[pd.Timestamp] = None
+    ) -> pd.DataFrame:
+        """經由抓取執行器向資料來源取得 [start, end) 的 K 線，並記錄上游延遲"""
+        return await self.executor.run(
+            self.provider.history, symbol, interval, start, end,
+            fetch_labels=(self.provider.name, interval)
+        )
+
+    def _is_fresh(self, symbol: str, interval: str) -> bool:
+        updated = self.store.updated_at(symbol, interval)
+        return updated is not None and datetime.now() - updated < self.cache.ttl(interval)
+
+    async def refresh(
+        self,
+        symbol: str,
+        interval: str,
+        stored: pd.DataFrame
+    ) -> Optional[pd.DataFrame]:
+        """
+        只抓取最後一根 K 棒 (含) 之後的資料並附加到本地儲存
+
+        超出分鐘 K 可回溯範圍或遇到除權息時回傳 None，由呼叫端重抓完整區間；
+        網路錯誤時沿用舊資料。
+        """
+        last = stored.index[-1]
+        limit = INTRADAY_LIMIT_DAYS.get(interval)
+        if limit is not None and last < pd.Timestamp.now(tz=TIMEZONE) - pd.Timedelta(days=limit):
+            return None
+
+        try:
+            new = await self._fetch(symbol, interval, last)
+        except Exception as e:
+            logger.warning(f"Incremental update failed for {symbol} {interval}, using stored data: {e}")
+            return stored
+
+        new = new[new.index >= last]
+        if has_corporate_actions(new[new.index > last]):
+            logger.info(f"{symbol} 有除權息，重新抓取完整歷史")
+            return None
+
+        return self.store.append(symbol, interval, new)
+
+    async def _extend(
+        self,
+        symbol: str,
+        interval: str,
+        start: pd.Timestamp
+    ) -> Optional[pd.DataFrame]:
+        """補抓本地歷史第一根 K 棒之前的資料；本地沒有資料時回傳 None"""
+        stored = self.store.load(symbol, interval)
+        if stored is None:
+            return None
+
+        try:
+            older = await self._fetch(symbol, interval, start, stored.index[0])
+        except Exception as e:
+            logger.warning(f"Extending {symbol} {interval} failed: {e}")
+            return None
+
+        if older is not None and not older.empty:
+            older = older[older.index < stored.index[0]]
+            stored = pd.concat([older[[c for c in OHLCV_COLUMNS if c in older.columns]], stored])
+
+        self.store.save(symbol, interval, stored, coverage_start=start)
+        return self.store.load(symbol, interval)
+
+    async def _fetch_full(
+        self,
+        symbol: str,
+        interval: str,
+        start: pd.Timestamp
+    ) -> Tuple[Optional[pd.DataFrame], Optional[pd.Timestamp]]:
+        """抓取自 start 起的完整 K 線並覆寫本地儲存"""
+        # 已儲存的歷史可能比這次請求更長 (如除權息後重抓)，保留較長的區間
+        coverage = self.store.coverage_start(symbol, interval)
+        if interval not in INTRADAY_LIMIT_DAYS and coverage is not None and coverage < start:
+            start = coverage
+
+        df = await self._fetch(symbol, interval, start)
+        if df is None or df.empty:
+            return None, None
+
+        self.store.save(symbol, interval, df, coverage_start=start)
+        return self.store.load(symbol, interval), start
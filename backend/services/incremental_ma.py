@@ -0,0 +1,273 @@
+"""
+增量均線糾結狀態 - 每根新 K 棒以常數時間更新
+
+每個 (股票, 週期, 均線組合, 糾結天數) 保留最長均線所需的收盤價環形緩衝、
+各均線的累積和，以及最近 N 天的糾結幅度。新增 K 棒時只加入新值並扣除離開視窗的值；
+盤中更新最後一根 K 棒時只調整差額，不需重算整段 rolling()。
+
+缺值 (NaN) 的收盤價與 MACalculator 相同處理：rolling() 視窗內有缺值的均線為 NaN，
+該列由 dropna() 略過；因此缺值會清空視窗，重新累積最長週期根數後才再有糾結幅度。
+"""
+import math
+import os
+from collections import OrderedDict, deque
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 最多保留的增量狀態數量 (每個狀態只有數百個 float)
+INDICATOR_CACHE_SIZE = int(os.environ.get("INDICATOR_CACHE_SIZE", "20000"))
+
+# 每更新幾次就以環形緩衝重算一次累積和，避免浮點誤差累積
+RESYNC_INTERVAL = 1000
+
+
+def _same_close(a: Optional[float], b: Optional[float]) -> bool:
+    """比較收盤價，兩者皆為 NaN 時視為相同"""
+    if a is None or b is None:
+        return a is b
+    return a == b or (math.isnan(a) and math.isnan(b))
+
+
+class IncrementalConvergence:
+    """單一序列的增量均線與糾結幅度"""
+
+    def __init__(self, ma_periods: List[int], convergence_days: int):
+        if not ma_periods or min(ma_periods) <= 0:
+            raise ValueError("均線週期必須為正整數")
+        self.ma_periods = sorted(set(ma_periods))
+        self.convergence_days = max(convergence_days, 0)
+        self.max_period = self.ma_periods[-1]
+        self.reset()
+
+    def reset(self, bars: int = 0) -> None:
+        """清空狀態；bars 為已略過 (不需要) 的較早 K 棒數量"""
+        self._ring = [0.0] * self.max_period
+        self._pos = 0
+        self._filled = 0
+        self._sums = {p: 0.0 for p in self.ma_periods}
+        # 最近 N 個均線皆有值的列 (對應 check_convergence 的 dropna() 結果) 的糾結幅度
+        self._spreads: deque = deque(maxlen=max(self.convergence_days, 1))
+        self._updates = 0
+        self.bars = bars
+        self.last_time: Optional[pd.Timestamp] = None
+        self.last_close: Optional[float] = None
+        self.prev_close: Optional[float] = None
+
+    def ma(self, period: int) -> Optional[float]:
+        """目前的均線值，K 棒不足時回傳 None"""
+        if period not in self._sums or self._filled < period:
+            return None
+        return self._sums[period] / period
+
+    @property
+    def spread(self) -> Optional[float]:
+        """目前的糾結幅度百分比"""
+        return self._spreads[-1] if self._spreads else None
+
+    def update(self, time: pd.Timestamp, close: float) -> None:
+        """
+        加入一根 K 棒
+
+        time 與最後一根相同時視為盤中更新 (取代最後一根)，較早的時間會引發 ValueError；
+        盤中更新在缺值與有值之間改變時無法只調整差額，同樣引發 ValueError (需以 load() 重建)。
+        """
+        if self.last_time is not None and time < self.last_time:
+            raise ValueError(f"K 棒時間倒退: {time} < {self.last_time}")
+
+        if self.last_time is not None and time == self.last_time:
+            self._replace_last(close)
+        else:
+            self._append(close)
+            self.last_time = time
+
+        self._updates += 1
+        if self._updates % RESYNC_INTERVAL == 0:
+            self._resync()
+
+    def _append(self, close: float) -> None:
+        self.prev_close = self.last_close
+        self.last_close = close
+        self.bars += 1
+        if math.isnan(close):
+            # 視窗內有缺值：所有均線都要重新累積
+            self._pos = 0
+            self._filled = 0
+            self._sums = {p: 0.0 for p in self.ma_periods}
+            return
+
+        for p in self.ma_periods:
+            self._sums[p] += close
+            if self._filled >= p:
+                self._sums[p] -= self._ring[(self._pos - p) % self.max_period]
+        self._ring[self._pos] = close
+        self._pos = (self._pos + 1) % self.max_period
+        self._filled = min(self._filled + 1, self.max_period)
+        if self._filled >= self.max_period:
+            self._spreads.append(self._current_spread())
+
+    def _replace_last(self, close: float) -> None:
+        if math.isnan(close) or math.isnan(self.last_close):
+            if _same_close(close, self.last_close):
+                return
+            raise ValueError("盤中更新在缺值與有值之間改變，需重建狀態")
+        self.last_close = close
+        last = (self._pos - 1) % self.max_period
+        delta = close - self._ring[last]
+        self._ring[last] = close
+        for p in self.ma_periods:
+            self._sums[p] += delta
+        if self._filled >= self.max_period:
+            self._spreads[-1] = self._current_spread()
+
+    def _current_spread(self) -> Optional[float]:
+        if self._filled < self.max_period:
+            return None
+        values = [self._sums[p] / p for p in self.ma_periods]
+        ma_min = min(values)
+        if ma_min == 0:
+            return None
+        return (max(values) - ma_min) / ma_min * 100
+
+    def _resync(self) -> None:
+        """由環形緩衝重新計算累積和"""
+        for p in self.ma_periods:
+            if self._filled >= p:
+                self._sums[p] = math.fsum(
+                    self._ring[(self._pos - k) % self.max_period] for k in range(1, p + 1)
+                )
+
+    def check(self, convergence_pct: float) -> Tuple[bool, float]:
+        """
+        檢查是否符合均線糾結條件 (與 MACalculator.check_convergence 相同規則)
+
+        Returns:
+            (是否符合條件, 當前糾結幅度百分比)
+        """
+        if self.convergence_days <= 0 or self.bars < self.max_period + self.convergence_days:
+            return False, 0.0
+        if len(self._spreads) < self.convergence_days or any(s is None for s in self._spreads):
+            return False, 0.0
+        return max(self._spreads) <= convergence_pct, round(self._spreads[-1], 2)
+
+    def load(self, df: pd.DataFrame) -> None:
+        """
+        以 DataFrame 重建狀態
+
+        只需最後 max_period + days - 1 根即可得到最近 days 天的均線與糾結幅度，
+        較早的 K 棒只計入數量；其中有缺值時往前多取，直到涵蓋最近 days 個均線皆有值的列。
+        """
+        closes = df["Close"].to_numpy(dtype=np.float64)
+        start = self._warmup_start(closes)
+        self.reset(bars=start)
+        for time, close in zip(df.index[start:], closes[start:]):
+            self.update(time, float(close))
+
+    def _warmup_start(self, closes: np.ndarray) -> int:
+        """重建狀態需要的第一根 K 棒位置"""
+        days = max(self.convergence_days, 1)
+        start = max(len(closes) - (self.max_period + days - 1), 0)
+        isnan = np.isnan(closes)
+        if not isnan[start:].any():
+            return start
+
+        # 連續有值的根數達到最長週期的列才有完整均線
+        positions = np.arange(len(closes))
+        run = positions - np.maximum.accumulate(np.where(isnan, positions, -1))
+        valid = np.flatnonzero(run >= self.max_period)
+        if len(valid) < days:
+            return 0
+        return int(valid[-days]) - self.max_period + 1
+
+
+class IncrementalIndicatorCache:
+    """以 (股票, 週期, 均線組合, 天數) 為鍵的增量狀態，依最近使用順序淘汰"""
+
+    def __init__(self, max_entries: int = INDICATOR_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._states: "OrderedDict[Hashable, IncrementalConvergence]" = OrderedDict()
+        self._rebuilds = 0
+        self._appended = 0
+        self._unchanged = 0
+
+    def sync(
+        self,
+        symbol: str,
+        interval: str,
+        df: pd.DataFrame,
+        ma_periods: List[int],
+        convergence_days: int
+    ) -> IncrementalConvergence:
+        """
+        取得與 df 同步的增量狀態
+
+        狀態的最後一根 K 棒仍在 df 中且前一根收盤價未變時，只餵入之後的 K 棒；
+        否則 (首次、資料被重抓或調整) 由 df 重建。
+        """
+        key = (symbol, interval, tuple(sorted(set(ma_periods))), convergence_days)
+        state = self._states.get(key)
+        if state is None:
+            state = IncrementalConvergence(ma_periods, convergence_days)
+            self._states[key] = state
+            if len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(key)
+
+        pos = self._resume_position(state, df)
+        if pos is None:
+            state.load(df)
+            self._rebuilds += 1
+        elif pos >= len(df) - 1 and _same_close(state.last_close, float(df["Close"].iloc[-1])):
+            self._unchanged += 1
+        else:
+            closes = df["Close"].to_numpy(dtype=np.float64)
+            for i in range(pos, len(df)):
+                state.update(df.index[i], float(closes[i]))
+            self._appended += len(df) - pos
+        return state
+
+    @staticmethod
+    def _resume_position(state: IncrementalConvergence, df: pd.DataFrame) -> Optional[int]:
+        """回傳 df 中狀態最後一根 K 棒的位置，無法接續時回傳 None"""
+        if state.last_time is None or df.empty:
+            return None
+        pos = int(df.index.searchsorted(state.last_time))
+        if pos >= len(df) or df.index[pos] != state.last_time:
+            return None
+        if state.prev_close is not None:
+            if pos == 0 or not _same_close(float(df["Close"].iloc[pos - 1]), state.prev_close):
+                return None
+        # 最後一根在缺值與有值之間改變時無法只調整差額
+        last = float(df["Close"].iloc[pos])
+        if math.isnan(last) != math.isnan(state.last_close):
+            return None
+        return pos
+
+    def clear(self) -> int:
+        """清除所有狀態，回傳清除數量"""
+        removed = len(self._states)
+        self._states.clear()
+        return removed
+
+    def stats(self) -> Dict:
+        """取得狀態數量與更新統計 (appended 為增量餵入的 K 棒數)"""
+        return {
+            "entries": len(self._states),
+            "max_entries": self.max_entries,
+            "rebuilds": self._rebuilds,
+            "appended": self._appended,
+            "unchanged": self._unchanged,
+        }
+
+
+# 單例模式
+_indicators = None
+
+def get_indicator_cache() -> IncrementalIndicatorCache:
+    """取得 IncrementalIndicatorCache 單例"""
+    global _indicators
+    if _indicators is None:
+        _indicators = IncrementalIndicatorCache()
+    return _indicators
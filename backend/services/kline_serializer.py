@@ -0,0 +1,143 @@
+"""
+K 線序列化 - 以向量化運算產生 K 線與均線的 JSON 回應
+
+時間格式化、四捨五入與缺值處理都以整欄運算完成，
+再以 orjson (未安裝時退回標準 json) 直接編碼為 bytes，不經過逐列迴圈。
+"""
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 為選用套件
+    orjson = None
+
+# 以日期字串 (YYYY-MM-DD) 表示時間的週期，其餘以 UTC epoch 秒表示
+DATE_INTERVALS = ("1d", "1wk", "1mo")
+
+
+def format_times(index: pd.DatetimeIndex, interval: str) -> List:
+    """將時間索引轉為圖表使用的時間格式"""
+    if interval in DATE_INTERVALS:
+        return index.strftime("%Y-%m-%d").tolist()
+    seconds = (index - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+    return np.asarray(seconds, dtype=np.int64).tolist()
+
+
+def _values(series: pd.Series, decimals: Optional[int]) -> np.ndarray:
+    return _round(series.to_numpy(dtype=np.float64), decimals)
+
+
+def _round(values: np.ndarray, decimals: Optional[int]) -> np.ndarray:
+    return np.round(values, decimals) if decimals is not None else values
+
+
+def _nullable(values: np.ndarray) -> List:
+    """轉為 list，NaN 以 None 表示"""
+    out = values.tolist()
+    for i in np.flatnonzero(np.isnan(values)):
+        out[i] = None
+    return out
+
+
+def build_kline_payload(
+    df: pd.DataFrame,
+    interval: str,
+    ma_periods: List[int],
+    n_bars: Optional[int] = None,
+    decimals: Optional[int] = None,
+    ma_prefix: str = "MA",
+    skip_short_ma: bool = True,
+    columnar: bool = False,
+    ma_series: Optional[Dict[int, np.ndarray]] = None
+) -> Dict:
+    """
+    產生 K 線與均線資料
+
+    均線以完整的 df 計算 (df 可包含 n_bars 之前的暖身資料)，輸出只保留最後 n_bars 根。
+    不會修改傳入的 df。
+
+    Args:
+        df: 含 Open/High/Low/Close/Volume 的 K 線
+        interval: K 線週期，決定時間格式
+        ma_periods: 均線週期
+        n_bars: 輸出的 K 棒數量，None 代表全部
+        decimals: 價格四捨五入的小數位數，None 代表不處理
+        ma_prefix: 均線鍵值前綴 (如 "MA" -> "MA5")
+        skip_short_ma: 資料不足一個週期時不輸出該均線 (False 時輸出空的均線)
+        columnar: True 時回傳欄式格式
+        ma_series: 已計算好的 {均線天數: 與 df 等長的陣列} (如 MovingAverageCache.series)，
+                   有提供的週期直接沿用，不重新計算
+
+    Returns:
+        列式: {"ohlc": [{time, open, ...}], "ma_lines": {"MA5": [{time, value}]}}
+        欄式: {"format": "columnar", "time": [...], "open": [...], ..., "ma_lines": {"MA5": [...]}}
+              均線陣列與 time 等長對齊，尚未形成的位置為 null
+    """
+    ma_series = ma_series or {}
+    close = df["Close"]
+    ma_values = {
+        f"{ma_prefix}{period}": (
+            ma_series[period] if period in ma_series
+            else close.rolling(window=period).mean().to_numpy(dtype=np.float64)
+        )
+        for period in ma_periods
+        if len(df) >= period or not skip_short_ma
+    }
+
+    if n_bars is not None:
+        df = df.tail(n_bars)
+    tail = len(df)
+
+    times = format_times(df.index, interval)
+    columns = {
+        "open": _values(df["Open"], decimals),
+        "high": _values(df["High"], decimals),
+        "low": _values(df["Low"], decimals),
+        "close": _values(df["Close"], decimals),
+    }
+    if "Volume" in df.columns:
+        volume = np.nan_to_num(df["Volume"].to_numpy(dtype=np.float64)).astype(np.int64)
+    else:
+        volume = np.zeros(tail, dtype=np.int64)
+    ma_arrays = {
+        key: _round(values[len(values) - tail:], decimals)
+        for key, values in ma_values.items()
+    }
+
+    if columnar:
+        payload = {"format": "columnar", "time": times}
+        payload.update({key: _nullable(values) for key, values in columns.items()})
+        payload["volume"] = volume.tolist()
+        payload["ma_lines"] = {key: _nullable(values) for key, values in ma_arrays.items()}
+        return payload
+
+    ohlc = [
+        {"time": t, "open": o, "high": h, "low": l, "close": c, "volume": v}
+        for t, o, h, l, c, v in zip(
+            times,
+            columns["open"].tolist(),
+            columns["high"].tolist(),
+            columns["low"].tolist(),
+            columns["close"].tolist(),
+            volume.tolist()
+        )
+    ]
+    ma_lines = {}
+    for key, values in ma_arrays.items():
+        valid = np.flatnonzero(~np.isnan(values))
+        ma_lines[key] = [
+            {"time": times[i], "value": value}
+            for i, value in zip(valid.tolist(), values[valid].tolist())
+        ]
+    return {"ohlc": ohlc, "ma_lines": ma_lines}
+
+
+def encode_json(payload) -> bytes:
+    """將回應編碼為 JSON bytes (優先使用 orjson)"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,189 @@
+"""
+共用均線快取 - 篩選與 K 線圖共用同一份唯讀的均線序列
+
+以 (股票代碼, 週期) 為鍵存放在 FrameCache 的 "ma" 命名空間，每筆項目保存
+{均線天數: 均線陣列}，並引用計算時的 K 線 (時間索引與收盤價) 作為資料版本：
+
+- 請求的 K 線是已快取序列的尾段 (同一份標準歷史的較短切片) 時直接切片回傳
+- 最後一根 K 棒或收盤價改變 (新 K 棒、盤中更新、除權息重抓) 時視為新版本並重新計算
+
+時間索引與收盤價直接引用 K 線本身 (不另存副本)，項目大小只計入均線陣列，
+不會因為多存一份索引與收盤價而擠掉 FrameCache 中的 K 線。
+回傳的陣列皆為唯讀，呼叫端不會修改到共用的資料。
+全市場篩選建立糾結索引時以整個價格矩陣一次計算並寫入，之後開啟 K 線圖不需再計算均線；
+同一資料版本已寫入過的均線不會重複寫入。
+"""
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .convergence_engine import ConvergenceEngine, PriceMatrix
+from .frame_cache import FrameCache
+
+# 記錄已寫入均線的資料版本數量 (每個市場與週期各一個最新版本)
+PUBLISHED_VERSIONS = 16
+
+
+def _readonly(values: np.ndarray) -> np.ndarray:
+    values = np.array(values, dtype=np.float64)
+    values.flags.writeable = False
+    return values
+
+
+class _Series:
+    """一檔股票的各均線；index 與 close 引用 K 線本身，大小只計入均線陣列"""
+
+    __slots__ = ("index", "close", "values")
+
+    def __init__(self, index: pd.Index, close: np.ndarray, values: Dict[int, np.ndarray]):
+        self.index = index
+        self.close = close
+        self.values = values
+
+    def with_values(self, values: Dict[int, np.ndarray]) -> "_Series":
+        """加入均線後的新項目 (快取中的項目不就地修改)"""
+        return _Series(self.index, self.close, {**self.values, **values})
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sum(v.nbytes for v in self.values.values())
+
+
+class MovingAverageCache:
+    """以資料版本驗證的唯讀均線快取"""
+
+    def __init__(self, cache: FrameCache):
+        self.cache = cache
+        # (週期, 資料版本) -> 已寫入的均線天數
+        self._versions: "OrderedDict[Tuple[str, Hashable], Set[int]]" = OrderedDict()
+        self._computed = 0
+        self._reused = 0
+        self._published = 0
+
+    def series(
+        self,
+        code: str,
+        interval: str,
+        df: pd.DataFrame,
+        ma_periods: List[int]
+    ) -> Dict[int, np.ndarray]:
+        """
+        取得 df 各均線的唯讀序列
+
+        Returns:
+            {均線天數: 與 df 等長的陣列}，尚未形成的位置為 NaN
+        """
+        periods = list(dict.fromkeys(ma_periods))
+        close = df["Close"].to_numpy(dtype=np.float64)
+        key = ("ma", code, interval)
+        entry = self.cache.get(key)
+        offset = self._offset(entry, df.index, close) if entry is not None else None
+        if offset is None:
+            entry, offset = _Series(df.index, close, {}), 0
+
+        missing = [p for p in periods if p not in entry.values]
+        if missing:
+            entry = entry.with_values({
+                p: _readonly(ConvergenceEngine.rolling_mean(entry.close[:, None], p)[:, 0])
+                for p in missing
+            })
+            self.cache.set(key, entry, interval=interval)
+        self._computed += len(missing)
+        self._reused += len(periods) - len(missing)
+        return {p: self._slice(entry.values[p], offset, p) for p in periods}
+
+    @staticmethod
+    def _offset(entry: _Series, index: pd.Index, close: np.ndarray) -> Optional[int]:
+        """df 為已快取序列的尾段時回傳其起始位置，否則回傳 None"""
+        offset = len(entry.index) - len(index)
+        if len(index) == 0 or offset < 0:
+            return None
+        if entry.index[-1] != index[-1] or entry.index[offset] != index[0]:
+            return None
+        if entry.close[-1] != close[-1] or entry.close[offset] != close[0]:
+            return None
+        return offset
+
+    @staticmethod
+    def _slice(values: np.ndarray, offset: int, period: int) -> np.ndarray:
+        """
+        取出 offset 之後的均線
+
+        切片開頭不足一個週期的位置設為 NaN，結果與只用切片計算相同。
+        """
+        if offset == 0 or period <= 1:
+            return values
+        values = values[offset:].copy()
+        values[:period - 1] = np.nan
+        values.flags.writeable = False
+        return values
+
+    def publish(
+        self,
+        interval: str,
+        frames: Dict[str, pd.DataFrame],
+        matrix: PriceMatrix,
+        ma_periods: List[int],
+        version: Optional[Hashable] = None
+    ) -> int:
+        """
+        以價格矩陣一次計算全市場的完整均線並寫入快取
+
+        Args:
+            frames: 建立 matrix 的 {股票代碼: DataFrame}
+            version: frames 的資料版本；此版本已寫入過的均線天數直接略過
+
+        Returns:
+            寫入的序列數
+        """
+        periods = list(dict.fromkeys(ma_periods))
+        published_key = (interval, version)
+        if version is not None:
+            done = self._versions.get(published_key, set())
+            periods = [p for p in periods if p not in done]
+        if len(matrix) == 0 or not periods:
+            return 0
+
+        packed, _ = ConvergenceEngine.pack_to_end(matrix.close)
+        bars = (~np.isnan(packed)).sum(axis=0)
+
+        # 有重複 K 棒或缺值的序列與矩陣中的欄位無法逐根對齊，留待開啟時計算
+        columns = {}
+        for j, code in enumerate(matrix.codes):
+            df = frames.get(code)
+            n = int(bars[j])
+            if df is not None and n > 0 and len(df) == n:
+                columns[j] = (code, df.index, df["Close"].to_numpy(dtype=np.float64))
+
+        values: Dict[int, Dict[int, np.ndarray]] = {j: {} for j in columns}
+        for period in periods:
+            mas = ConvergenceEngine.rolling_mean(packed, period)
+            for j, (_, index, _) in columns.items():
+                values[j][period] = _readonly(mas[-len(index):, j])
+
+        for j, (code, index, close) in columns.items():
+            key = ("ma", code, interval)
+            entry = self.cache.get(key)
+            # 同一版本已有的其他均線一併保留
+            if entry is None or self._offset(entry, index, close) != 0:
+                entry = _Series(index, close, {})
+            self.cache.set(key, entry.with_values(values[j]), interval=interval)
+
+        if version is not None:
+            self._versions[published_key] = self._versions.get(published_key, set()) | set(periods)
+            self._versions.move_to_end(published_key)
+            while len(self._versions) > PUBLISHED_VERSIONS:
+                self._versions.popitem(last=False)
+
+        published = len(columns) * len(periods)
+        self._published += published
+        return published
+
+    def stats(self) -> Dict:
+        """取得統計數據 (reused 為直接沿用快取的次數)"""
+        return {
+            "computed": self._computed,
+            "reused": self._reused,
+            "published": self._published,
+        }
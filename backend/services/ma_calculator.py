@@ -72,6 +72,8 @@ class MACalculator:
         """
         檢查是否符合均線糾結條件
         
+        不會修改傳入的 df；已有 MA{週期} 欄位時直接沿用。
+        
         Args:
             df: 股票歷史數據
             ma_periods: 要檢查的均線週期列表
@@ -89,17 +91,16 @@ class MACalculator:
         if len(df) < max_period + convergence_days:
             return False, 0.0
         
-        # 計算均線
-        for period in ma_periods:
-            col_name = f"MA{period}"
-            if col_name not in df.columns:
-                df[col_name] = df['Close'].rolling(window=period).mean()
-        
-        # 取得均線欄位
+        # 計算均線 (另建 DataFrame，不修改傳入的 df；df 可能是多個請求共用的快取資料)
         ma_columns = [f"MA{p}" for p in ma_periods]
+        mas = pd.DataFrame({
+            col_name: df[col_name] if col_name in df.columns
+            else df['Close'].rolling(window=period).mean()
+            for period, col_name in zip(ma_periods, ma_columns)
+        }, index=df.index)
         
         # 過濾掉包含 NaN 的行
-        valid_df = df.dropna(subset=ma_columns)
+        valid_df = mas.dropna()
         
         if len(valid_df) < convergence_days:
             return False, 0.0
@@ -0,0 +1,394 @@
+"""
+效能指標 - 熱路徑各階段計時，以 Prometheus 文字格式輸出
+
+- stage(): 計時一個處理階段 (indicators / serialize ...)，寫入直方圖並累加到目前請求的 Server-Timing
+- fetch_timer(): 上游抓取延遲，依資料來源與週期分類，另計失敗次數
+- FETCH_QUEUE_SECONDS: 抓取排程器中等待名額的時間，依優先通道分類
+- RequestTimingMiddleware: ASGI 中介層，記錄請求延遲並附上 Server-Timing 標頭
+- LoopLagMonitor: 定期量測事件迴圈延遲 (阻塞事件迴圈的同步計算會直接反映在這裡)
+- 快取命中率等既有統計以 collector 在輸出時讀取，熱路徑上不額外計數
+
+每次觀測只有一次 perf_counter 與一次加鎖的桶計數，可常駐於正式環境。
+"""
+import asyncio
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 是否在回應加上 Server-Timing 標頭 (會揭露內部階段耗時，預設關閉)
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
+# 事件迴圈延遲的量測間隔 (秒)
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", "0.5"))
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (名稱, 類型, 說明, [(標籤, 值)])
+Sample = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """只增不減的計數器"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Counter):
+    """可任意設定的數值"""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """固定桶的直方圖"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 標籤 -> [各桶計數..., 總和, 次數]
+        self._series: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            if slot < len(self.buckets):
+                series[slot] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def summary(self, **labels) -> Dict:
+        """取得單一標籤組合的次數與總和 (供管理端點與測試使用)"""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                return {"count": 0, "sum": 0.0}
+            return {"count": int(series[-1]), "sum": series[-2]}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+
+        lines = []
+        for key, series in sorted(snapshot.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = {**labels, "le": _format_value(bound)}
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {_format_value(cumulative)}")
+            bucket_labels = {**labels, "le": "+Inf"}
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """指標註冊表，render() 產生 Prometheus 文字格式"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """註冊在輸出時才讀取的指標來源 (如各快取的 stats())"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(
+                    f"{name}{_format_labels(labels)} {_format_value(value)}"
+                    for labels, value in samples
+                )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "screener_stage_seconds", "Time spent in each processing stage", ["stage"]
+)
+FETCH_SECONDS = registry.histogram(
+    "screener_upstream_fetch_seconds", "Upstream fetch latency", ["provider", "interval"]
+)
+FETCH_ERRORS = registry.counter(
+    "screener_upstream_fetch_errors_total", "Failed upstream fetches", ["provider", "interval"]
+)
+FETCH_QUEUE_SECONDS = registry.histogram(
+    "screener_upstream_queue_seconds", "Time waiting for an upstream fetch slot", ["lane"]
+)
+REQUEST_SECONDS = registry.histogram(
+    "screener_http_request_seconds", "HTTP request latency", ["method", "route", "status"]
+)
+LOOP_LAG_SECONDS = registry.histogram(
+    "screener_event_loop_lag_seconds", "Event loop scheduling delay",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+
+# 目前請求的各階段累計耗時 (由 HTTP 中介層設定)；並行的子任務共用同一個 dict
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def _record(stage_name: str, elapsed: float) -> None:
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage_name] = timings.get(stage_name, 0.0) + elapsed
+
+
+@contextmanager
+def stage(name: str):
+    """計時一個處理階段"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        _record(name, elapsed)
+
+
+@contextmanager
+def fetch_timer(provider: str, interval: str):
+    """計時一次上游抓取；例外會計入失敗次數後照常拋出"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        if not isinstance(e, asyncio.CancelledError):
+            FETCH_ERRORS.inc(provider=provider, interval=interval)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        FETCH_SECONDS.observe(elapsed, provider=provider, interval=interval)
+        _record("fetch", elapsed)
+
+
+def begin_request() -> Tuple[contextvars.Token, Dict[str, float]]:
+    """開始收集目前請求的階段耗時"""
+    timings: Dict[str, float] = {}
+    return _request_timings.set(timings), timings
+
+
+def end_request(token: contextvars.Token) -> None:
+    _request_timings.reset(token)
+
+
+def server_timing_header(timings: Dict[str, float], total: float) -> str:
+    """
+    產生 Server-Timing 標頭
+
+    並行的抓取會累加，fetch 可能大於 total。
+    """
+    parts = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class RequestTimingMiddleware:
+    """
+    記錄請求延遲 (依路由樣板分類)；server_timing 為 True 時附上各階段耗時的 Server-Timing 標頭
+
+    直接包裝 ASGI 的 send，不經過 BaseHTTPMiddleware：串流回應不會被額外的
+    task 與記憶體串流轉送，請求延遲也涵蓋到最後一個 body 送出為止。
+    Server-Timing 在送出回應標頭時產生，只含到那時為止的階段。
+    """
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token, timings = begin_request()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    header = server_timing_header(timings, time.perf_counter() - start)
+                    message["headers"] = [
+                        *message.get("headers", []), (b"server-timing", header.encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end_request(token)
+            # 路由比對後 scope 會帶有 route (路徑樣板)，避免以實際路徑分類造成標籤爆量
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status)
+            )
+
+
+class LoopLagMonitor:
+    """以固定間隔休眠，實際醒來的延遲即事件迴圈被佔用的時間"""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.observe(lag)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def collect(self) -> Iterable[Sample]:
+        yield ("screener_event_loop_lag_last_seconds", "gauge",
+               "Most recent event loop delay", [({}, self.last_lag)])
+        yield ("screener_event_loop_lag_max_seconds", "gauge",
+               "Largest event loop delay since start", [({}, self.max_lag)])
+
+
+def stats_collector(prefix: str, help: str, stats: Callable[[], Dict],
+                    counters: Sequence[str] = (), gauges: Sequence[str] = ()) -> Callable[[], Iterable[Sample]]:
+    """
+    將既有的 stats() 字典轉為指標
+
+    Args:
+        prefix: 指標名稱前綴，如 screener_frame_cache
+        counters: 累計值欄位 (輸出為 <prefix>_<欄位>_total)
+        gauges: 目前值欄位 (輸出為 <prefix>_<欄位>)
+    """
+    def collect() -> Iterable[Sample]:
+        values = stats()
+        for field in counters:
+            yield (f"{prefix}_{field}_total", "counter", f"{help}: {field}", [({}, values[field])])
+        for field in gauges:
+            yield (f"{prefix}_{field}", "gauge", f"{help}: {field}", [({}, values[field])])
+    return collect
+
+
+# 單例模式
+_loop_monitor = None
+
+def get_loop_monitor() -> LoopLagMonitor:
+    """取得 LoopLagMonitor 單例 (其指標會註冊到全域 registry)"""
+    global _loop_monitor
+    if _loop_monitor is None:
+        _loop_monitor = LoopLagMonitor()
+        registry.register_collector(_loop_monitor.collect)
+    return _loop_monitor
@@ -0,0 +1,218 @@
+"""
+本地 OHLCV 儲存 - 每個 (股票, 週期) 一個欄式 .npy 檔
+
+檔案內容為 shape = (6, n) 的 float64 陣列，依序為
+時間 (UTC epoch 秒)、Open、High、Low、Close、Volume，
+以 memory-map 方式讀取，重啟後不需重新下載完整歷史。
+讀出的 DataFrame 直接引用 memory-map (不複製)，多個 uvicorn worker
+讀取同一檔案時共用作業系統的頁面快取。
+"""
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = os.environ.get(
+    "OHLCV_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "ohlcv")
+)
+
+# 台股 K 線一律以台北時間呈現
+TIMEZONE = "Asia/Taipei"
+
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# Windows 無法取代仍被 memory-map 的檔案，只在 POSIX 上直接引用
+ZERO_COPY = os.name == "posix"
+
+
+class OHLCVStore:
+    """本地 OHLCV 歷史資料庫"""
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR):
+        self.root = root
+
+    def _path(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, interval, f"{symbol}.npy")
+
+    def _meta_path(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, interval, f"{symbol}.meta.json")
+
+    def load(self, symbol: str, interval: str) -> Optional[pd.DataFrame]:
+        """
+        讀取已儲存的完整歷史
+
+        Returns:
+            DataFrame (index 為台北時間)，沒有資料時回傳 None
+        """
+        path = self._path(symbol, interval)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            data = np.load(path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Corrupted store file {path}: {e}")
+            return None
+
+        if data.ndim != 2 or data.shape[0] != len(OHLCV_COLUMNS) + 1 or data.shape[1] == 0:
+            return None
+
+        index = pd.to_datetime(data[0], unit="s", utc=True).tz_convert(TIMEZONE)
+        # data[1:] 的轉置即 pandas 內部的區塊排列，copy=False 時數值直接引用 memory-map (唯讀)
+        return pd.DataFrame(data[1:].T, index=index, columns=OHLCV_COLUMNS, copy=not ZERO_COPY)
+
+    def load_covering(
+        self,
+        symbol: str,
+        interval: str,
+        start: pd.Timestamp,
+        max_age: timedelta
+    ) -> Tuple[Optional[pd.DataFrame], bool]:
+        """
+        讀取涵蓋 start 之後區間的本地歷史
+
+        Args:
+            start: 需要的最早時間
+            max_age: 超過此時間未更新即視為過期
+
+        Returns:
+            (完整歷史, 是否仍在有效期內)；本地資料未涵蓋 start 時回傳 (None, False)
+        """
+        coverage = self.coverage_start(symbol, interval)
+        if coverage is None or coverage > start:
+            return None, False
+
+        df = self.load(symbol, interval)
+        if df is None:
+            return None, False
+
+        updated = self.updated_at(symbol, interval)
+        fresh = updated is not None and datetime.now() - updated < max_age
+        return df, fresh
+
+    def save(
+        self,
+        symbol: str,
+        interval: str,
+        df: pd.DataFrame,
+        coverage_start: Optional[pd.Timestamp] = None
+    ) -> None:
+        """
+        覆寫儲存完整歷史
+
+        Args:
+            coverage_start: 這份資料請求的起始時間 (剛上市股票的第一根 K 棒可能晚於此時間)
+        """
+        if df is None or df.empty:
+            return
+
+        index = pd.DatetimeIndex(df.index)
+        if index.tz is None:
+            index = index.tz_localize(TIMEZONE)
+
+        data = np.empty((len(OHLCV_COLUMNS) + 1, len(df)), dtype=np.float64)
+        data[0] = (index - pd.Timestamp(0, tz="UTC")) / pd.Timedelta(seconds=1)
+        for i, col in enumerate(OHLCV_COLUMNS):
+            data[i + 1] = df[col].to_numpy(dtype=np.float64) if col in df.columns else np.nan
+
+        path = self._path(symbol, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._atomic_write(path, lambda f: np.save(f, data))
+
+        if coverage_start is None:
+            coverage_start = self.coverage_start(symbol, interval) or index[0]
+        meta = {"coverage_start": pd.Timestamp(coverage_start).timestamp()}
+        self._atomic_write(
+            self._meta_path(symbol, interval),
+            lambda f: f.write(json.dumps(meta).encode())
+        )
+
+    def append(self, symbol: str, interval: str, new: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """
+        附加新 K 棒；與既有資料重疊的部分 (如盤中未完成的最後一根) 以新資料取代
+
+        Returns:
+            合併後的完整歷史
+        """
+        existing = self.load(symbol, interval)
+        if new is None or new.empty:
+            if existing is not None:
+                self.touch(symbol, interval)
+            return existing
+
+        new = new[[c for c in OHLCV_COLUMNS if c in new.columns]]
+        if existing is None:
+            merged = new
+        else:
+            merged = pd.concat([existing[existing.index < new.index[0]], new])
+
+        self.save(symbol, interval, merged)
+        return self.load(symbol, interval)
+
+    def coverage_start(self, symbol: str, interval: str) -> Optional[pd.Timestamp]:
+        """已儲存資料請求涵蓋的起始時間"""
+        try:
+            with open(self._meta_path(symbol, interval)) as f:
+                meta = json.load(f)
+            return pd.Timestamp(meta["coverage_start"], unit="s", tz="UTC").tz_convert(TIMEZONE)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def updated_at(self, symbol: str, interval: str) -> Optional[datetime]:
+        """最後一次更新 (含無新資料的檢查) 的時間"""
+        try:
+            return datetime.fromtimestamp(os.path.getmtime(self._path(symbol, interval)))
+        except OSError:
+            return None
+
+    def touch(self, symbol: str, interval: str) -> None:
+        """標記已檢查過更新 (沒有新 K 棒時使用)"""
+        try:
+            os.utime(self._path(symbol, interval))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _atomic_write(path: str, write) -> None:
+        """寫入暫存檔後再取代，避免讀取端看到寫到一半的檔案"""
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+def has_corporate_actions(df: pd.DataFrame) -> bool:
+    """
+    新抓的 K 棒中是否有除權息或分割
+
+    yfinance 的還原股價會回頭調整過去的價格，遇到時需重新抓取完整歷史，
+    不能只附加新 K 棒。
+    """
+    for col in ("Dividends", "Stock Splits"):
+        if col in df.columns and (df[col].fillna(0) != 0).any():
+            return True
+    return False
+
+
+# 單例模式
+_store = None
+
+def get_ohlcv_store() -> OHLCVStore:
+    """取得 OHLCVStore 單例"""
+    global _store
+    if _store is None:
+        _store = OHLCVStore()
+    return _store
@@ -0,0 +1,129 @@
+"""
+多行程篩選 - 將全市場的糾結索引計算分散到多個 CPU 核心
+
+資料快取後，均線與糾結幅度的計算是純 CPU 工作，在事件迴圈執行時只會用到一個核心。
+此模式將收盤價矩陣放進共享記憶體 (不以 pickle 傳送 DataFrame)，
+依股票 (欄) 分片交給工作行程計算，再依原順序合併成一份 ConvergenceIndex。
+
+以環境變數 SCREEN_PROCESSES 啟用 (預設 0 = 在事件迴圈內計算)。
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .convergence_engine import ConvergenceIndex, PriceMatrix
+
+logger = logging.getLogger(__name__)
+
+# 工作行程數量，0 代表停用多行程模式
+SCREEN_PROCESSES = int(os.environ.get("SCREEN_PROCESSES", "0"))
+# 股票數少於此值時直接在目前行程計算 (分片與傳輸成本高於平行化收益)
+PROCESS_MIN_STOCKS = int(os.environ.get("PROCESS_MIN_STOCKS", "200"))
+
+
+def _compute_shard(
+    shm_name: str,
+    shape: Tuple[int, int],
+    start: int,
+    end: int,
+    ma_periods: List[int],
+    max_days: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """工作行程：由共享記憶體讀取 [start, end) 欄並計算索引內容"""
+    shm = SharedMemory(name=shm_name)
+    try:
+        close = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)[:, start:end]
+        result = ConvergenceIndex.compute(close, ma_periods, max_days)
+        # 結果皆為新陣列；關閉共享記憶體前需釋放對緩衝區的參照
+        del close
+        return result
+    finally:
+        shm.close()
+
+
+class ProcessScreenPool:
+    """以共享記憶體傳遞價格矩陣的行程池"""
+
+    def __init__(self, processes: int, min_stocks: int = PROCESS_MIN_STOCKS):
+        self.processes = processes
+        self.min_stocks = min_stocks
+        # spawn：主行程有多個執行緒 (抓取執行器)，fork 可能複製到持有中的鎖
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self._runs = 0
+        self._inline = 0
+
+    async def build_index(
+        self,
+        matrix: PriceMatrix,
+        ma_periods: List[int],
+        max_days: int
+    ) -> ConvergenceIndex:
+        """
+        分片計算糾結索引，結果與 ConvergenceIndex.build 相同
+
+        股票數少於 min_stocks 時直接在目前行程計算。
+        """
+        n = len(matrix)
+        if n < self.min_stocks or matrix.close.size == 0:
+            self._inline += 1
+            return ConvergenceIndex.build(matrix, ma_periods, max_days)
+
+        self._runs += 1
+        shm = SharedMemory(create=True, size=matrix.close.nbytes)
+        try:
+            shared = np.ndarray(matrix.close.shape, dtype=np.float64, buffer=shm.buf)
+            shared[:] = matrix.close
+            del shared
+
+            bounds = np.linspace(0, n, min(self.processes, n) + 1, dtype=int)
+            loop = asyncio.get_running_loop()
+            shards = await asyncio.gather(*[
+                loop.run_in_executor(
+                    self._executor, _compute_shard,
+                    shm.name, matrix.close.shape, int(start), int(end), list(ma_periods), max_days
+                )
+                for start, end in zip(bounds[:-1], bounds[1:])
+                if end > start
+            ])
+        finally:
+            shm.close()
+            shm.unlink()
+
+        # 各分片依欄順序串接，排序在合併後的 ConvergenceIndex 內完成
+        window_max = np.concatenate([shard[0] for shard in shards], axis=1)
+        current = np.concatenate([shard[1] for shard in shards])
+        last_close = np.concatenate([shard[2] for shard in shards])
+        return ConvergenceIndex(list(matrix.codes), window_max, current, last_close)
+
+    def stats(self) -> Dict:
+        """取得行程池統計數據"""
+        return {
+            "processes": self.processes,
+            "min_stocks": self.min_stocks,
+            "runs": self._runs,
+            "inline": self._inline,
+        }
+
+    def shutdown(self) -> None:
+        """關閉行程池並取消尚未開始的工作"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 單例模式
+_pool = None
+
+def get_process_pool() -> Optional[ProcessScreenPool]:
+    """取得 ProcessScreenPool 單例，SCREEN_PROCESSES 為 0 時回傳 None"""
+    global _pool
+    if _pool is None and SCREEN_PROCESSES > 0:
+        _pool = ProcessScreenPool(SCREEN_PROCESSES)
+    return _pool
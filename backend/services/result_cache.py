@@ -0,0 +1,123 @@
+"""
+篩選結果快取 - 以正規化參數與資料版本為鍵
+
+相同條件的 `/api/screen` 請求只要底層 K 線沒有新資料就直接回傳上次的結果。
+資料版本由每檔股票最後一根 K 棒的時間與收盤價計算，
+新 K 棒到達 (或盤中最後一根變動) 時版本改變，快取自然失效，不依賴固定的過期時間。
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import pandas as pd
+
+from .ohlcv_store import TIMEZONE
+
+# 最多保留的篩選結果數量
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "64"))
+
+
+def data_version(frames: Dict[str, pd.DataFrame]) -> str:
+    """
+    計算一組 K 線的資料版本
+
+    只取每檔股票的筆數、最後時間與最後收盤價，不需掃描整段歷史。
+    """
+    return DataVersion().update(frames).hexdigest()
+
+
+class DataVersion:
+    """
+    分批累計資料版本：K 線分批載入時逐批加入，全部加入後與 data_version() 相同
+
+    每檔只保留一行摘要，最後依股票代碼排序後雜湊，結果與加入順序無關。
+    """
+
+    def __init__(self):
+        self._parts: Dict[str, str] = {}
+
+    def update(self, frames: Dict[str, pd.DataFrame]) -> "DataVersion":
+        """加入一批 {股票代碼: DataFrame}；空的 K 線不計入"""
+        for code, df in frames.items():
+            if df is None or df.empty:
+                continue
+            self._parts[code] = f"{code}|{len(df)}|{df.index[-1].value}|{df['Close'].iloc[-1]!r};"
+        return self
+
+    def hexdigest(self) -> str:
+        digest = hashlib.sha1()
+        for code in sorted(self._parts):
+            digest.update(self._parts[code].encode())
+        return digest.hexdigest()[:16]
+
+
+def make_etag(*parts) -> str:
+    """由任意可轉字串的部分組成強 ETag (含引號)"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """檢查 If-None-Match 標頭是否包含 etag (支援 * 與弱比較)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class ScreenResultCache:
+    """以 (正規化參數, 資料版本) 為鍵的篩選結果，依最近使用順序淘汰"""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Dict]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Tuple, version: str) -> Optional[Dict]:
+        """
+        取得快取結果，資料版本不同時視為不存在
+
+        Returns:
+            {"results", "etag", "last_modified", "version"}
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry["version"] != version:
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return entry
+
+    def put(self, key: Tuple, version: str, results: List[Dict]) -> Dict:
+        """寫入結果；同一組參數只保留最新資料版本"""
+        entry = {
+            "results": results,
+            "version": version,
+            "etag": make_etag(key, version),
+            "last_modified": pd.Timestamp.now(tz=TIMEZONE),
+        }
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> int:
+        """清除所有結果，回傳清除數量"""
+        removed = len(self._entries)
+        self._entries.clear()
+        return removed
+
+    def stats(self) -> Dict:
+        """取得快取統計數據"""
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+        }
@@ -2,15 +2,37 @@
 均線糾結篩選器
 """
 import asyncio
-from typing import List, Dict
+from collections import OrderedDict
+from contextlib import aclosing
+from datetime import date
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import logging
+import os
 
-from .stock_data import StockDataService
+import numpy as np
+import pandas as pd
+
+from .stock_data import StockDataService, BULK_CHUNK_SIZE
 from .ma_calculator import MACalculator
-from .tvdata_service import get_tv_service
+from .backtest import ConvergenceBacktest, FORWARD_HORIZONS
+from .convergence_engine import ConvergenceEngine, ConvergenceIndex, PriceMatrix
+from .incremental_ma import IncrementalIndicatorCache, get_indicator_cache
+from .metrics import stage
+from .ohlcv_store import TIMEZONE
+from .process_screener import ProcessScreenPool, get_process_pool
+from .result_cache import DataVersion, ScreenResultCache, data_version, etag_matches
+from .snapshot_scheduler import snapshot_key
+from .tvdata_service import get_tv_service, base_interval
 
 logger = logging.getLogger(__name__)
 
+# 糾結索引預先計算的最大天數 (與前端天數滑桿上限一致)
+INDEX_MAX_DAYS = int(os.environ.get("INDEX_MAX_DAYS", "30"))
+# 最多保留的糾結索引數量 (每組均線 × 市場 × 週期一份)
+INDEX_CACHE_SIZE = int(os.environ.get("INDEX_CACHE_SIZE", "16"))
+# 最多保留的價格矩陣數量 (每個市場 × 週期 × 資料版本一份)
+MATRIX_CACHE_SIZE = int(os.environ.get("MATRIX_CACHE_SIZE", "4"))
+
 
 class MAConvergenceScreener:
     """均線糾結篩選器"""
@@ -18,115 +40,777 @@ class MAConvergenceScreener:
     def __init__(
         self, 
         stock_service: StockDataService,
-        ma_calculator: MACalculator
+        ma_calculator: MACalculator,
+        indicators: Optional[IncrementalIndicatorCache] = None,
+        results: Optional[ScreenResultCache] = None,
+        pool: Optional[ProcessScreenPool] = None
     ):
         self.stock_service = stock_service
         self.ma_calculator = ma_calculator
+        self.engine = ConvergenceEngine()
+        self.indicators = indicators or get_indicator_cache()
+        self.results = results or ScreenResultCache()
+        # 多行程模式 (SCREEN_PROCESSES > 0)；None 代表在事件迴圈內計算
+        self.pool = pool or get_process_pool()
+        self._indexes: "OrderedDict[Tuple, Tuple[str, ConvergenceIndex]]" = OrderedDict()
+        self._matrices: "OrderedDict[Tuple, PriceMatrix]" = OrderedDict()
     
-    async def screen_single(
+    async def screen(
         self,
-        code: str,
-        name: str,
-        market: str,
+        ma_periods: List[int] = [5, 10, 20, 60],
+        convergence_pct: float = 3.0,
+        convergence_days: int = 5,
+        market: str = "all",
+        interval: str = "1d"
+    ) -> List[Dict]:
+        """
+        批量篩選均線糾結股票
+        
+        Args:
+            ma_periods: 要檢查的均線週期列表
+            convergence_pct: 糾結幅度百分比閾值
+            convergence_days: 連續糾結天數
+            market: all, TW, TWO
+        
+        Returns:
+            符合條件的股票列表
+        """
+        entry = await self.screen_versioned(
+            ma_periods, convergence_pct, convergence_days, market, interval
+        )
+        return entry["results"]
+    
+    async def screen_versioned(
+        self,
+        ma_periods: List[int] = [5, 10, 20, 60],
+        convergence_pct: float = 3.0,
+        convergence_days: int = 5,
+        market: str = "all",
+        interval: str = "1d"
+    ) -> Dict:
+        """
+        批量篩選並回傳結果快取項目
+        
+        K 線照常經由快取載入 (過期時會抓取新 K 棒)，
+        若資料版本與上次相同條件的結果一致則略過重新計算。
+        日K 以糾結索引計算；分鐘 K 等其他週期以增量均線狀態檢查，
+        盤中更新 (含快照排程的重新整理) 每檔只需餵入新的 K 棒。
+        
+        Returns:
+            {"results", "etag", "last_modified", "version", "cached"}
+        """
+        # 取得股票列表
+        stocks = self.stock_service.get_stock_list(market=market, limit=None)
+        key = snapshot_key({
+            "ma_periods": ma_periods,
+            "convergence_pct": convergence_pct,
+            "convergence_days": convergence_days,
+            "market": market,
+            "interval": interval,
+        })
+        
+        # 以索引涵蓋的天數載入資料，讓資料版本不隨天數門檻改變
+        index_days = max(convergence_days, INDEX_MAX_DAYS)
+        frames = await self._load_frames(stocks, ma_periods, index_days, interval)
+        version = data_version(frames)
+        cached = self.results.get(key, version)
+        if cached is not None:
+            logger.info(f"篩選結果未變動 (資料版本 {version})，使用快取")
+            return {**cached, "cached": True}
+        
+        logger.info(f"開始篩選 {len(stocks)} 支股票...")
+        logger.info(f"條件: 週期={interval}, 均線={ma_periods}, 幅度<={convergence_pct}%, 天數={convergence_days}")
+        
+        if interval == "1d":
+            matched = await self._query_index(
+                key, version, frames, stocks, convergence_pct, convergence_days, index_days
+            )
+        else:
+            matched = self._match_incremental(
+                frames, {stock["code"]: stock for stock in stocks}, list(key[0]),
+                convergence_pct, convergence_days, interval
+            )
+        
+        logger.info(f"篩選完成，共 {len(matched)} 支股票符合條件")
+        
+        return {**self.results.put(key, version, matched), "cached": False}
+    
+    async def _query_index(
+        self,
+        key: Tuple,
+        version: str,
+        frames: Dict[str, pd.DataFrame],
+        stocks: List[Dict],
+        convergence_pct: float,
+        convergence_days: int,
+        index_days: int
+    ) -> List[Dict]:
+        """
+        以糾結索引取得符合條件的股票 (依糾結幅度排序)
+        
+        同一組均線只建一次索引，之後任何門檻都只需二分搜尋。
+        """
+        if convergence_days <= 0:
+            return []
+        
+        index = await self._convergence_index(key[0], key[3], key[4], version, frames, index_days)
+        return self._matches(index, {stock["code"]: stock for stock in stocks}, convergence_pct, convergence_days)
+    
+    def _match_incremental(
+        self,
+        frames: Dict[str, pd.DataFrame],
+        stock_map: Dict[str, Dict],
         ma_periods: List[int],
         convergence_pct: float,
         convergence_days: int,
+        interval: str
+    ) -> List[Dict]:
+        """
+        以增量均線狀態檢查分鐘 K 等非日K 週期 (依糾結幅度排序)
+        
+        盤中重新篩選時每檔只需餵入上次檢查後的新 K 棒與更新中的最後一根，
+        成本與載入的 K 棒數量無關。
+        """
+        if convergence_days <= 0 or not ma_periods:
+            return []
+        
+        matched = []
+        with stage("indicators"):
+            for code, df in frames.items():
+                state = self.indicators.sync(code, interval, df, ma_periods, convergence_days)
+                is_converged, current_pct = state.check(convergence_pct)
+                if not is_converged:
+                    continue
+                stock = stock_map[code]
+                matched.append({
+                    "code": stock["code"],
+                    "name": stock["name"],
+                    "market": stock["market"],
+                    "close": round(state.last_close, 2),
+                    "convergence_pct": current_pct
+                })
+        
+        matched.sort(key=lambda x: (x.get("convergence_pct", 100), x["code"]))
+        return matched
+    
+    @staticmethod
+    def _matches(
+        index: ConvergenceIndex,
+        stock_map: Dict[str, Dict],
+        convergence_pct: float,
+        convergence_days: int
+    ) -> List[Dict]:
+        """查詢糾結索引並組成結果 (依糾結幅度排序)"""
+        matched = []
+        for i in index.query(convergence_pct, convergence_days):
+            stock = stock_map[index.codes[i]]
+            close = index.last_close[i]
+            matched.append({
+                "code": stock["code"],
+                "name": stock["name"],
+                "market": stock["market"],
+                "close": round(float(close), 2) if not np.isnan(close) else None,
+                "convergence_pct": float(index.current_pct[i])
+            })
+        
+        # 按糾結幅度排序（幅度小的排前面，相同時依代碼，與串流結果一致）
+        matched.sort(key=lambda x: (x.get("convergence_pct", 100), x["code"]))
+        return matched
+    
+    async def _convergence_index(
+        self,
+        ma_periods: Tuple[int, ...],
+        market: str,
+        interval: str,
+        version: str,
+        frames: Dict[str, pd.DataFrame],
+        max_days: int
+    ) -> ConvergenceIndex:
+        """取得 (均線組合, 市場, 週期) 的糾結索引，資料版本改變或天數不足時重建"""
+        key = (ma_periods, market, interval)
+        entry = self._indexes.get(key)
+        if entry is not None and entry[0] == version and entry[1].max_days >= max_days:
+            self._indexes.move_to_end(key)
+            return entry[1]
+        
+        with stage("indicators"):
+            matrix = self._price_matrix(market, interval, version, frames)
+            if self.pool is not None:
+                index = await self.pool.build_index(matrix, list(ma_periods), max_days)
+            else:
+                index = ConvergenceIndex.build(matrix, list(ma_periods), max_days)
+            self._publish_ma(interval, version, frames, matrix, ma_periods)
+        self._remember_index(key, version, index)
+        return index
+    
+    def _remember_index(self, key: Tuple, version: str, index: ConvergenceIndex) -> None:
+        """放入糾結索引快取，超過上限時淘汰最久未使用的索引"""
+        self._indexes[key] = (version, index)
+        self._indexes.move_to_end(key)
+        while len(self._indexes) > INDEX_CACHE_SIZE:
+            self._indexes.popitem(last=False)
+    
+    def _publish_ma(
+        self,
+        interval: str,
+        version: str,
+        frames: Dict[str, pd.DataFrame],
+        matrix: PriceMatrix,
+        ma_periods
+    ) -> None:
+        """將全市場的完整均線寫入共用均線快取，之後開啟 K 線圖不需再計算 (同一資料版本只寫一次)"""
+        self.stock_service.ma_cache.publish(interval, frames, matrix, list(ma_periods), version=version)
+    
+    async def _convergence_indexes(
+        self,
+        period_sets: List[Tuple[int, ...]],
+        market: str,
+        interval: str,
+        version: str,
+        frames: Dict[str, pd.DataFrame],
+        max_days: int
+    ) -> Dict[Tuple[int, ...], ConvergenceIndex]:
+        """
+        取得多組均線的糾結索引；快取中沒有的組合一次建立 (每個均線週期只計算一次)
+        
+        新建的索引同樣放入快取，之後相同均線的一般篩選可直接使用。
+        """
+        indexes = {}
+        missing = []
+        for periods in period_sets:
+            entry = self._indexes.get((periods, market, interval))
+            if entry is not None and entry[0] == version and entry[1].max_days >= max_days:
+                indexes[periods] = entry[1]
+            else:
+                missing.append(periods)
+        
+        if missing:
+            with stage("indicators"):
+                matrix = self._price_matrix(market, interval, version, frames)
+                built = ConvergenceIndex.build_many(matrix, missing, max_days)
+                self._publish_ma(
+                    interval, version, frames, matrix, sorted({p for s in missing for p in s})
+                )
+            for periods, index in built.items():
+                self._remember_index((periods, market, interval), version, index)
+            indexes.update(built)
+        return indexes
+    
+    async def screen_sweep(
+        self,
+        param_sets: List[Dict],
+        market: str = "all",
         interval: str = "1d"
     ) -> Dict:
         """
-        篩選單支股票
+        參數掃描：一次篩選多組 (均線, 幅度, 天數)
+        
+        K 線只載入一次；每個不同的均線週期只計算一次，相同均線組合的參數共用同一份索引，
+        各組的幅度與天數門檻只需一次二分搜尋。
+        
+        Args:
+            param_sets: [{"ma_periods", "convergence_pct", "convergence_days"}, ...]
         
         Returns:
-            符合條件時回傳股票資訊，否則回傳 None
+            {
+                "sets": [{"ma_periods", "convergence_pct", "convergence_days", "count"}, ...],
+                "stocks": [{"code", "name", "market", "close", "matches": [...]}, ...],
+                "distinct_periods": [...]
+            }
+            matches[i] 為該股票在第 i 組參數的糾結幅度 (不符合時為 None)；
+            stocks 依符合的組數由多到少排序
         """
-        try:
-            # 根據 interval 取得歷史數據
-            if interval == "1d":
-                df = await self.stock_service.get_stock_history(code)
-            else:
-                tv_service = get_tv_service()
-                # 根據週期決定取多少 K 棒 (確保足夠計算最長均線 + 糾結天數)
-                max_period = max(ma_periods) if ma_periods else 60
-                required_bars = max_period + convergence_days + 20
-                df = await tv_service.get_kline_data(code, market, interval, n_bars=required_bars)
-            
-            if df is None or df.empty:
-                return None
-            
-            # 檢查糾結條件
-            is_converged, current_pct = self.ma_calculator.check_convergence(
-                df, ma_periods, convergence_pct, convergence_days
+        if not param_sets:
+            raise ValueError("需至少一組參數")
+        sets = []
+        for params in param_sets:
+            periods = tuple(sorted(set(int(p) for p in params["ma_periods"])))
+            days = int(params["convergence_days"])
+            if not periods or days <= 0:
+                raise ValueError("每組參數需指定均線週期且 convergence_days 需大於 0")
+            sets.append((periods, float(params["convergence_pct"]), days))
+        
+        stocks = self.stock_service.get_stock_list(market=market, limit=None)
+        distinct = sorted({p for periods, _, _ in sets for p in periods})
+        index_days = max(max(days for _, _, days in sets), INDEX_MAX_DAYS)
+        
+        logger.info(f"開始參數掃描 {len(stocks)} 支股票: {len(sets)} 組參數, {len(distinct)} 個均線週期")
+        
+        frames = await self._load_frames(stocks, distinct, index_days, interval)
+        version = data_version(frames)
+        indexes = await self._convergence_indexes(
+            list(dict.fromkeys(periods for periods, _, _ in sets)),
+            market or "all", interval, version, frames, index_days
+        )
+        
+        # (股票, 參數組) 的糾結幅度矩陣，只保留至少符合一組的股票
+        rows: Dict[str, List[Optional[float]]] = {}
+        closes: Dict[str, float] = {}
+        summary = []
+        for k, (periods, pct, days) in enumerate(sets):
+            index = indexes[periods]
+            matched = index.query(pct, days)
+            for i in matched:
+                code = index.codes[i]
+                rows.setdefault(code, [None] * len(sets))[k] = float(index.current_pct[i])
+                closes[code] = index.last_close[i]
+            summary.append({
+                "ma_periods": list(periods),
+                "convergence_pct": pct,
+                "convergence_days": days,
+                "count": int(len(matched)),
+            })
+        
+        stock_map = {stock["code"]: stock for stock in stocks}
+        results = []
+        for code, matches in rows.items():
+            stock = stock_map[code]
+            close = closes[code]
+            results.append({
+                "code": code,
+                "name": stock["name"],
+                "market": stock["market"],
+                "close": round(float(close), 2) if not np.isnan(close) else None,
+                "matches": matches,
+            })
+        results.sort(key=lambda x: (-sum(m is not None for m in x["matches"]), x["code"]))
+        
+        logger.info(f"參數掃描完成，共 {len(results)} 支股票符合至少一組條件")
+        return {"sets": summary, "stocks": results, "distinct_periods": distinct}
+    
+    def _price_matrix(
+        self,
+        market: str,
+        interval: str,
+        version: str,
+        frames: Dict[str, pd.DataFrame]
+    ) -> PriceMatrix:
+        """取得 (市場, 週期, 資料版本) 的價格矩陣，不同均線組合與歷史回放共用同一份"""
+        key = (market, interval, version)
+        matrix = self._matrices.get(key)
+        if matrix is not None:
+            self._matrices.move_to_end(key)
+            return matrix
+        
+        matrix = PriceMatrix.from_frames(frames)
+        self._matrices[key] = matrix
+        while len(self._matrices) > MATRIX_CACHE_SIZE:
+            self._matrices.popitem(last=False)
+        return matrix
+    
+    async def screen_history(
+        self,
+        ma_periods: List[int] = [5, 10, 20, 60],
+        convergence_pct: float = 3.0,
+        convergence_days: int = 5,
+        market: str = "all",
+        start: Optional[date] = None,
+        end: Optional[date] = None
+    ) -> List[Dict]:
+        """
+        以本地日K 歷史回放過去的篩選結果
+        
+        - 只給 start (as of)：回傳 start 當天 (非交易日時為之前最後一個交易日) 的結果
+        - 給 start 與 end：回傳區間內每個交易日的結果
+        
+        所有日期由同一份價格矩陣一次向量化計算，不逐日或逐檔重新抓取。
+        
+        Returns:
+            [{"date": "YYYY-MM-DD", "results": [...]}]，依日期排序；
+            results 格式與 screen() 相同
+        """
+        if start is None:
+            raise ValueError("需指定 start")
+        if end is not None and end < start:
+            raise ValueError("end 不可早於 start")
+        
+        stocks = self.stock_service.get_stock_list(market=market, limit=None)
+        # 與即時篩選相同的暖身區間 (prefetch_histories 預設 250 天)，再往前延伸到 start
+        lookback = max((pd.Timestamp.now(tz=TIMEZONE).date() - start).days, 0)
+        frames = await self.stock_service.prefetch_histories(
+            [s["code"] for s in stocks], days=lookback + 250
+        )
+        matrix = self._price_matrix(market, "1d", data_version(frames), frames)
+        if len(matrix) == 0:
+            return []
+        
+        dates = matrix.dates
+        first = dates.searchsorted(pd.Timestamp(start).tz_localize(dates.tz))
+        after = dates.searchsorted(pd.Timestamp(end or start).tz_localize(dates.tz) + pd.Timedelta(days=1))
+        rows = np.arange(first, after) if end is not None else np.arange(after - 1, after)
+        rows = rows[rows >= 0]
+        if len(rows) == 0:
+            return []
+        
+        with stage("indicators"):
+            # 只需計算到最後一個要求的日期
+            sliced = PriceMatrix(dates[:rows[-1] + 1], matrix.codes, matrix.close[:rows[-1] + 1])
+            matched, pct, close = await asyncio.to_thread(
+                ConvergenceBacktest.point_in_time,
+                sliced, ma_periods, convergence_pct, convergence_days, rows
             )
-            
-            if is_converged:
-                # 取得最新收盤價
-                close = round(df['Close'].iloc[-1], 2) if len(df) > 0 else None
-                
-                return {
-                    "code": code,
-                    "name": name,
-                    "market": market,
-                    "close": close,
-                    "convergence_pct": current_pct
-                }
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error screening {code}: {e}")
-            return None
+        
+        stock_map = {stock["code"]: stock for stock in stocks}
+        history = []
+        for k, row in enumerate(rows):
+            results = []
+            for col in np.flatnonzero(matched[k]):
+                stock = stock_map[matrix.codes[col]]
+                results.append({
+                    "code": stock["code"],
+                    "name": stock["name"],
+                    "market": stock["market"],
+                    "close": round(float(close[k, col]), 2),
+                    "convergence_pct": round(float(pct[k, col]), 2)
+                })
+            results.sort(key=lambda x: x["convergence_pct"])
+            history.append({"date": dates[row].strftime("%Y-%m-%d"), "results": results})
+        
+        logger.info(f"歷史篩選完成: {len(history)} 個交易日")
+        return history
     
-    async def screen(
+    async def backtest(
         self,
         ma_periods: List[int] = [5, 10, 20, 60],
         convergence_pct: float = 3.0,
         convergence_days: int = 5,
         market: str = "all",
-        interval: str = "1d"
+        years: int = 5,
+        horizons: List[int] = list(FORWARD_HORIZONS),
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        entries_only: bool = False
+    ) -> Dict:
+        """
+        回測糾結訊號：過去 years 年內每個符合條件的 (股票, 日期) 之後的報酬
+        
+        日K 以批次下載取得並寫入本地儲存，之後的回測直接讀取本地歷史。
+        
+        Returns:
+            ConvergenceBacktest.run 的結果，events 另附股票名稱
+        """
+        stocks = self.stock_service.get_stock_list(market=market, limit=None)
+        frames = await self.stock_service.prefetch_histories(
+            [s["code"] for s in stocks], days=years * 365
+        )
+        
+        logger.info(f"開始回測 {len(frames)} 支股票 {years} 年: 均線={ma_periods}, "
+                    f"幅度<={convergence_pct}%, 天數={convergence_days}")
+        
+        with stage("backtest"):
+            matrix = PriceMatrix.from_frames(frames)
+            # 全市場多年的陣列運算需時數秒，移到執行緒避免阻塞事件迴圈 (numpy 運算會釋放 GIL)
+            result = await asyncio.to_thread(
+                ConvergenceBacktest.run, matrix, ma_periods, convergence_pct, convergence_days,
+                horizons, start, end, entries_only
+            )
+        
+        names = {stock["code"]: stock["name"] for stock in stocks}
+        for event in result["events"]:
+            event["name"] = names.get(event["code"], event["code"])
+        
+        logger.info(f"回測完成，共 {result['signals']} 個訊號")
+        return result
+    
+    async def screen_multi(
+        self,
+        ma_periods: List[int] = [5, 10, 20, 60],
+        convergence_pct: float = 3.0,
+        convergence_days: int = 5,
+        market: str = "all",
+        intervals: List[str] = ["1h", "1d"]
     ) -> List[Dict]:
         """
-        批量篩選均線糾結股票
+        多週期同時篩選：所有指定週期都符合糾結條件的股票
+        
+        每支股票的分鐘 K 與日K 各只抓取一次，其他週期在本地合併。
         
         Args:
-            ma_periods: 要檢查的均線週期列表
-            convergence_pct: 糾結幅度百分比閾值
-            convergence_days: 連續糾結天數
-            market: all, TW, TWO
+            intervals: 要同時符合的週期，如 ["1h", "1d"]
         
         Returns:
-            符合條件的股票列表
+            符合條件的股票列表，intervals 欄位為各週期的糾結幅度，
+            convergence_pct 為其中最大者
         """
-        # 取得股票列表
-        stocks = self.stock_service.get_stock_list(market=market, limit=500)
+        stocks = self.stock_service.get_stock_list(market=market, limit=None)
+        intervals = list(dict.fromkeys(intervals))
         
-        logger.info(f"開始篩選 {len(stocks)} 支股票...")
-        logger.info(f"條件: 週期={interval}, 均線={ma_periods}, 幅度<={convergence_pct}%, 天數={convergence_days}")
+        logger.info(f"開始多週期篩選 {len(stocks)} 支股票: {intervals}")
+        
+        # 日K 系列先以批次下載寫入標準歷史，之後的合併直接命中快取
+        if any(base_interval(i) == "1d" for i in intervals):
+            await self.stock_service.prefetch_histories([s["code"] for s in stocks])
         
-        # 並行處理（控制併發數量避免過載）
-        semaphore = asyncio.Semaphore(10)
+        tv_service = get_tv_service()
+        required_bars = self._required_bars(ma_periods, convergence_days)
+        semaphore = asyncio.Semaphore(self.stock_service.executor.max_workers)
         
-        async def screen_with_limit(stock):
+        async def fetch_with_limit(stock):
             async with semaphore:
-                return await self.screen_single(
-                    code=stock["code"],
-                    name=stock["name"],
-                    market=stock["market"],
-                    ma_periods=ma_periods,
-                    convergence_pct=convergence_pct,
-                    convergence_days=convergence_days,
-                    interval=interval
+                return await tv_service.get_timeframes(
+                    stock["code"], stock["market"], intervals, n_bars=required_bars
                 )
         
-        # 執行並行篩選
-        tasks = [screen_with_limit(stock) for stock in stocks]
-        results = await asyncio.gather(*tasks)
+        all_frames = await asyncio.gather(*[fetch_with_limit(stock) for stock in stocks])
         
-        # 過濾出符合條件的股票
-        matched = [r for r in results if r is not None]
+        # 每個週期各自以向量化引擎計算，再取交集
+        per_interval = {}
+        for interval in intervals:
+            frames = {
+                stock["code"]: timeframes[interval]
+                for stock, timeframes in zip(stocks, all_frames)
+                if interval in timeframes
+            }
+            with stage("indicators"):
+                matrix = PriceMatrix.from_frames(frames)
+                is_converged, current_pct, last_close = self.engine.check_convergence(
+                    matrix, ma_periods, convergence_pct, convergence_days
+                )
+            per_interval[interval] = {
+                matrix.codes[i]: (float(current_pct[i]), last_close[i])
+                for i in np.flatnonzero(is_converged)
+            }
+        
+        matched = []
+        for stock in stocks:
+            hits = [per_interval[i].get(stock["code"]) for i in intervals]
+            if any(hit is None for hit in hits):
+                continue
+            close = hits[0][1]
+            pcts = {interval: hit[0] for interval, hit in zip(intervals, hits)}
+            matched.append({
+                "code": stock["code"],
+                "name": stock["name"],
+                "market": stock["market"],
+                "close": round(float(close), 2) if not np.isnan(close) else None,
+                "convergence_pct": max(pcts.values()),
+                "intervals": pcts
+            })
         
-        # 按糾結幅度排序（幅度小的排前面）
         matched.sort(key=lambda x: x.get("convergence_pct", 100))
         
-        logger.info(f"篩選完成，共 {len(matched)} 支股票符合條件")
+        logger.info(f"多週期篩選完成，共 {len(matched)} 支股票符合條件")
         
         return matched
+    
+    async def screen_stream(
+        self,
+        ma_periods: List[int] = [5, 10, 20, 60],
+        convergence_pct: float = 3.0,
+        convergence_days: int = 5,
+        market: str = "all",
+        interval: str = "1d",
+        if_none_match: Optional[str] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        串流版批量篩選：每載入一批 K 線即檢查該批並立即送出符合條件的股票
+        
+        日K 每批建立一個糾結索引分片並立即查詢，第一筆結果不需等待全市場載入完成；
+        全部載入後分片合併成與 screen_versioned 共用的索引，之後調整門檻只需二分搜尋。
+        其他週期逐檔載入，以增量均線狀態檢查 (與 screen_versioned 共用)。
+        資料版本隨批次累計，
+        結果快取與 ETag 只套用在最後的事件：資料版本與上次相同條件一致時 done 的 cached 為 true，
+        若 if_none_match 與結果的 ETag 相符則以 not_modified 取代 done。
+        (載入前即可判斷的快照由呼叫端處理，見 main.snapshot_events)
+        
+        事件類型：
+            start: {"type": "start", "total": N}
+            match: {"type": "match", "stock": {...}} 找到符合條件的股票 (依找到的順序)
+            progress: {"type": "progress", "scanned": k, "total": N, "errors": e} 每批的 match 之後送出
+            not_modified: {"type": "not_modified", "etag": ...} 結果與用戶端快取相同
+            done: {"type": "done", "results": [...], "scanned": N, "errors": e, "etag": ..., "cached": bool}
+                  依糾結幅度排序，與 screen() 相同
+        
+        產生器被關閉時 (如客戶端斷線) 會取消尚未完成的工作。
+        """
+        stocks = self.stock_service.get_stock_list(market=market, limit=None)
+        stock_map = {stock["code"]: stock for stock in stocks}
+        total = len(stocks)
+        key = snapshot_key({
+            "ma_periods": ma_periods,
+            "convergence_pct": convergence_pct,
+            "convergence_days": convergence_days,
+            "market": market,
+            "interval": interval,
+        })
+        
+        logger.info(f"開始串流篩選 {total} 支股票...")
+        yield {"type": "start", "total": total}
+        
+        # 以與 screen_versioned 相同的天數載入，讓兩者的資料版本與結果快取一致
+        index_days = max(convergence_days, INDEX_MAX_DAYS)
+        versions = DataVersion()
+        frames = {}
+        shards = []
+        matched = []
+        scanned = 0
+        errors = 0
+        # aclosing: 客戶端斷線時立即關閉內層產生器，取消尚未完成的抓取
+        async with aclosing(self._iter_frames(stocks, ma_periods, index_days, interval)) as batches:
+            async for loaded, size in batches:
+                versions.update(loaded)
+                frames.update(loaded)
+                if loaded and interval != "1d":
+                    # 非日K 逐檔載入，以增量均線狀態檢查 (只需餵入新的 K 棒)
+                    found = self._match_incremental(
+                        loaded, stock_map, list(key[0]), convergence_pct, convergence_days, interval
+                    )
+                elif loaded:
+                    # 每批建立一個索引分片並立即查詢，全部載入後合併成完整索引
+                    shard = self._index_shard(loaded, key[0], index_days)
+                    shards.append(shard)
+                    found = self._matches(
+                        ConvergenceIndex(*shard), stock_map, convergence_pct, convergence_days
+                    ) if convergence_days > 0 else []
+                else:
+                    found = []
+                for result in found:
+                    yield {"type": "match", "stock": result}
+                matched.extend(found)
+                scanned += size
+                # 抓不到資料的股票計為錯誤
+                errors += size - len(loaded)
+                yield {"type": "progress", "scanned": scanned, "total": total, "errors": errors}
+        
+        version = versions.hexdigest()
+        if shards:
+            self._merge_shards(key, version, frames, shards, index_days)
+        entry = self.results.get(key, version)
+        cached = entry is not None
+        if cached:
+            logger.info(f"篩選結果未變動 (資料版本 {version})，使用快取")
+        else:
+            matched.sort(key=lambda x: (x.get("convergence_pct", 100), x["code"]))
+            entry = self.results.put(key, version, matched)
+            logger.info(f"串流篩選完成，共 {len(matched)} 支股票符合條件")
+        
+        if etag_matches(if_none_match, entry["etag"]):
+            yield {"type": "not_modified", "etag": entry["etag"]}
+            return
+        yield {
+            "type": "done", "results": entry["results"], "scanned": scanned,
+            "errors": errors, "etag": entry["etag"], "cached": cached
+        }
+    
+    @staticmethod
+    def _index_shard(
+        frames: Dict[str, pd.DataFrame],
+        ma_periods: Tuple[int, ...],
+        max_days: int
+    ) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """計算一批 K 線的糾結索引內容 (codes, window_max, current_pct, last_close)"""
+        with stage("indicators"):
+            matrix = PriceMatrix.from_frames(frames)
+            return (list(matrix.codes), *ConvergenceIndex.compute(matrix.close, list(ma_periods), max_days))
+    
+    def _merge_shards(
+        self,
+        key: Tuple,
+        version: str,
+        frames: Dict[str, pd.DataFrame],
+        shards: List[Tuple],
+        max_days: int
+    ) -> None:
+        """
+        將串流各批的索引分片合併成 (均線組合, 市場, 週期) 的糾結索引並放入快取
+        
+        之後調整幅度或天數門檻的篩選只需二分搜尋；此資料版本已有索引時略過。
+        """
+        index_key = (key[0], key[3], key[4])
+        entry = self._indexes.get(index_key)
+        if entry is not None and entry[0] == version and entry[1].max_days >= max_days:
+            self._indexes.move_to_end(index_key)
+            return
+        
+        with stage("indicators"):
+            index = ConvergenceIndex.from_shards(shards, max_days)
+            matrix = self._price_matrix(key[3], key[4], version, frames)
+            self._publish_ma(key[4], version, frames, matrix, key[0])
+        self._remember_index(index_key, version, index)
+    
+    async def _iter_frames(
+        self,
+        stocks: List[Dict],
+        ma_periods: List[int],
+        convergence_days: int,
+        interval: str
+    ) -> AsyncIterator[Tuple[Dict[str, pd.DataFrame], int]]:
+        """
+        分批載入歷史數據，每完成一批即產生 (該批取得的 {股票代碼: DataFrame}, 該批股票數)
+        
+        日K 依批次大小分組下載；其他週期逐檔抓取。產生器被關閉時取消尚未完成的抓取。
+        """
+        tv_service = get_tv_service()
+        required_bars = self._required_bars(ma_periods, convergence_days)
+        semaphore = asyncio.Semaphore(self.stock_service.executor.max_workers)
+        
+        async def load(group: List[Dict]) -> Tuple[Dict[str, pd.DataFrame], int]:
+            try:
+                if interval == "1d":
+                    frames = await self.stock_service.prefetch_histories([s["code"] for s in group])
+                else:
+                    stock = group[0]
+                    async with semaphore:
+                        df = await tv_service.get_kline_data(
+                            stock["code"], stock["market"], interval, n_bars=required_bars
+                        )
+                    frames = {stock["code"]: df} if df is not None and not df.empty else {}
+            except Exception as e:
+                logger.error(f"Error loading {len(group)} stocks: {e}")
+                frames = {}
+            return frames, len(group)
+        
+        size = BULK_CHUNK_SIZE if interval == "1d" else 1
+        tasks = [
+            asyncio.ensure_future(load(stocks[i:i + size]))
+            for i in range(0, len(stocks), size)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _load_frames(
+        self,
+        stocks: List[Dict],
+        ma_periods: List[int],
+        convergence_days: int,
+        interval: str
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        取得所有股票的歷史數據
+        
+        Returns:
+            {股票代碼: DataFrame}，抓不到資料的股票不會出現在結果中
+        """
+        # 日K 以批次下載一次取得
+        if interval == "1d":
+            return await self.stock_service.prefetch_histories([s["code"] for s in stocks])
+        
+        tv_service = get_tv_service()
+        required_bars = self._required_bars(ma_periods, convergence_days)
+        
+        # 並行處理（併發數量與抓取執行緒池大小一致，避免過載）
+        semaphore = asyncio.Semaphore(self.stock_service.executor.max_workers)
+        
+        async def fetch_with_limit(stock):
+            async with semaphore:
+                return await tv_service.get_kline_data(
+                    stock["code"], stock["market"], interval, n_bars=required_bars
+                )
+        
+        dfs = await asyncio.gather(*[fetch_with_limit(stock) for stock in stocks])
+        
+        return {
+            stock["code"]: df
+            for stock, df in zip(stocks, dfs)
+            if df is not None and not df.empty
+        }
+    
+    @staticmethod
+    def _required_bars(ma_periods: List[int], convergence_days: int) -> int:
+        """根據週期決定取多少 K 棒 (確保足夠計算最長均線 + 糾結天數)"""
+        max_period = max(ma_periods) if ma_periods else 60
+        return max_period + convergence_days + 20
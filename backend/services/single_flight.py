@@ -0,0 +1,117 @@
+"""
+請求合併 (single-flight) - 相同鍵值的並行抓取只執行一次
+
+多個使用者同時開啟熱門股票、或兩次篩選重疊時，
+後到的呼叫端直接等待已在進行中的抓取結果，不再重複向上游發出請求。
+
+共用的工作在自己的 context 中執行，其抓取通道與截止時間取所有等待者中
+優先權最高的通道與最早的截止時間 (見 fetch_priority() / fetch_deadline())，
+後加入的 K 線請求不會因為搭上篩選的抓取而被排在背景通道。
+所有等待者都離開 (取消或逾時) 時取消共用的工作。
+"""
+import asyncio
+import contextvars
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from .fetch_executor import current_deadline, set_deadline
+from .fetch_scheduler import LANES, current_lane, set_lane
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """進行中的共用工作與其等待者"""
+
+    def __init__(self, fn: Callable[[], Awaitable[Any]], deadline: Optional[float], lane: str):
+        self.context = contextvars.copy_context()
+        self.deadline = deadline
+        self.lane = lane
+        self.waiters = 0
+        self.task = asyncio.get_running_loop().create_task(fn(), context=self.context)
+
+    def join(self, deadline: Optional[float], lane: str) -> None:
+        """
+        加入等待者，必要時提高通道優先權並提前截止時間
+
+        只影響工作之後送出的抓取；已在排隊或執行中的抓取維持原設定。
+        """
+        if LANES.index(lane) < LANES.index(self.lane):
+            self.lane = lane
+            self.context.run(set_lane, lane)
+        if deadline is not None and (self.deadline is None or deadline < self.deadline):
+            self.deadline = deadline
+            self.context.run(set_deadline, deadline)
+
+
+class SingleFlight:
+    """以鍵值合併並行中的非同步工作"""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, _Flight] = {}
+        self._calls = 0
+        self._executions = 0
+        self._shared = 0
+        self._abandoned = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        執行 fn()，若相同 key 已在進行中則等待其結果
+
+        共用的工作以 shield 保護：單一呼叫端被取消 (如客戶端斷線)
+        不會中斷其他仍在等待的呼叫端；最後一個呼叫端離開時才取消工作。
+        """
+        self._calls += 1
+        deadline, lane = current_deadline(), current_lane()
+        flight = self._in_flight.get(key)
+
+        if flight is None:
+            self._executions += 1
+            flight = _Flight(fn, deadline, lane)
+            self._in_flight[key] = flight
+            flight.task.add_done_callback(lambda task: self._on_done(key, flight, task))
+        else:
+            self._shared += 1
+            flight.join(deadline, lane)
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # 沒有人需要結果了：取消工作並讓之後的呼叫重新開始
+                self._abandoned += 1
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+
+    def _on_done(self, key: Hashable, flight: _Flight, task: asyncio.Task) -> None:
+        self._forget(key, flight)
+        # 所有呼叫端都已取消時仍要取出例外，避免 "exception was never retrieved"
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Shared fetch {key} failed: {task.exception()}")
+
+    def stats(self) -> Dict:
+        """取得合併統計：saved 為省下的重複抓取次數，abandoned 為因無人等待而取消的工作數"""
+        return {
+            "in_flight": len(self._in_flight),
+            "calls": self._calls,
+            "executions": self._executions,
+            "saved": self._shared,
+            "abandoned": self._abandoned,
+        }
+
+
+# 單例模式
+_flight = None
+
+def get_single_flight() -> SingleFlight:
+    """取得 SingleFlight 單例"""
+    global _flight
+    if _flight is None:
+        _flight = SingleFlight()
+    return _flight
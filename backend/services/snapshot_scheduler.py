@@ -0,0 +1,346 @@
+"""
+篩選快照排程器 - 背景預先計算常用篩選條件的結果
+
+日K 在盤中才會變動，每次 `/api/screen` 都重新掃描全市場並不必要。
+排程器在盤中依固定間隔、以及收盤後各執行一次，
+針對預設條件與最常被查詢的條件重新篩選並保存為帶版本的快照；
+符合快照的請求可直接回傳結果與 as_of 時間，其他條件仍走即時篩選。
+
+多 worker 時只有領導者執行排程；指定 directory (共用的儲存目錄) 時快照另寫成 JSON 檔，
+其他 worker 查詢時讀取領導者寫入的最新版本。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import Counter
+from datetime import time as dtime
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import pandas as pd
+
+from .fetch_executor import fetch_deadline
+from .fetch_scheduler import fetch_priority, BACKGROUND
+from .ohlcv_store import TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+# 是否啟動背景排程
+SNAPSHOT_ENABLED = os.environ.get("SNAPSHOT_ENABLED", "1") == "1"
+# 盤中更新間隔 (分鐘)，0 代表盤中不更新
+SNAPSHOT_INTRADAY_MINUTES = int(os.environ.get("SNAPSHOT_INTRADAY_MINUTES", "15"))
+# 收盤後更新時間：需晚於收盤 + 快取有效時間，確保抓到收盤後的資料
+SNAPSHOT_AFTER_CLOSE = os.environ.get("SNAPSHOT_AFTER_CLOSE", "14:30")
+# 除預設條件外，額外預先計算的熱門條件數量
+SNAPSHOT_TOP_N = int(os.environ.get("SNAPSHOT_TOP_N", "3"))
+# 記錄查詢次數的參數組上限 (為 top_n 的倍數)；參數來自用戶端，不可無限增長
+SNAPSHOT_TRACKED_FACTOR = 16
+# 單次預先篩選的抓取截止時間 (秒)
+SNAPSHOT_DEADLINE = float(os.environ.get("SNAPSHOT_DEADLINE", "600"))
+# 排程執行需要的時間寬限，避免更新進行中時快照被視為過期
+SNAPSHOT_GRACE = pd.Timedelta(minutes=10)
+
+# 台股交易時段 (台北時間)
+SESSION_OPEN = dtime(9, 0)
+SESSION_CLOSE = dtime(13, 30)
+
+DEFAULT_PARAMS = {
+    "ma_periods": [5, 10, 20, 60],
+    "convergence_pct": 3.0,
+    "convergence_days": 5,
+    "market": "all",
+    "interval": "1d",
+}
+
+
+def snapshot_key(params: Dict) -> Tuple:
+    """將篩選參數正規化為快照鍵值 (均線順序、重複不影響結果)"""
+    return (
+        tuple(sorted(set(int(p) for p in params["ma_periods"]))),
+        round(float(params["convergence_pct"]), 4),
+        int(params["convergence_days"]),
+        params.get("market") or "all",
+        params.get("interval") or "1d",
+    )
+
+
+def next_run_time(
+    now: pd.Timestamp,
+    intraday_minutes: int = SNAPSHOT_INTRADAY_MINUTES,
+    after_close: str = SNAPSHOT_AFTER_CLOSE
+) -> pd.Timestamp:
+    """
+    計算 now 之後下一次排程時間 (只在週一至週五執行)
+
+    盤中自開盤起每 intraday_minutes 分鐘一次，收盤後於 after_close 再執行一次。
+    """
+    now = now.tz_convert(TIMEZONE)
+    close_hour, close_minute = (int(part) for part in after_close.split(":"))
+
+    for offset in range(8):
+        day = now.normalize() + pd.Timedelta(days=offset)
+        if day.weekday() >= 5:
+            continue
+
+        candidates = []
+        if intraday_minutes > 0:
+            slot = day + pd.Timedelta(hours=SESSION_OPEN.hour, minutes=SESSION_OPEN.minute)
+            session_end = day + pd.Timedelta(hours=SESSION_CLOSE.hour, minutes=SESSION_CLOSE.minute)
+            while slot <= session_end:
+                candidates.append(slot)
+                slot += pd.Timedelta(minutes=intraday_minutes)
+        candidates.append(day + pd.Timedelta(hours=close_hour, minutes=close_minute))
+
+        for candidate in sorted(candidates):
+            if candidate > now:
+                return candidate
+
+    raise ValueError("No scheduled run within a week")
+
+
+class SnapshotScheduler:
+    """定期預先計算篩選結果並保存最新版本的快照"""
+
+    def __init__(
+        self,
+        screener,
+        top_n: int = SNAPSHOT_TOP_N,
+        intraday_minutes: int = SNAPSHOT_INTRADAY_MINUTES,
+        after_close: str = SNAPSHOT_AFTER_CLOSE,
+        max_tracked: Optional[int] = None,
+        directory: Optional[str] = None
+    ):
+        """
+        Args:
+            max_tracked: 記錄查詢次數的參數組上限，預設為 top_n * 16
+            directory: 快照檔目錄 (各 worker 共用)，None 代表只保存在記憶體
+        """
+        self.screener = screener
+        self.top_n = top_n
+        self.max_tracked = max_tracked or max(top_n, 1) * SNAPSHOT_TRACKED_FACTOR
+        self.intraday_minutes = intraday_minutes
+        self.after_close = after_close
+        self.directory = directory
+        self._snapshots: Dict[Hashable, Dict] = {}
+        # 已讀取的快照檔狀態 (修改時間, 大小, inode)，檔案未變時不重新讀取
+        self._loaded: Dict[Hashable, Tuple[int, int, int]] = {}
+        self._requests: Counter = Counter()
+        self._params: Dict[Hashable, Dict] = {}
+        # 版本號延續既有快照檔，領導者重啟或換手後 ETag 不會與舊版本重複
+        self._version = self._max_stored_version()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._hits = 0
+        self._misses = 0
+
+    def lookup(self, params: Dict, now: Optional[pd.Timestamp] = None) -> Optional[Dict]:
+        """
+        查詢符合參數且仍有效的快照，並記錄此參數的查詢次數
+
+        快照在下一次排程時間 (加上寬限) 之前都有效；
+        排程停止或更新失敗時快照會自然過期，請求改走即時篩選。
+
+        Returns:
+            {"results", "as_of", "version"}，沒有有效快照時回傳 None
+        """
+        key = snapshot_key(params)
+        self._track(key, params)
+
+        snapshot = self._load(key)
+        now = now or pd.Timestamp.now(tz=TIMEZONE)
+        if snapshot is None or now >= self._expires(snapshot["as_of"]):
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        return snapshot
+
+    def _track(self, key: Hashable, params: Dict) -> None:
+        """
+        記錄一次查詢
+
+        超過 max_tracked 組時只保留查詢次數最多的一半並將次數減半 (衰減)，
+        不再被查詢的舊條件會逐漸被新的熱門條件超越。
+        """
+        self._requests[key] += 1
+        self._params.setdefault(key, dict(params))
+        if len(self._requests) <= self.max_tracked:
+            return
+
+        kept = self._requests.most_common(self.max_tracked // 2)
+        self._requests = Counter({k: count / 2 for k, count in kept})
+        self._params = {k: self._params[k] for k in self._requests}
+
+    def _expires(self, as_of: pd.Timestamp) -> pd.Timestamp:
+        return next_run_time(as_of, self.intraday_minutes, self.after_close) + SNAPSHOT_GRACE
+
+    def store(
+        self,
+        params: Dict,
+        results: List[Dict],
+        as_of: Optional[pd.Timestamp] = None
+    ) -> Dict:
+        """保存一份快照，版本號遞增"""
+        self._version += 1
+        snapshot = {
+            "results": results,
+            "as_of": as_of or pd.Timestamp.now(tz=TIMEZONE),
+            "version": self._version,
+        }
+        key = snapshot_key(params)
+        self._snapshots[key] = snapshot
+        if self.directory is not None:
+            try:
+                self._write(key, snapshot)
+            except OSError as e:
+                logger.error(f"Failed to persist snapshot {key}: {e}")
+        return snapshot
+
+    def _path(self, key: Hashable) -> str:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _write(self, key: Hashable, snapshot: Dict) -> None:
+        """以暫存檔 + rename 寫入，讀取端不會看到寫到一半的檔案"""
+        os.makedirs(self.directory, exist_ok=True)
+        payload = {
+            "key": [list(key[0]), *key[1:]],
+            "results": snapshot["results"],
+            "as_of": snapshot["as_of"].isoformat(),
+            "version": snapshot["version"],
+        }
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, default=float)
+            os.replace(tmp, path)
+            self._loaded[key] = self._signature(path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _load(self, key: Hashable) -> Optional[Dict]:
+        """取得快照；有快照檔且比記憶體中的新時改用檔案內容 (其他 worker 寫入)"""
+        if self.directory is None:
+            return self._snapshots.get(key)
+
+        path = self._path(key)
+        try:
+            signature = self._signature(path)
+            if self._loaded.get(key) != signature:
+                with open(path, encoding="utf-8") as f:
+                    payload = json.load(f)
+                self._snapshots[key] = {
+                    "results": payload["results"],
+                    "as_of": pd.Timestamp(payload["as_of"]).tz_convert(TIMEZONE),
+                    "version": payload["version"],
+                }
+                self._loaded[key] = signature
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Failed to read snapshot {path}: {e}")
+        return self._snapshots.get(key)
+
+    @staticmethod
+    def _signature(path: str) -> Tuple[int, int, int]:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _max_stored_version(self) -> int:
+        if self.directory is None or not os.path.isdir(self.directory):
+            return 0
+        version = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    version = max(version, int(json.load(f)["version"]))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Failed to read snapshot {name}: {e}")
+        return version
+
+    def tracked_params(self) -> List[Dict]:
+        """預先計算的參數組：預設條件加上查詢次數最多的 top_n 組"""
+        default_key = snapshot_key(DEFAULT_PARAMS)
+        params = [DEFAULT_PARAMS]
+        for key, _ in self._requests.most_common():
+            if len(params) > self.top_n:
+                break
+            if key != default_key:
+                params.append(self._params[key])
+        return params
+
+    async def refresh_all(self) -> int:
+        """
+        重新篩選所有預先計算的參數組
+
+        Returns:
+            成功更新的快照數量
+        """
+        async with self._lock:
+            refreshed = 0
+            for params in self.tracked_params():
+                try:
+                    with fetch_deadline(SNAPSHOT_DEADLINE), fetch_priority(BACKGROUND):
+                        results = await self.screener.screen(**params)
+                except Exception as e:
+                    logger.error(f"Snapshot refresh failed for {snapshot_key(params)}: {e}")
+                    continue
+                snapshot = self.store(params, results)
+                refreshed += 1
+                logger.info(
+                    f"快照已更新 {snapshot_key(params)} v{snapshot['version']}，共 {len(results)} 支"
+                )
+            return refreshed
+
+    async def _run(self) -> None:
+        """啟動時先更新一次，之後依排程時間更新"""
+        while True:
+            try:
+                await self.refresh_all()
+            except Exception as e:
+                logger.error(f"Snapshot scheduler error: {e}")
+
+            now = pd.Timestamp.now(tz=TIMEZONE)
+            wait = (next_run_time(now, self.intraday_minutes, self.after_close) - now).total_seconds()
+            await asyncio.sleep(max(wait, 0))
+
+    def start(self) -> None:
+        """在目前的事件迴圈啟動背景排程"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """停止背景排程"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        """取得快照與排程統計"""
+        now = pd.Timestamp.now(tz=TIMEZONE)
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "hits": self._hits,
+            "misses": self._misses,
+            "next_run": next_run_time(now, self.intraday_minutes, self.after_close).isoformat(),
+            "snapshots": [
+                {
+                    "key": [list(key[0]), *key[1:]],
+                    "version": snapshot["version"],
+                    "as_of": snapshot["as_of"].isoformat(),
+                    "results": len(snapshot["results"]),
+                    "requests": round(self._requests.get(key, 0), 1),
+                }
+                for key, snapshot in self._snapshots.items()
+            ],
+        }
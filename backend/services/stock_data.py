@@ -1,110 +1,71 @@
 """
-股票數據服務 - 使用 yfinance 抓取台股資料
+股票數據服務 - 經由資料來源 (預設 yfinance) 抓取台股資料
 """
-import yfinance as yf
 import pandas as pd
 from typing import List, Dict, Optional
-from datetime import datetime, timedelta
+import asyncio
 import logging
+import os
 
-logger = logging.getLogger(__name__)
+from .data_provider import DataProvider, get_data_provider
+from .fetch_executor import FetchExecutor, get_fetch_executor
+from .frame_cache import FrameCache, get_frame_cache
+from .history_cache import HistoryCache
+from .ohlcv_store import (
+    OHLCVStore, get_ohlcv_store, has_corporate_actions, TIMEZONE
+)
+from .kline_serializer import build_kline_payload
+from .ma_cache import MovingAverageCache
+from .metrics import stage
+from .symbol_registry import SymbolRegistry, get_symbol_registry
 
+logger = logging.getLogger(__name__)
 
-# 常用台股列表（精選約 200 支流動性較高的股票）
-# 完整列表可從證交所網站抓取，這裡先用精選列表
-POPULAR_STOCKS = {
-    # 上市 (TW)
-    "TW": [
-        ("2330", "台積電"), ("2317", "鴻海"), ("2454", "聯發科"),
-        ("2308", "台達電"), ("2881", "富邦金"), ("2882", "國泰金"),
-        ("2891", "中信金"), ("2886", "兆豐金"), ("2884", "玉山金"),
-        ("2885", "元大金"), ("2303", "聯電"), ("2412", "中華電"),
-        ("3711", "日月光投控"), ("2002", "中鋼"), ("1301", "台塑"),
-        ("1303", "南亞"), ("1326", "台化"), ("2207", "和泰車"),
-        ("2912", "統一超"), ("2382", "廣達"), ("2357", "華碩"),
-        ("2395", "研華"), ("3008", "大立光"), ("2379", "瑞昱"),
-        ("2327", "國巨"), ("3034", "聯詠"), ("2345", "智邦"),
-        ("6415", "矽力-KY"), ("3037", "欣興"), ("2492", "華新科"),
-        ("2603", "長榮"), ("2609", "陽明"), ("2615", "萬海"),
-        ("2618", "長榮航"), ("2610", "華航"), ("9921", "巨大"),
-        ("2105", "正新"), ("1102", "亞泥"), ("1101", "台泥"),
-        ("2408", "南亞科"), ("3231", "緯創"), ("2356", "英業達"),
-        ("2301", "光寶科"), ("2353", "宏碁"), ("2324", "仁寶"),
-        ("4904", "遠傳"), ("3045", "台灣大"), ("2880", "華南金"),
-        ("2890", "永豐金"), ("2883", "開發金"), ("2887", "台新金"),
-        ("2892", "第一金"), ("5880", "合庫金"), ("5871", "中租-KY"),
-        ("2801", "彰銀"), ("2834", "臺企銀"), ("2823", "中壽"),
-        ("2347", "聯強"), ("2474", "可成"), ("3481", "群創"),
-        ("2409", "友達"), ("2377", "微星"), ("2392", "正崴"),
-        ("2344", "華邦電"), ("6669", "緯穎"), ("3443", "創意"),
-        ("2049", "上銀"), ("1476", "儒鴻"), ("9904", "寶成"),
-        ("2201", "裕隆"), ("2227", "裕日車"), ("9910", "豐泰"),
-        ("1216", "統一"), ("1210", "大成"), ("2915", "潤泰全"),
-        ("9914", "美利達"), ("8046", "南電"), ("6239", "力成"),
-        ("3706", "神達"), ("2360", "致茂"), ("2404", "漢唐"),
-        ("6505", "台塑化"), ("6176", "瑞儀"), ("2059", "川湖"),
-        ("2354", "鴻準"), ("3653", "健策"), ("2376", "技嘉"),
-        ("2385", "群光"), ("5269", "祥碩"), ("3044", "健鼎"),
-        ("6278", "台表科"), ("2458", "義隆"), ("3533", "嘉澤"),
-    ],
-    # 上櫃 (TWO)
-    "TWO": [
-        ("6488", "環球晶"), ("5274", "信驊"), ("3105", "穩懋"),
-        ("6409", "旭隼"), ("8454", "富邦媒"), ("6533", "晶心科"),
-        ("3587", "閎康"), ("6510", "精測"), ("6770", "力積電"),
-        ("5289", "宜鼎"), ("6472", "保瑞"), ("4966", "譜瑞-KY"),
-        ("6547", "高端疫苗"), ("6223", "旺矽"), ("5388", "中磊"),
-        ("3163", "波若威"), ("6411", "晶焜"), ("8016", "矽創"),
-        ("6414", "樺漢"), ("3552", "同致"), ("4919", "新唐"),
-        ("6285", "啟碁"), ("3227", "原相"), ("6452", "康友-KY"),
-        ("4943", "康控-KY"), ("5309", "系統電"), ("8210", "勤誠"),
-        ("6477", "安集"), ("3530", "晶相光"), ("4977", "眾達-KY"),
-    ]
-}
+# 批次下載時每次請求的股票數量
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "50"))
 
 
 class StockDataService:
     """股票數據服務"""
     
-    def __init__(self):
-        self.cache = {}
-        self.cache_time = {}
-        self.cache_duration = timedelta(minutes=30)
+    def __init__(
+        self,
+        executor: Optional[FetchExecutor] = None,
+        store: Optional[OHLCVStore] = None,
+        cache: Optional[FrameCache] = None,
+        registry: Optional[SymbolRegistry] = None,
+        provider: Optional[DataProvider] = None
+    ):
+        self.executor = executor or get_fetch_executor()
+        self.registry = registry or get_symbol_registry()
+        self.store = store or get_ohlcv_store()
+        self.cache = cache or get_frame_cache()
+        self.provider = provider or get_data_provider()
+        self.history = HistoryCache(self.executor, self.store, self.cache, provider=self.provider)
+        # 篩選與 K 線圖共用的唯讀均線
+        self.ma_cache = MovingAverageCache(self.cache)
     
     def get_stock_list(
         self, 
         market: str = "all", 
-        limit: int = 100
+        limit: Optional[int] = 100,
+        industry: Optional[str] = None
     ) -> List[Dict]:
         """
         取得股票列表
         
         Args:
             market: all, TW, TWO
-            limit: 回傳筆數限制
+            limit: 回傳筆數限制，None 代表全部
+            industry: 只列出此產業類別
         
         Returns:
             股票列表
         """
-        stocks = []
-        
-        if market in ("all", "TW"):
-            for code, name in POPULAR_STOCKS["TW"]:
-                stocks.append({
-                    "code": code,
-                    "name": name,
-                    "market": "TW"
-                })
-        
-        if market in ("all", "TWO"):
-            for code, name in POPULAR_STOCKS["TWO"]:
-                stocks.append({
-                    "code": code,
-                    "name": name,
-                    "market": "TWO"
-                })
-        
-        return stocks[:limit]
+        stocks = self.registry.list(market=market, industry=industry)
+        if limit is not None:
+            stocks = stocks[:limit]
+        return [dict(stock) for stock in stocks]
     
     def get_yfinance_symbol(self, code: str, market: str = None) -> str:
         """
@@ -112,46 +73,24 @@ class StockDataService:
         
         Args:
             code: 股票代碼
-            market: TW 或 TWO
+            market: TW 或 TWO，未指定時由註冊表判斷 (查無代碼預設上市)
         
         Returns:
             yfinance 格式代碼
         """
-        if market:
-            suffix = ".TW" if market == "TW" else ".TWO"
-            return f"{code}{suffix}"
-        
-        # 自動判斷市場
-        for c, _ in POPULAR_STOCKS["TW"]:
-            if c == code:
-                return f"{code}.TW"
-        
-        for c, _ in POPULAR_STOCKS["TWO"]:
-            if c == code:
-                return f"{code}.TWO"
-        
-        # 預設上市
-        return f"{code}.TW"
+        market = market or self.get_stock_market(code)
+        suffix = ".TW" if market == "TW" else ".TWO"
+        return f"{code}{suffix}"
     
     def get_stock_name(self, code: str) -> str:
         """取得股票名稱"""
-        for c, name in POPULAR_STOCKS["TW"]:
-            if c == code:
-                return name
-        for c, name in POPULAR_STOCKS["TWO"]:
-            if c == code:
-                return name
-        return code
+        record = self.registry.get(code)
+        return record["name"] if record else code
     
     def get_stock_market(self, code: str) -> str:
         """取得股票市場"""
-        for c, _ in POPULAR_STOCKS["TW"]:
-            if c == code:
-                return "TW"
-        for c, _ in POPULAR_STOCKS["TWO"]:
-            if c == code:
-                return "TWO"
-        return "TW"
+        record = self.registry.get(code)
+        return record["market"] if record else "TW"
     
     async def get_stock_history(
         self, 
@@ -161,6 +100,8 @@ class StockDataService:
         """
         取得股票歷史數據
         
+        由該股票的標準日K 歷史切片取得，與 K 線圖等其他請求共用同一份資料。
+        
         Args:
             code: 股票代碼
             days: 取幾天的數據
@@ -168,42 +109,163 @@ class StockDataService:
         Returns:
             DataFrame with OHLCV data
         """
-        cache_key = f"{code}_{days}"
-        
-        # 檢查快取
-        if cache_key in self.cache:
-            cache_time = self.cache_time.get(cache_key)
-            if cache_time and datetime.now() - cache_time < self.cache_duration:
-                return self.cache[cache_key]
-        
         try:
             symbol = self.get_yfinance_symbol(code)
             
             # 多抓一些天數來確保有足夠的數據計算長週期均線
-            fetch_days = days + 300
-            
-            ticker = yf.Ticker(symbol)
-            df = ticker.history(period=f"{fetch_days}d")
+            start = self._window_start(days + 300)
             
-            if df.empty:
+            df = await self.history.get_bars(symbol, "1d", start)
+            if df is None or df.empty:
                 logger.warning(f"No data for {symbol}")
                 return None
             
-            # 快取
-            self.cache[cache_key] = df
-            self.cache_time[cache_key] = datetime.now()
-            
             return df
             
         except Exception as e:
             logger.error(f"Error fetching {code}: {e}")
             return None
     
+    async def prefetch_histories(
+        self,
+        codes: List[str],
+        days: int = 250
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        批次取得多檔股票歷史數據並寫入快取
+        
+        以資料來源的多檔合併請求 (yfinance 為 yf.download) 取代逐檔 history()：
+        本地沒有資料的股票下載完整區間，本地資料過期的股票只下載新 K 棒；
+        批次結果中缺漏或遇到除權息的股票再逐檔抓取。
+        
+        Args:
+            codes: 股票代碼列表
+            days: 取幾天的數據 (與 get_stock_history 相同)
+        
+        Returns:
+            {股票代碼: DataFrame}，抓不到的股票不會出現在結果中
+        """
+        # 重疊的篩選請求 (相同股票清單) 共用同一次批次下載
+        return await self.history.flight.do(
+            ("prefetch", tuple(codes), days),
+            lambda: self._prefetch_histories(codes, days)
+        )
+    
+    async def _prefetch_histories(
+        self,
+        codes: List[str],
+        days: int
+    ) -> Dict[str, pd.DataFrame]:
+        """prefetch_histories 的實作"""
+        start = self._window_start(days + 300)
+        results = {}
+        full = {}
+        incremental = {}
+        for code in codes:
+            symbol = self.get_yfinance_symbol(code)
+            cached = self.history.cached(symbol, "1d", start)
+            if cached is not None:
+                results[code] = cached
+                continue
+            
+            stored, fresh = self.store.load_covering(symbol, "1d", start, self.cache.ttl("1d"))
+            if stored is None:
+                full[symbol] = code
+            elif fresh:
+                results[code] = self._put_history(symbol, stored, start)
+            else:
+                incremental[symbol] = (code, stored)
+        
+        # 寫入本地儲存時取得與 HistoryCache 相同的逐檔鎖，並重新檢查：
+        # 下載期間其他 worker 可能已寫入較新的資料
+        ttl = self.cache.ttl("1d")
+        lock = self.history.coordinator.symbol_lock
+        
+        if full:
+            logger.info(f"批次下載 {len(full)} 支股票完整歷史")
+            frames = await self._download_bulk(list(full), start=start.strftime("%Y-%m-%d"))
+            for symbol, df in frames.items():
+                async with lock(symbol, "1d"):
+                    stored, fresh = self.store.load_covering(symbol, "1d", start, ttl)
+                    if stored is None or not fresh:
+                        self.store.save(symbol, "1d", df, coverage_start=start)
+                        stored = self.store.load(symbol, "1d")
+                results[full[symbol]] = self._put_history(symbol, stored, start)
+        
+        if incremental:
+            since = min(stored.index[-1] for _, stored in incremental.values())
+            logger.info(f"批次更新 {len(incremental)} 支股票 (自 {since:%Y-%m-%d})")
+            frames = await self._download_bulk(
+                list(incremental), start=since.strftime("%Y-%m-%d"), actions=True
+            )
+            for symbol, new in frames.items():
+                code, stored = incremental[symbol]
+                if has_corporate_actions(new[new.index > stored.index[-1]]):
+                    continue
+                async with lock(symbol, "1d"):
+                    stored, fresh = self.store.load_covering(symbol, "1d", start, ttl)
+                    if stored is None:
+                        continue
+                    if not fresh:
+                        stored = self.store.append(symbol, "1d", new[new.index >= stored.index[-1]])
+                results[code] = self._put_history(symbol, stored, start)
+        
+        # 批次請求遺漏的股票改用逐檔抓取
+        fallback = [code for code in codes if code not in results]
+        if fallback:
+            logger.info(f"批次下載缺少 {len(fallback)} 支股票，改為逐檔抓取")
+            dfs = await asyncio.gather(*[
+                self.get_stock_history(code, days) for code in fallback
+            ])
+            for code, df in zip(fallback, dfs):
+                if df is not None:
+                    results[code] = df
+        
+        return results
+    
+    async def _download_bulk(self, symbols: List[str], **kwargs) -> Dict[str, pd.DataFrame]:
+        """分批呼叫 _download_chunk 並合併結果"""
+        chunks = [
+            symbols[i:i + BULK_CHUNK_SIZE]
+            for i in range(0, len(symbols), BULK_CHUNK_SIZE)
+        ]
+        frames = {}
+        for chunk_frames in await asyncio.gather(*[
+            self._download_chunk(chunk, **kwargs) for chunk in chunks
+        ]):
+            frames.update(chunk_frames)
+        return frames
+    
+    async def _download_chunk(
+        self,
+        symbols: List[str],
+        **kwargs
+    ) -> Dict[str, pd.DataFrame]:
+        """以單一請求下載多檔股票，回傳各自的 OHLCV DataFrame"""
+        try:
+            return await self.executor.run(
+                self.provider.download, symbols, fetch_labels=(self.provider.name, "1d"), **kwargs
+            )
+        except Exception as e:
+            logger.error(f"Bulk download failed for {len(symbols)} symbols: {e}")
+            return {}
+    
+    def _put_history(self, symbol: str, df: pd.DataFrame, start: pd.Timestamp) -> pd.DataFrame:
+        """將本地完整歷史寫入標準快取，並回傳 start 之後的切片"""
+        self.history.put(symbol, "1d", df, self.store.coverage_start(symbol, "1d"))
+        return df.iloc[df.index.searchsorted(start):]
+    
+    @staticmethod
+    def _window_start(fetch_days: int) -> pd.Timestamp:
+        """取得往前 fetch_days 天的起始日 (台北時間)"""
+        return pd.Timestamp.now(tz=TIMEZONE).normalize() - pd.Timedelta(days=fetch_days)
+    
     async def get_stock_kline(
         self, 
         code: str, 
         days: int = 120,
-        ma_periods: List[int] = None
+        ma_periods: List[int] = None,
+        columnar: bool = False
     ) -> Optional[Dict]:
         """
         取得個股 K 線數據與均線
@@ -212,6 +274,7 @@ class StockDataService:
             code: 股票代碼
             days: 取幾天的數據
             ma_periods: 要計算的均線週期
+            columnar: 是否回傳欄式格式
         
         Returns:
             K 線數據與均線
@@ -221,42 +284,17 @@ class StockDataService:
         if df is None or df.empty:
             return None
         
-        # 計算均線
-        ma_lines = {}
-        if ma_periods:
-            for period in ma_periods:
-                ma_col = f"MA{period}"
-                df[ma_col] = df['Close'].rolling(window=period).mean()
-                
-                # 只取最近 days 天的均線數據
-                ma_data = df[[ma_col]].tail(days).dropna()
-                ma_lines[ma_col] = [
-                    {
-                        "time": idx.strftime("%Y-%m-%d"),
-                        "value": round(row[ma_col], 2) if pd.notna(row[ma_col]) else None
-                    }
-                    for idx, row in ma_data.iterrows()
-                    if pd.notna(row[ma_col])
-                ]
-        
-        # 只取最近 days 天
-        df = df.tail(days)
-        
-        # 轉換為 K 線格式
-        ohlc = []
-        for idx, row in df.iterrows():
-            ohlc.append({
-                "time": idx.strftime("%Y-%m-%d"),
-                "open": round(row['Open'], 2),
-                "high": round(row['High'], 2),
-                "low": round(row['Low'], 2),
-                "close": round(row['Close'], 2),
-                "volume": int(row['Volume']) if pd.notna(row['Volume']) else 0
-            })
-        
+        # 均線以完整歷史計算 (篩選時已計算的直接沿用)，只輸出最近 days 天
+        with stage("indicators"):
+            ma_series = self.ma_cache.series(code, "1d", df, ma_periods or [])
+        with stage("serialize"):
+            payload = build_kline_payload(
+                df, "1d", ma_periods or [], n_bars=days, decimals=2,
+                skip_short_ma=False, columnar=columnar, ma_series=ma_series
+            )
         return {
             "code": code,
             "name": self.get_stock_name(code),
-            "ohlc": ohlc,
-            "ma_lines": ma_lines
+            **payload
         }
+
@@ -0,0 +1,252 @@
+"""
+股票代碼註冊表 - 上市 (TW) 與上櫃 (TWO) 完整清單
+
+清單存放於本地 CSV (code, name, market, industry)，載入後建立
+代碼、市場、產業索引，查詢皆為 O(1)。
+清單可由證交所 / 櫃買中心匯出的 CSV 匯入更新：
+
+    python -m services.symbol_registry import <path.csv> [--market TW|TWO]
+
+匯出檔沒有市場欄位時 (如證交所、櫃買中心的 ISIN 清單各自只含一個市場)，
+以 --market 指定整份檔案的市場。匯入只取代檔案中出現的市場，
+上市與上櫃清單可分兩次匯入。
+
+ISIN 清單 (https://isin.twse.com.tw/isin/C_public.jsp?strMode=2 為上市、strMode=4 為上櫃)
+另列有權證、ETF、ETN、TDR、受益證券與特別股；匯入時只保留「股票」分段中的普通股
+(有 CFICode 欄時須為 ES 開頭)。隨附的 data/symbols.csv 只是精簡的範例清單，
+完整市場需以上述清單匯入。
+"""
+import argparse
+import csv
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYMBOLS_FILE = os.environ.get(
+    "SYMBOLS_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "symbols.csv")
+)
+
+MARKETS = ("TW", "TWO")
+FIELDS = ["code", "name", "market", "industry"]
+
+# 匯入時接受的欄位名稱 (英文或證交所 / 櫃買中心匯出的中文欄位)
+COLUMN_ALIASES = {
+    "code": ("code", "代號", "股票代號", "有價證券代號", "公司代號", "證券代號"),
+    "name": ("name", "名稱", "股票名稱", "有價證券名稱", "公司簡稱", "證券名稱"),
+    "market": ("market", "市場", "市場別"),
+    "industry": ("industry", "產業", "產業別", "產業類別"),
+}
+# ISIN 清單將代號與名稱放在同一欄，以空白 (常為全形空白) 分隔
+COMBINED_CODE_NAME = ("有價證券代號及名稱",)
+# ISIN 清單依分類標題列 (如「股票」「ETF」「上市認購(售)權證」) 分段，只匯入普通股分段
+STOCK_SECTION = "股票"
+# ISO 10962 分類碼：普通股為 ES 開頭 (如 ESVUFR)，特別股 (EP)、權證、基金等不匯入
+CFI_COLUMNS = ("CFICode", "CFI Code")
+COMMON_STOCK_CFI = "ES"
+MARKET_ALIASES = {
+    "TW": "TW", "TWSE": "TW", "上市": "TW",
+    "TWO": "TWO", "TPEX": "TWO", "OTC": "TWO", "上櫃": "TWO",
+}
+
+
+class SymbolRegistry:
+    """以代碼、市場、產業建立索引的股票清單"""
+
+    def __init__(self, path: str = DEFAULT_SYMBOLS_FILE):
+        self.path = path
+        self._by_code: Dict[str, Dict] = {}
+        self._by_market: Dict[str, List[Dict]] = {}
+        self._by_industry: Dict[str, List[Dict]] = {}
+        self.load()
+
+    @classmethod
+    def from_records(cls, records: List[Dict]) -> "SymbolRegistry":
+        """由記錄列表建立註冊表 (不讀寫 CSV)，如合成市場或測試資料"""
+        registry = cls(os.devnull)
+        registry._index(parse_records(records))
+        return registry
+
+    def load(self) -> int:
+        """
+        由本地 CSV 重新載入清單
+
+        Returns:
+            股票數量
+        """
+        try:
+            with open(self.path, encoding="utf-8-sig", newline="") as f:
+                records = parse_records(csv.DictReader(f))
+        except OSError as e:
+            logger.warning(f"Symbol registry {self.path} unavailable: {e}")
+            records = []
+
+        self._index(records)
+        logger.info(f"已載入 {len(self._by_code)} 支股票代碼")
+        return len(self._by_code)
+
+    def _index(self, records: List[Dict]) -> None:
+        by_code: Dict[str, Dict] = {}
+        for record in records:
+            by_code.setdefault(record["code"], record)
+
+        by_market: Dict[str, List[Dict]] = {market: [] for market in MARKETS}
+        by_industry: Dict[str, List[Dict]] = {}
+        for record in by_code.values():
+            by_market[record["market"]].append(record)
+            if record["industry"]:
+                by_industry.setdefault(record["industry"], []).append(record)
+
+        self._by_code, self._by_market, self._by_industry = by_code, by_market, by_industry
+
+    def import_csv(self, source: str, default_market: Optional[str] = None) -> int:
+        """
+        匯入外部 CSV 並取代本地清單中相同市場的股票 (其他市場保留)
+
+        Args:
+            source: CSV 路徑，欄位可為英文 (code, name, market, industry) 或中文
+            default_market: 沒有市場欄位 (或該列市場為空) 時使用的市場 (TW 或 TWO)
+
+        Returns:
+            匯入的股票數量
+        """
+        with open(source, encoding="utf-8-sig", newline="") as f:
+            records = parse_records(csv.DictReader(f), default_market)
+        if not records:
+            raise ValueError(f"No valid symbols found in {source}")
+        imported = {record["market"] for record in records}
+        records += [r for r in self._by_code.values() if r["market"] not in imported]
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDS, lineterminator="\n")
+                writer.writeheader()
+                writer.writerows(records)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        self._index(records)
+        return len(self._by_code)
+
+    def get(self, code: str) -> Optional[Dict]:
+        """依代碼查詢 {"code", "name", "market", "industry"}"""
+        return self._by_code.get(code)
+
+    def list(self, market: str = "all", industry: Optional[str] = None) -> List[Dict]:
+        """依市場 (all, TW, TWO) 與產業列出股票"""
+        if industry is not None:
+            records = self._by_industry.get(industry, [])
+            if market in MARKETS:
+                records = [r for r in records if r["market"] == market]
+            return list(records)
+
+        if market in MARKETS:
+            return list(self._by_market[market])
+        return list(self._by_code.values())
+
+    def industries(self) -> List[str]:
+        """所有產業類別"""
+        return sorted(self._by_industry)
+
+    def __len__(self) -> int:
+        return len(self._by_code)
+
+
+def parse_records(rows, default_market: Optional[str] = None) -> List[Dict]:
+    """
+    將 CSV 列正規化為 {"code", "name", "market", "industry"}，略過無法辨識的列
+
+    ISIN 清單只保留普通股：分類標題列之後的列屬於該分類，「股票」以外的分段
+    (權證、ETF、ETN、TDR、受益證券等) 略過；有 CFICode 欄時另排除非 ES 開頭的列 (如特別股)。
+
+    Args:
+        default_market: 沒有市場欄位 (或該列市場為空) 時使用的市場；
+                        有市場欄位但無法辨識 (如興櫃) 的列仍會略過
+    """
+    if default_market is not None and default_market not in MARKETS:
+        raise ValueError(f"Unknown market: {default_market}")
+
+    records = []
+    section = None
+    for row in rows:
+        values = {}
+        for field, aliases in COLUMN_ALIASES.items():
+            for alias in aliases:
+                if row.get(alias) not in (None, ""):
+                    values[field] = row[alias].strip()
+                    break
+        if "code" not in values:
+            parts = _split_code_name(row)
+            if len(parts) == 1:
+                section = parts[0]
+                continue
+            if len(parts) == 2:
+                values.update(code=parts[0], name=parts[1])
+        if section is not None and section != STOCK_SECTION:
+            continue
+        cfi = next((row[c].strip() for c in CFI_COLUMNS if row.get(c)), "")
+        if cfi and not cfi.upper().startswith(COMMON_STOCK_CFI):
+            continue
+
+        if values.get("market"):
+            market = MARKET_ALIASES.get(values["market"].upper())
+        else:
+            market = default_market
+        code = values.get("code", "")
+        if not code or market is None:
+            continue
+
+        records.append({
+            "code": code,
+            "name": values.get("name", code),
+            "market": market,
+            "industry": values.get("industry", ""),
+        })
+    return records
+
+
+def _split_code_name(row) -> List[str]:
+    """
+    拆開 ISIN 清單的「代號 名稱」欄
+
+    Returns:
+        [代號, 名稱]；分類標題列 (如「股票」) 只有一個元素；沒有此欄時為空列表
+    """
+    for alias in COMBINED_CODE_NAME:
+        parts = (row.get(alias) or "").split(maxsplit=1)
+        if parts:
+            return [part.strip() for part in parts]
+    return []
+
+
+# 單例模式
+_registry = None
+
+def get_symbol_registry() -> SymbolRegistry:
+    """取得 SymbolRegistry 單例"""
+    global _registry
+    if _registry is None:
+        _registry = SymbolRegistry()
+    return _registry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m services.symbol_registry")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="匯入 CSV 並取代本地清單中相同市場的股票")
+    importer.add_argument("path", help="證交所 / 櫃買中心匯出的 CSV")
+    importer.add_argument(
+        "--market", choices=MARKETS,
+        help="檔案沒有市場欄位時整份檔案所屬的市場 (如 ISIN 清單)"
+    )
+    args = parser.parse_args()
+    count = SymbolRegistry().import_csv(args.path, default_market=args.market)
+    print(f"Imported {count} symbols into {DEFAULT_SYMBOLS_FILE}")
@@ -3,14 +3,18 @@ TradingView / 多週期 K 線資料服務
 支援：1d (日K), 1wk (週K), 1mo (月K)
 
 注意：分鐘 K 線需要額外的資料源 (如 TradingView WebSocket)
-目前先使用 yfinance 支援日/週/月 K
+目前經由資料來源 (預設 yfinance) 取得各週期 K 線
 """
-import yfinance as yf
 import pandas as pd
-from typing import Optional, List, Dict
-from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Tuple
 import logging
 
+from .data_provider import DataProvider, get_data_provider
+from .fetch_executor import FetchExecutor, get_fetch_executor
+from .frame_cache import FrameCache, get_frame_cache
+from .history_cache import HistoryCache, INTRADAY_LIMIT_DAYS
+from .ohlcv_store import OHLCVStore, get_ohlcv_store, TIMEZONE
+
 logger = logging.getLogger(__name__)
 
 # Interval 對應 yfinance 格式
@@ -24,6 +28,38 @@ INTERVAL_MAP = {
     "1mo": "1mo",
 }
 
+# 可由較細週期在本地合併的週期 -> 來源週期 (週/月K 由日K 合併)
+#
+# 合併後的回溯期間與來源相同，受 yfinance 分鐘 K 的回溯限制 (INTRADAY_LIMIT_DAYS)：
+# - 15m / 30m: 約 59 天 (約 40 個交易日，30m 約 360 根)
+# - 1h / 4h: 約 720 天 (4h 每個交易日 2 根，約 980 根)
+# 4h 由原生 1h 合併而非 15m，否則只有約 80 根，不足以計算 MA60 以上的均線與糾結天數。
+DERIVED_FROM = {
+    "30m": "15m",
+    "4h": "1h",
+    "1wk": "1d",
+    "1mo": "1d",
+}
+
+# 分鐘 K 週期長度 (分鐘)
+INTRADAY_MINUTES = {
+    "15m": 15,
+    "30m": 30,
+    "1h": 60,
+    "4h": 240,
+}
+
+# 台股開盤時間 (09:00)，分鐘 K 以開盤為起點分組，不跨交易日
+SESSION_OPEN = pd.Timedelta(hours=9)
+
+OHLCV_AGG = {
+    "Open": "first",
+    "High": "max",
+    "Low": "min",
+    "Close": "last",
+    "Volume": "sum",
+}
+
 # 台股代碼對應 yfinance 格式
 def get_yf_symbol(code: str, market: str = "TW") -> str:
     """轉換為 yfinance 格式"""
@@ -31,13 +67,62 @@ def get_yf_symbol(code: str, market: str = "TW") -> str:
     return f"{code}{suffix}"
 
 
+def base_interval(interval: str) -> str:
+    """取得 interval 在多週期合併時使用的來源週期"""
+    return DERIVED_FROM.get(interval, INTERVAL_MAP.get(interval, "1d"))
+
+
+def resample_bars(df: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """
+    將 K 線合併為較粗的週期 (依台股交易時段分組)
+
+    - 分鐘 K: 自當日 09:00 起每 interval 一組 (4h 為 09:00-13:00 與 13:00-13:30)
+    - 1wk: 以週一為起點；1mo: 以每月 1 日為起點
+
+    Args:
+        df: 時間索引的 OHLCV DataFrame
+        interval: 目標週期 (30m, 1h, 4h, 1wk, 1mo)
+
+    Returns:
+        以每組起始時間為索引的 OHLCV DataFrame
+    """
+    if df.empty:
+        return df
+
+    local = df.index.tz_convert(TIMEZONE) if df.index.tz is not None else df.index
+    day = local.normalize()
+    if interval in INTRADAY_MINUTES:
+        freq = pd.Timedelta(minutes=INTRADAY_MINUTES[interval])
+        bucket = (local - day - SESSION_OPEN) // freq
+        keys = day + SESSION_OPEN + bucket * freq
+    elif interval == "1wk":
+        keys = day - pd.to_timedelta(local.dayofweek, unit="D")
+    elif interval == "1mo":
+        keys = day - pd.to_timedelta(local.day - 1, unit="D")
+    else:
+        raise ValueError(f"Unsupported resample interval: {interval}")
+
+    agg = {column: how for column, how in OHLCV_AGG.items() if column in df.columns}
+    resampled = df.groupby(pd.DatetimeIndex(keys)).agg(agg).dropna(subset=["Close"])
+    resampled.index.name = None
+    return resampled
+
+
 class MultiTimeframeService:
     """多週期 K 線服務"""
     
-    def __init__(self):
-        self.cache: Dict[str, pd.DataFrame] = {}
-        self.cache_time: Dict[str, datetime] = {}
-        self.cache_duration = timedelta(minutes=5)
+    def __init__(
+        self,
+        executor: Optional[FetchExecutor] = None,
+        store: Optional[OHLCVStore] = None,
+        cache: Optional[FrameCache] = None,
+        provider: Optional[DataProvider] = None
+    ):
+        self.executor = executor or get_fetch_executor()
+        self.store = store or get_ohlcv_store()
+        self.cache = cache or get_frame_cache()
+        self.provider = provider or get_data_provider()
+        self.history = HistoryCache(self.executor, self.store, self.cache, provider=self.provider)
     
     def get_supported_intervals(self) -> List[str]:
         """取得支援的週期列表"""
@@ -62,78 +147,111 @@ class MultiTimeframeService:
         Returns:
             DataFrame with OHLCV data
         """
-        cache_key = f"{code}_{market}_{interval}_{n_bars}"
-        
-        # 檢查快取
-        if cache_key in self.cache:
-            cache_time = self.cache_time.get(cache_key)
-            if cache_time and datetime.now() - cache_time < self.cache_duration:
-                logger.info(f"Cache hit for {cache_key}")
-                return self.cache[cache_key]
-        
         try:
             symbol = get_yf_symbol(code, market)
-            yf_interval = INTERVAL_MAP.get(interval, "1d")
-            
-            logger.info(f"Fetching {symbol} with interval {yf_interval}")
-            
-            ticker = yf.Ticker(symbol)
-            
-            # 根據 interval 決定 period (使用 yfinance 最大支援天數)
-            if interval in ["15m", "30m"]:
-                period = "59d"  # yfinance limit ~60d
-            elif interval in ["1h", "4h"]:
-                period = "720d" # yfinance limit 730d
-            elif interval == "1d":
-                period = f"{n_bars + 60}d" # 取多一點確保 MA
-            elif interval == "1wk":
-                period = f"{n_bars * 7}d"
-            elif interval == "1mo":
-                period = f"{n_bars * 31}d"
-            else:
-                period = "1y"
-            
-            # yfinance 對於某些 interval 有特殊處理
-            if interval == "4h":
-                # yfinance 不直接支援 4h，需要用 1h 然後 resample
-                df = ticker.history(period=period, interval="1h")
-                if not df.empty:
-                    df = self._resample_to_4h(df)
-            else:
-                df = ticker.history(period=period, interval=yf_interval)
+            # 與 get_timeframes 相同的來源週期 (見 DERIVED_FROM)，合併結果共用快取
+            source = base_interval(interval)
+            df = await self.history.get_bars(symbol, source, self._source_start(source, [interval], n_bars))
             
             if df is None or df.empty:
                 logger.warning(f"No data returned for {symbol} with interval {interval}")
                 # 對於不支援的分鐘 K，返回 None 並讓前端顯示提示
                 return None
             
-            # 只取最後 n_bars 筆
-            df = df.tail(n_bars)
+            if interval != source:
+                df = self._derived(symbol, interval, df)
             
-            # 快取
-            self.cache[cache_key] = df
-            self.cache_time[cache_key] = datetime.now()
-            
-            return df
+            # 只取最後 n_bars 筆
+            return df.tail(n_bars)
             
         except Exception as e:
             logger.error(f"Error fetching {code}: {e}")
             return None
     
-    def _resample_to_4h(self, df: pd.DataFrame) -> pd.DataFrame:
-        """將 1h K 線合併為 4h"""
-        try:
-            resampled = df.resample('4h').agg({
-                'Open': 'first',
-                'High': 'max',
-                'Low': 'min',
-                'Close': 'last',
-                'Volume': 'sum'
-            }).dropna()
-            return resampled
-        except Exception as e:
-            logger.error(f"Resample error: {e}")
-            return df
+    async def get_timeframes(
+        self,
+        code: str,
+        market: str = "TW",
+        intervals: List[str] = ["1h", "1d"],
+        n_bars: int = 200
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        一次取得多個週期的 K 線
+        
+        每個來源週期 (15m、1h 或 1d) 只抓取一次，其餘週期在本地合併並快取。
+        分鐘 K 的可用根數受來源的回溯天數限制 (見 DERIVED_FROM)，可能少於 n_bars。
+        
+        Args:
+            code: 股票代碼
+            market: TW 或 TWO
+            intervals: 要取得的週期
+            n_bars: 每個週期取幾根 K 棒
+        
+        Returns:
+            {週期: DataFrame}，抓不到資料的週期不會出現在結果中
+        """
+        symbol = get_yf_symbol(code, market)
+        groups: Dict[str, List[str]] = {}
+        for interval in intervals:
+            groups.setdefault(base_interval(interval), []).append(interval)
+        
+        frames = {}
+        for base, members in groups.items():
+            try:
+                df = await self.history.get_bars(symbol, base, self._source_start(base, members, n_bars))
+            except Exception as e:
+                logger.error(f"Error fetching {code} {base}: {e}")
+                continue
+            if df is None or df.empty:
+                continue
+            
+            for interval in members:
+                derived = df if interval == base else self._derived(symbol, interval, df)
+                frames[interval] = derived.tail(n_bars)
+        
+        return frames
+    
+    def _derived(self, symbol: str, interval: str, base: pd.DataFrame) -> pd.DataFrame:
+        """由來源 K 線合併出 interval，來源未變時直接使用快取"""
+        key = ("derived", symbol, interval)
+        signature = self._signature(base)
+        entry = self.cache.get(key)
+        if entry is not None and entry[1] == signature:
+            return entry[0]
+        
+        df = resample_bars(base, interval)
+        self.cache.set(key, (df, signature), interval=interval)
+        return df
+    
+    @staticmethod
+    def _signature(df: pd.DataFrame) -> Tuple:
+        """以長度、頭尾時間與最後收盤價辨識來源 K 線是否變動"""
+        return (len(df), df.index[0], df.index[-1], float(df["Close"].iloc[-1]))
+    
+    @classmethod
+    def _source_start(cls, base: str, intervals: List[str], n_bars: int) -> pd.Timestamp:
+        """來源週期 base 需抓取的起始時間，涵蓋由其合併出的所有 intervals"""
+        if base in INTRADAY_LIMIT_DAYS:
+            # 分鐘 K 來源受 yfinance 回溯天數限制，一律抓可回溯的最長區間
+            return cls._period_start(base, n_bars)
+        return min(cls._period_start(i, n_bars) for i in [base] + intervals)
+    
+    @staticmethod
+    def _period_start(interval: str, n_bars: int) -> pd.Timestamp:
+        """根據 interval 決定抓取起始時間 (使用 yfinance 最大支援天數)"""
+        if interval in ["15m", "30m"]:
+            days = INTRADAY_LIMIT_DAYS[interval]  # yfinance limit ~60d
+        elif interval in ["1h", "4h"]:
+            days = INTRADAY_LIMIT_DAYS["1h"]  # yfinance limit 730d
+        elif interval == "1d":
+            days = n_bars + 60  # 取多一點確保 MA
+        elif interval == "1wk":
+            days = n_bars * 7
+        elif interval == "1mo":
+            days = n_bars * 31
+        else:
+            days = 365
+        return pd.Timestamp.now(tz=TIMEZONE).normalize() - pd.Timedelta(days=days)
 
 
 # 單例模式
@@ -0,0 +1,213 @@
+"""
+多 worker 協調 - 以檔案鎖在多個 uvicorn worker 之間分工
+
+K 線存放在本地 OHLCV 儲存 (memory-map 的 .npy)，各 worker 讀取時共用頁面快取，
+記憶體不會隨 worker 數量倍增。為了讓上游抓取也不倍增：
+
+- 領導者：以 flock 取得儲存目錄下的 leader.lock 的 worker 負責背景更新 (快照排程)；
+  領導者結束時作業系統釋放鎖，其他 worker 會在下一次嘗試時接手。
+- 逐檔鎖：任何 worker 需要向上游抓取某 (股票, 週期) 時先取得對應的檔案鎖，
+  等待中的 worker 取得鎖後會先重新讀取本地儲存，通常可直接使用剛更新的資料。
+  釋放前刪除鎖檔，鎖目錄不會隨股票數量累積；取得鎖後確認鎖住的仍是目錄中的檔案，
+  否則 (已被前一個持有者刪除) 重新開啟。行程異常結束留下的鎖檔由領導者清除。
+
+不支援 fcntl 的平台 (Windows) 視為單一 worker：永遠是領導者、不使用逐檔鎖。
+"""
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+
+from .ohlcv_store import DEFAULT_STORE_DIR, get_ohlcv_store
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 非領導者重新嘗試取得領導權的間隔 (秒)
+ELECTION_INTERVAL = float(os.environ.get("ELECTION_INTERVAL", "30"))
+# 等待逐檔鎖時的輪詢間隔 (秒)
+LOCK_POLL_INTERVAL = 0.05
+
+
+class WorkerCoordinator:
+    """以儲存目錄下的檔案鎖協調多個 worker 行程"""
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR):
+        self.root = root
+        self._leader_fd: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock_waits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return fcntl is not None
+
+    @property
+    def is_leader(self) -> bool:
+        return not self.enabled or self._leader_fd is not None
+
+    def try_acquire_leadership(self) -> bool:
+        """嘗試成為領導者 (不阻塞)，已是領導者時回傳 True"""
+        if self.is_leader:
+            return True
+
+        os.makedirs(self.root, exist_ok=True)
+        fd = os.open(os.path.join(self.root, "leader.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._leader_fd = fd
+        logger.info(f"Worker {os.getpid()} 成為領導者，負責背景更新")
+        return True
+
+    def start(self, on_elected: Callable[[], None]) -> None:
+        """
+        在目前的事件迴圈持續參選，成為領導者時呼叫一次 on_elected
+
+        單一 worker 或不支援檔案鎖時會立即呼叫。
+        """
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.ensure_future(self._campaign(on_elected))
+
+    async def _campaign(self, on_elected: Callable[[], None]) -> None:
+        while not self.try_acquire_leadership():
+            await asyncio.sleep(ELECTION_INTERVAL)
+        self.reap_locks()
+        on_elected()
+
+    async def stop(self) -> None:
+        """停止參選並釋放領導權"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._leader_fd is not None:
+            os.close(self._leader_fd)
+            self._leader_fd = None
+
+    @asynccontextmanager
+    async def symbol_lock(self, symbol: str, interval: str):
+        """
+        跨行程的逐檔抓取鎖
+
+        以非阻塞方式輪詢，等待中的協程可被取消 (如客戶端斷線)。
+        """
+        if not self.enabled:
+            yield
+            return
+
+        directory = os.path.join(self.root, "locks", interval)
+        path = os.path.join(directory, f"{symbol}.lock")
+        waited = False
+        while True:
+            os.makedirs(directory, exist_ok=True)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except OSError:
+                        waited = True
+                        await asyncio.sleep(LOCK_POLL_INTERVAL)
+            except BaseException:
+                os.close(fd)
+                raise
+            if self._is_current(fd, path):
+                break
+            # 等待期間鎖檔已被前一個持有者刪除，鎖住的是舊檔案
+            os.close(fd)
+
+        if waited:
+            self._lock_waits += 1
+        try:
+            yield
+        finally:
+            # 持有鎖時刪除鎖檔，關閉檔案描述子即釋放鎖
+            self._unlink(path)
+            os.close(fd)
+
+    @staticmethod
+    def _is_current(fd: int, path: str) -> bool:
+        """fd 是否仍是 path 目前指向的檔案"""
+        try:
+            return os.fstat(fd).st_ino == os.stat(path).st_ino
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def reap_locks(self) -> int:
+        """
+        清除沒有人持有的鎖檔 (行程異常結束時留下)
+
+        Returns:
+            刪除的鎖檔數
+        """
+        root = os.path.join(self.root, "locks")
+        if not self.enabled or not os.path.isdir(root):
+            return 0
+
+        reaped = 0
+        for interval in os.listdir(root):
+            directory = os.path.join(root, interval)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    fd = os.open(path, os.O_RDWR)
+                except FileNotFoundError:
+                    continue
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # 使用中
+                    os.close(fd)
+                    continue
+                if self._is_current(fd, path):
+                    self._unlink(path)
+                    reaped += 1
+                os.close(fd)
+        if reaped:
+            logger.info(f"清除 {reaped} 個殘留的鎖檔")
+        return reaped
+
+    def stats(self) -> Dict:
+        """取得協調狀態 (lock_waits 為等待其他 worker 抓取的次數)"""
+        return {
+            "pid": os.getpid(),
+            "enabled": self.enabled,
+            "leader": self.is_leader,
+            "lock_waits": self._lock_waits,
+        }
+
+
+# 單例模式
+_coordinator = None
+
+def get_worker_coordinator() -> WorkerCoordinator:
+    """取得 WorkerCoordinator 單例 (鎖檔放在 OHLCVStore 單例的目錄下)"""
+    global _coordinator
+    if _coordinator is None:
+        _coordinator = WorkerCoordinator(get_ohlcv_store().root)
+    return _coordinator
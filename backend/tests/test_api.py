@@ -3,6 +3,7 @@
 
 測試案例來源: doc/test/backend-api-tests.md
 """
+import json
 import pytest
 import re
 
@@ -146,3 +147,70 @@ class TestScreenAPI:
         if len(data) > 1:
             for i in range(len(data) - 1):
                 assert data[i]["convergence_pct"] <= data[i + 1]["convergence_pct"]
+
+    
+    @pytest.mark.anyio
+    async def test_screen_as_of_should_reject_intraday(self, client):
+        """【歷史篩選】as_of 只支援日K"""
+        response = await client.post("/api/screen", json={"as_of": "2024-05-07", "interval": "15m"})
+        assert response.status_code == 400
+    
+    @pytest.mark.anyio
+    async def test_screen_history_should_reject_reversed_range(self, client):
+        """【歷史篩選】end 早於 start 應回傳 400"""
+        response = await client.post("/api/screen/history", json={
+            "start": "2024-05-07", "end": "2024-05-01"
+        })
+        assert response.status_code == 400
+
+
+class TestScreenStreamAPI:
+    """串流篩選 API"""
+    
+    @pytest.mark.anyio
+    async def test_screen_stream_should_emit_ndjson_events(self, client):
+        """【串流】POST `/api/screen/stream` 應依序送出 start、progress (K 線載入進度) 與 done 事件"""
+        response = await client.post("/api/screen/stream", json={
+            "ma_periods": [5, 10, 20],
+            "convergence_pct": 5.0,
+            "convergence_days": 3,
+            "market": "TWO"
+        })
+        assert response.status_code == 200
+        assert "application/x-ndjson" in response.headers["content-type"]
+        events = [json.loads(line) for line in response.text.splitlines() if line]
+        assert events[0]["type"] == "start"
+        assert events[-1]["type"] == "done"
+        progress = [e for e in events if e["type"] == "progress"]
+        scanned = [e["scanned"] for e in progress]
+        assert scanned == sorted(scanned)
+        assert scanned[-1] == events[0]["total"]
+        results = events[-1]["results"]
+        for i in range(len(results) - 1):
+            assert results[i]["convergence_pct"] <= results[i + 1]["convergence_pct"]
+    
+    @pytest.mark.anyio
+    async def test_screen_stream_should_revalidate_with_etag(self, client):
+        """【條件式請求】帶上次 done 事件的 ETag 且結果未變時最後應以 not_modified 取代 done 事件"""
+        body = {"ma_periods": [5, 10, 20], "convergence_pct": 5.0, "convergence_days": 3, "market": "TWO"}
+        first = await client.post("/api/screen/stream", json=body)
+        done = json.loads(first.text.splitlines()[-1])
+        assert done["etag"]
+        
+        second = await client.post("/api/screen/stream", json=body, headers={"If-None-Match": done["etag"]})
+        events = [json.loads(line) for line in second.text.splitlines() if line]
+        assert events[-1] == {"type": "not_modified", "etag": done["etag"]}
+        assert not any(e["type"] == "done" for e in events)
+    
+    @pytest.mark.anyio
+    async def test_screen_stream_should_support_sse(self, client):
+        """【串流】Accept: text/event-stream 時應回傳 SSE 格式"""
+        response = await client.post(
+            "/api/screen/stream",
+            json={"ma_periods": [5, 10], "market": "TWO"},
+            headers={"Accept": "text/event-stream"}
+        )
+        assert response.status_code == 200
+        assert "text/event-stream" in response.headers["content-type"]
+        assert response.text.startswith("event: start\ndata: ")
+        assert "event: done\n" in response.text
@@ -0,0 +1,111 @@
+"""
+糾結訊號回測測試 - 每日訊號需與逐檔 MACalculator 在當日的結果相同
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.backtest import ConvergenceBacktest
+from services.convergence_engine import PriceMatrix
+from services.ma_calculator import MACalculator
+from tests.test_convergence_engine import make_frames
+
+
+def step_matrix():
+    """70 天平盤 100 後跌到 90 一天，再站上 110"""
+    dates = pd.bdate_range("2024-01-01", periods=100, tz="Asia/Taipei")
+    close = np.array([100.0] * 70 + [90.0] + [110.0] * 29)
+    return PriceMatrix.from_frames({"2330": pd.DataFrame({"Close": close}, index=dates)}), dates
+
+
+class TestConvergenceBacktest:
+    """ConvergenceBacktest 行為"""
+
+    @pytest.mark.parametrize("position", [120, 199])
+    def test_signals_should_match_point_in_time_check(self, position):
+        """【一致性】任一天的訊號應與只用當日以前資料的 check_convergence 相同"""
+        frames = make_frames()
+        ma_periods = [5, 10, 20, 60]
+        day = next(iter(frames.values())).index[position]
+
+        result = ConvergenceBacktest.run(
+            PriceMatrix.from_frames(frames), ma_periods, 3.0, 5,
+            start=day, end=day, max_events=1000
+        )
+
+        expected = {
+            code for code, df in frames.items()
+            if MACalculator.check_convergence(df[df.index <= day].copy(), ma_periods, 3.0, 5)[0]
+        }
+        assert {event["code"] for event in result["events"]} == expected
+        assert result["signals"] == len(expected)
+
+    def test_point_in_time_should_match_check_on_truncated_history(self):
+        """【歷史篩選】任一天 (含停牌日) 的結果應與當天執行 check_convergence 相同"""
+        frames = make_frames()
+        ma_periods = [5, 10, 20, 60]
+        matrix = PriceMatrix.from_frames(frames)
+        rows = np.array([100, 151, 199])
+
+        matched, pct, close = ConvergenceBacktest.point_in_time(matrix, ma_periods, 3.0, 5, rows)
+
+        for k, row in enumerate(rows):
+            day = matrix.dates[row]
+            for col, code in enumerate(matrix.codes):
+                history = frames[code][frames[code].index <= day]
+                expected, expected_pct = MACalculator.check_convergence(history.copy(), ma_periods, 3.0, 5)
+                assert matched[k, col] == expected
+                if expected:
+                    assert round(pct[k, col], 2) == pytest.approx(expected_pct)
+                    assert close[k, col] == pytest.approx(history["Close"].iloc[-1])
+
+    def test_forward_returns_and_drawdown(self):
+        """【報酬】持有報酬與期間最大回撤應以交易日計算"""
+        matrix, _ = step_matrix()
+
+        result = ConvergenceBacktest.run(matrix, [5, 10, 20, 60], 0.0, 5, horizons=[5])
+
+        # 平盤第 65 根 (索引 64) 起符合條件，共 6 天
+        stats = result["horizons"]["5"]
+        assert result["signals"] == 6
+        assert stats["count"] == 6
+        assert stats["mean_return"] == pytest.approx(5.0)
+        assert stats["hit_rate"] == pytest.approx(0.6667)
+        assert stats["worst_drawdown"] == pytest.approx(-10.0)
+        assert stats["mean_drawdown"] == pytest.approx(-8.33)
+
+    def test_entries_only_and_date_range(self):
+        """【篩選】entries_only 只計連續糾結的第一天；start 之前的訊號不計"""
+        matrix, dates = step_matrix()
+
+        first = ConvergenceBacktest.run(matrix, [5, 10, 20, 60], 0.0, 5, horizons=[5], entries_only=True)
+        assert first["signals"] == 1
+        assert first["events"][0]["date"] == dates[64].strftime("%Y-%m-%d")
+        assert first["events"][0]["returns"] == {"5": 0.0}
+
+        later = ConvergenceBacktest.run(matrix, [5, 10, 20, 60], 0.0, 5, horizons=[5], start=dates[67].date())
+        assert later["signals"] == 3
+
+    def test_incomplete_horizon_should_not_count(self):
+        """【資料尾端】持有期超出資料範圍的訊號不計入統計"""
+        matrix, _ = step_matrix()
+        result = ConvergenceBacktest.run(matrix, [5, 10, 20, 60], 0.0, 5, horizons=[40])
+        assert result["horizons"]["40"]["count"] == 0
+        assert result["events"][0]["returns"]["40"] is None
+
+    def test_forward_min_should_match_naive(self):
+        """【回撤】倍增法的前瞻最小值應與逐點計算相同"""
+        values = np.random.default_rng(1).normal(size=(50, 3))
+        for window in (1, 3, 8, 13):
+            expected = np.full(values.shape, np.nan)
+            for i in range(len(values) - window):
+                expected[i] = values[i + 1:i + 1 + window].min(axis=0)
+            np.testing.assert_allclose(
+                ConvergenceBacktest.forward_min(values, window), expected, equal_nan=True
+            )
+
+    def test_invalid_horizon_should_raise(self):
+        """【參數】持有天數需為正整數"""
+        matrix, _ = step_matrix()
+        with pytest.raises(ValueError):
+            ConvergenceBacktest.run(matrix, [5], 3.0, 5, horizons=[0])
@@ -0,0 +1,39 @@
+"""
+基準測試套件的冒煙測試 - 以極小規模執行，確保套件不會因程式變更而失效
+"""
+import json
+
+from benchmarks import suite
+from services.data_provider import SyntheticProvider
+
+
+class TestBenchmarkSuite:
+    """benchmarks.suite 行為"""
+
+    def test_run_should_write_comparable_json(self, tmp_path):
+        """【執行】應寫出含環境資訊與各項結果的 JSON"""
+        output = tmp_path / "run.json"
+        code = suite.main([
+            "run", "--sizes", "10", "--repeat", "1",
+            "--only", "scan,kline,cache", "--output", str(output)
+        ])
+
+        assert code == 0
+        report = json.loads(output.read_text())
+        assert report["meta"]["provider"] == SyntheticProvider.name
+        results = report["results"]
+        assert results["scan.cold.10"]["peak_bytes"] > 0
+        assert results["scan.result_hit.10"]["best"] > 0
+        assert results["kline.1d.columnar"]["bars"] > 0
+        assert "cache.history_hit" in results
+
+    def test_compare_should_flag_regressions(self):
+        """【比較】超過門檻的變慢項目應標記為退步"""
+        old = {"results": {"a": {"best": 1.0}, "b": {"best": 1.0}, "gone": {"best": 1.0}}}
+        new = {"results": {"a": {"best": 1.05}, "b": {"best": 1.5}, "added": {"best": 1.0}}}
+
+        rows = {row["name"]: row for row in suite.compare(old, new, threshold=0.1)}
+
+        assert set(rows) == {"a", "b"}
+        assert not rows["a"]["regression"]
+        assert rows["b"]["regression"]
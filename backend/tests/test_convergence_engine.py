@@ -0,0 +1,107 @@
+"""
+向量化糾結引擎測試 - 結果需與逐檔 MACalculator 相同
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.convergence_engine import ConvergenceEngine, ConvergenceIndex, PriceMatrix
+from services.ma_calculator import MACalculator
+
+
+def make_frames(n_stocks=30, n_days=200, seed=0):
+    """產生隨機漫步股價，部分股票缺少早期或中間的交易日"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2023-01-02", periods=n_days, tz="Asia/Taipei")
+    frames = {}
+    for i in range(n_stocks):
+        # 波動度越低越容易糾結，讓結果同時包含符合與不符合的股票
+        vol = 0.002 + 0.02 * i / n_stocks
+        close = 100 * np.exp(np.cumsum(rng.normal(0, vol, n_days)))
+        df = pd.DataFrame({"Close": close}, index=dates)
+        if i % 5 == 1:
+            df = df.iloc[60:]
+        if i % 7 == 2:
+            df = df.drop(df.index[150:153])
+        frames[f"{1000 + i}"] = df
+    return frames
+
+
+class TestConvergenceEngine:
+    """ConvergenceEngine 行為"""
+
+    def test_rolling_mean_should_match_pandas(self):
+        """【均線】累積和移動平均應與 pandas rolling 相同"""
+        values = np.array([[1.0], [2.0], [np.nan], [4.0], [5.0], [6.0], [7.0]])
+        expected = pd.Series(values[:, 0]).rolling(window=2).mean().to_numpy()
+        result = ConvergenceEngine.rolling_mean(values, 2)[:, 0]
+        np.testing.assert_allclose(result, expected, equal_nan=True)
+
+    def test_check_convergence_should_match_per_stock(self):
+        """【一致性】全市場向量化結果應與逐檔 check_convergence 相同"""
+        frames = make_frames()
+        matrix = PriceMatrix.from_frames(frames)
+        ma_periods = [5, 10, 20, 60]
+
+        is_converged, current_pct, last_close = ConvergenceEngine.check_convergence(
+            matrix, ma_periods, 3.0, 5
+        )
+
+        assert is_converged.any()
+        assert not is_converged.all()
+        for i, code in enumerate(matrix.codes):
+            expected, expected_pct = MACalculator.check_convergence(
+                frames[code].copy(), ma_periods, 3.0, 5
+            )
+            assert bool(is_converged[i]) == bool(expected), code
+            if expected:
+                assert current_pct[i] == expected_pct
+            assert last_close[i] == frames[code]["Close"].iloc[-1]
+
+    def test_check_convergence_should_reject_short_history(self):
+        """【資料不足】K 棒數少於最長均線 + 天數應不符合條件"""
+        dates = pd.bdate_range("2024-01-01", periods=30)
+        frames = {"2330": pd.DataFrame({"Close": np.full(30, 100.0)}, index=dates)}
+        matrix = PriceMatrix.from_frames(frames)
+        is_converged, _, _ = ConvergenceEngine.check_convergence(matrix, [5, 10, 20, 60], 3.0, 5)
+        assert not is_converged[0]
+
+
+class TestConvergenceIndex:
+    """ConvergenceIndex 行為"""
+
+    def test_query_should_match_engine_for_any_threshold(self):
+        """【一致性】同一份索引對不同 (幅度, 天數) 的結果應與逐次計算相同"""
+        frames = make_frames()
+        matrix = PriceMatrix.from_frames(frames)
+        ma_periods = [5, 10, 20, 60]
+        index = ConvergenceIndex.build(matrix, ma_periods, max_days=30)
+
+        for pct, days in [(1.0, 1), (3.0, 5), (5.0, 10), (2.5, 30)]:
+            expected, expected_pct, _ = ConvergenceEngine.check_convergence(
+                matrix, ma_periods, pct, days
+            )
+            matched = index.query(pct, days)
+            assert set(matched) == set(np.flatnonzero(expected)), (pct, days)
+            for i in matched:
+                assert index.current_pct[i] == expected_pct[i]
+
+    def test_query_should_reject_days_beyond_index(self):
+        """【範圍】超過索引天數的查詢應引發 ValueError"""
+        index = ConvergenceIndex.build(PriceMatrix.from_frames(make_frames(5)), [5, 10], max_days=3)
+        with pytest.raises(ValueError):
+            index.query(3.0, 4)
+
+    def test_build_many_should_match_individual_builds(self):
+        """【參數掃描】共用均線建立的多組索引應與逐組建立相同"""
+        matrix = PriceMatrix.from_frames(make_frames())
+        period_sets = [(5, 10, 20), (5, 10, 20, 60), (10, 60), (20, 10, 5)]
+
+        indexes = ConvergenceIndex.build_many(matrix, period_sets, max_days=10)
+
+        assert set(indexes) == {(5, 10, 20), (5, 10, 20, 60), (10, 60)}
+        for periods, index in indexes.items():
+            expected = ConvergenceIndex.build(matrix, list(periods), max_days=10)
+            np.testing.assert_array_equal(index.current_pct, expected.current_pct)
+            for pct, days in [(2.0, 1), (3.0, 5), (5.0, 10)]:
+                assert set(index.query(pct, days)) == set(expected.query(pct, days)), (periods, pct, days)
@@ -0,0 +1,253 @@
+"""
+資料來源測試 (不需網路)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.data_provider import (
+    DataProvider, RecordingProvider, ReplayProvider, SyntheticProvider, synthetic_universe
+)
+from services.fetch_executor import FetchExecutor
+from services.frame_cache import FrameCache
+from services.incremental_ma import IncrementalIndicatorCache
+from services.ma_calculator import MACalculator
+from services.ohlcv_store import OHLCVStore
+from services.result_cache import ScreenResultCache
+from services.screener import MAConvergenceScreener
+from services.stock_data import StockDataService
+from services.symbol_registry import SymbolRegistry
+
+
+class TestSyntheticProvider:
+    """SyntheticProvider 行為"""
+
+    def test_series_should_be_deterministic_and_prefix_stable(self):
+        """【可重現】不同的結束時間只是截取同一序列"""
+        provider = SyntheticProvider(seed=1)
+        full = provider.history("90000.TW", "1d", "2024-01-01", "2024-06-01")
+        short = provider.history("90000.TW", "1d", "2024-03-01", "2024-04-01")
+
+        assert not short.empty
+        pd.testing.assert_frame_equal(full.loc[short.index], short)
+        assert (full["High"] >= full[["Open", "Close"]].max(axis=1)).all()
+        assert (full["Low"] <= full[["Open", "Close"]].min(axis=1)).all()
+
+    def test_end_should_be_exclusive(self):
+        """【區間】與其他資料來源相同，end 當天的 K 棒不含在內"""
+        bars = SyntheticProvider(seed=1).history("90000.TW", "1d", "2024-01-01", "2024-02-01")
+        assert bars.index[-1] == pd.Timestamp("2024-01-31", tz="Asia/Taipei")
+
+    def test_intraday_should_follow_session(self):
+        """【交易時段】分鐘 K 應落在 09:00-13:30"""
+        provider = SyntheticProvider(now="2024-03-05 23:00")
+        bars = provider.history("90001.TWO", "15m", "2024-03-05")
+        assert len(bars) == 18
+        assert bars.index[0].strftime("%H:%M") == "09:00"
+        assert bars.index[-1].strftime("%H:%M") == "13:15"
+
+    def test_universe_should_build_registry(self):
+        """【合成市場】合成清單可直接建立註冊表"""
+        registry = SymbolRegistry.from_records(synthetic_universe(100))
+        assert len(registry) == 100
+        assert len(registry.list(market="TWO")) == 50
+
+
+class TestReplayProvider:
+    """RecordingProvider / ReplayProvider 行為"""
+
+    def test_recorded_history_should_replay(self, tmp_path):
+        """【重播】錄下的 K 線應能以相同區間重播"""
+        source = SyntheticProvider(seed=2)
+        recorder = RecordingProvider(source, str(tmp_path))
+        recorded = recorder.history("90002.TW", "1d", "2024-01-01", "2024-02-01")
+
+        replayed = ReplayProvider(str(tmp_path)).history("90002.TW", "1d", "2024-01-10", "2024-02-01")
+        np.testing.assert_allclose(
+            replayed["Close"].to_numpy(), recorded.loc["2024-01-10":, "Close"].to_numpy()
+        )
+        assert ReplayProvider(str(tmp_path)).history("2330.TW", "1d", "2024-01-01").empty
+
+
+class TestPrefetchWithSyntheticData:
+    """批次預先載入與本地儲存"""
+
+    @pytest.mark.anyio
+    async def test_prefetch_should_keep_data_written_by_another_worker(self, tmp_path):
+        """【多 worker】下載期間其他 worker 已寫入新資料時，不應以批次結果覆寫"""
+        registry = SymbolRegistry.from_records(synthetic_universe(1))
+        provider = SyntheticProvider(seed=3)
+        store = OHLCVStore(str(tmp_path))
+        service = StockDataService(
+            executor=FetchExecutor(max_workers=1), store=store, cache=FrameCache(),
+            registry=registry, provider=provider
+        )
+        code = registry.list()[0]["code"]
+        symbol = service.get_yfinance_symbol(code)
+        written = {}
+
+        def download(symbols, start, actions=False):
+            frames = DataProvider.download(provider, symbols, start, actions=actions)
+            written["bars"] = frames[symbol].iloc[:-1]
+            store.save(symbol, "1d", written["bars"], coverage_start=pd.Timestamp(start, tz="Asia/Taipei"))
+            return frames
+
+        provider.download = download
+        results = await service.prefetch_histories([code])
+
+        assert len(store.load(symbol, "1d")) == len(written["bars"])
+        assert results[code].index[-1] == written["bars"].index[-1]
+
+
+class FakeKlineService:
+    """以固定 K 線回應 get_kline_data 的分鐘 K 服務"""
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    async def get_kline_data(self, code, market, interval, n_bars=None):
+        return self.frames[code].tail(n_bars)
+
+
+class TestScreenWithSyntheticData:
+    """以合成資料執行完整篩選流程"""
+
+    @pytest.mark.anyio
+    async def test_screen_should_match_per_stock_check(self, tmp_path):
+        """【端到端】篩選結果應與逐檔 MACalculator 相同"""
+        registry = SymbolRegistry.from_records(synthetic_universe(30))
+        service = StockDataService(
+            executor=FetchExecutor(max_workers=4),
+            store=OHLCVStore(str(tmp_path)),
+            cache=FrameCache(),
+            registry=registry,
+            provider=SyntheticProvider(seed=3)
+        )
+        screener = MAConvergenceScreener(
+            service, MACalculator(),
+            indicators=IncrementalIndicatorCache(), results=ScreenResultCache()
+        )
+
+        results = await screener.screen(convergence_pct=8.0, convergence_days=3)
+
+        expected = set()
+        for stock in registry.list():
+            df = await service.get_stock_history(stock["code"])
+            converged, _ = MACalculator.check_convergence(df.copy(), [5, 10, 20, 60], 8.0, 3)
+            if converged:
+                expected.add(stock["code"])
+        assert {r["code"] for r in results} == expected
+        assert [r["convergence_pct"] for r in results] == sorted(r["convergence_pct"] for r in results)
+
+    @pytest.mark.anyio
+    async def test_sweep_should_match_individual_screens(self, tmp_path):
+        """【參數掃描】每組參數的結果應與單獨呼叫 screen() 相同"""
+        registry = SymbolRegistry.from_records(synthetic_universe(30))
+        service = StockDataService(
+            executor=FetchExecutor(max_workers=4),
+            store=OHLCVStore(str(tmp_path)),
+            cache=FrameCache(),
+            registry=registry,
+            provider=SyntheticProvider(seed=3)
+        )
+        screener = MAConvergenceScreener(
+            service, MACalculator(),
+            indicators=IncrementalIndicatorCache(), results=ScreenResultCache()
+        )
+        param_sets = [
+            {"ma_periods": periods, "convergence_pct": pct, "convergence_days": days}
+            for periods in ([5, 10, 20], [5, 10, 20, 60])
+            for pct in (4.0, 8.0)
+            for days in (1, 3)
+        ]
+
+        sweep = await screener.screen_sweep(param_sets)
+
+        assert sweep["distinct_periods"] == [5, 10, 20, 60]
+        for k, params in enumerate(param_sets):
+            results = await screener.screen(**params)
+            matched = {row["code"] for row in sweep["stocks"] if row["matches"][k] is not None}
+            assert matched == {r["code"] for r in results}
+            assert sweep["sets"][k]["count"] == len(results)
+
+    @pytest.mark.anyio
+    async def test_stream_should_emit_matches_per_batch(self, tmp_path):
+        """【串流】每批載入後即送出該批符合的股票，done 結果應與 screen() 相同，合併的索引供調整門檻沿用"""
+        registry = SymbolRegistry.from_records(synthetic_universe(120))
+        service = StockDataService(
+            executor=FetchExecutor(max_workers=4),
+            store=OHLCVStore(str(tmp_path)),
+            cache=FrameCache(),
+            registry=registry,
+            provider=SyntheticProvider(seed=3)
+        )
+        screener = MAConvergenceScreener(
+            service, MACalculator(),
+            indicators=IncrementalIndicatorCache(), results=ScreenResultCache()
+        )
+
+        events = [e async for e in screener.screen_stream(convergence_pct=8.0, convergence_days=3)]
+        index = next(iter(screener._indexes.values()))[1]
+        again = [e async for e in screener.screen_stream(convergence_pct=8.0, convergence_days=3)]
+        relaxed = await screener.screen(convergence_pct=10.0, convergence_days=3)
+        loose = [e["type"] async for e in screener.screen_stream(convergence_pct=100.0, convergence_days=3)]
+
+        # 寬鬆條件下每批都有符合的股票：第一筆 match 出現在最後一批載入完成之前
+        assert loose.count("progress") == 3
+        assert loose.index("match") < len(loose) - 1 - loose[::-1].index("progress")
+        # 以另一個篩選器 (不共用結果快取) 經由糾結索引計算
+        fresh = MAConvergenceScreener(
+            service, MACalculator(),
+            indicators=IncrementalIndicatorCache(), results=ScreenResultCache()
+        )
+        assert events[-1]["results"] == await fresh.screen(convergence_pct=8.0, convergence_days=3)
+        matches = [e["stock"] for e in events if e["type"] == "match"]
+        assert sorted(matches, key=lambda r: (r["convergence_pct"], r["code"])) == events[-1]["results"]
+        assert not events[-1]["cached"] and again[-1]["cached"]
+        assert again[-1]["etag"] == events[-1]["etag"]
+        assert next(iter(screener._indexes.values()))[1] is index
+        assert len(relaxed) >= len(events[-1]["results"])
+
+    @pytest.mark.anyio
+    async def test_intraday_screen_should_update_incrementally(self, tmp_path, monkeypatch):
+        """【增量】分鐘 K 再次篩選時每檔只需餵入新的 K 棒，結果與逐檔 MACalculator 相同"""
+        registry = SymbolRegistry.from_records(synthetic_universe(20))
+        service = StockDataService(
+            executor=FetchExecutor(max_workers=4),
+            store=OHLCVStore(str(tmp_path)),
+            cache=FrameCache(),
+            registry=registry,
+            provider=SyntheticProvider(seed=3)
+        )
+        rng = np.random.default_rng(5)
+        index = pd.date_range("2024-03-01 09:00", periods=301, freq="15min", tz="Asia/Taipei")
+        series = {
+            stock["code"]: pd.DataFrame({"Close": 100 + rng.normal(0, 0.3, 301).cumsum()}, index=index)
+            for stock in registry.list()
+        }
+        tv = FakeKlineService({code: df.iloc[:300] for code, df in series.items()})
+        monkeypatch.setattr("services.screener.get_tv_service", lambda: tv)
+        screener = MAConvergenceScreener(
+            service, MACalculator(),
+            indicators=IncrementalIndicatorCache(), results=ScreenResultCache()
+        )
+
+        await screener.screen(convergence_pct=2.0, convergence_days=3, interval="15m")
+        tv.frames = series
+        results = await screener.screen(convergence_pct=2.0, convergence_days=3, interval="15m")
+        streamed = [e async for e in screener.screen_stream(
+            convergence_pct=2.0, convergence_days=3, interval="15m"
+        )]
+
+        stats = screener.indicators.stats()
+        # 第二次只重播最後一根並加入一根新 K 棒；串流與前一次資料相同，不需再餵入
+        assert stats["rebuilds"] == 20
+        assert stats["appended"] == 2 * 20
+        assert stats["unchanged"] == 20
+        n_bars = MAConvergenceScreener._required_bars([5, 10, 20, 60], 30)
+        expected = {
+            code for code, df in series.items()
+            if MACalculator.check_convergence(df.tail(n_bars), [5, 10, 20, 60], 2.0, 3)[0]
+        }
+        assert {r["code"] for r in results} == expected
+        assert streamed[-1]["results"] == results
@@ -0,0 +1,152 @@
+"""
+抓取執行器測試
+"""
+import asyncio
+import time
+
+import pytest
+
+from services.fetch_executor import FetchExecutor, current_deadline, fetch_deadline
+from services.fetch_scheduler import BACKGROUND, INTERACTIVE, current_lane, fetch_priority
+from services.single_flight import SingleFlight
+
+
+class TestFetchExecutor:
+    """FetchExecutor 行為"""
+
+    @pytest.mark.anyio
+    async def test_blocking_calls_should_overlap(self):
+        """【並行】多個阻塞呼叫應在執行緒池中同時進行"""
+        executor = FetchExecutor(max_workers=4)
+        start = time.monotonic()
+        await asyncio.gather(*[executor.run(time.sleep, 0.2) for _ in range(4)])
+        assert time.monotonic() - start < 0.6
+        stats = executor.stats()
+        assert stats["completed"] == 4
+        assert stats["queue_depth"] == 0
+        assert stats["in_flight"] == 0
+        executor.shutdown()
+
+    @pytest.mark.anyio
+    async def test_deadline_should_raise_timeout(self):
+        """【截止時間】超過請求截止時間應拋出 TimeoutError"""
+        executor = FetchExecutor(max_workers=1)
+        with fetch_deadline(0.05):
+            with pytest.raises(asyncio.TimeoutError):
+                await executor.run(time.sleep, 0.3)
+        assert executor.stats()["timed_out"] == 1
+        executor.shutdown()
+
+    @pytest.mark.anyio
+    async def test_cancel_should_drop_queued_work(self):
+        """【取消】被取消的請求不應留在佇列中"""
+        executor = FetchExecutor(max_workers=1)
+        blocker = asyncio.ensure_future(executor.run(time.sleep, 0.2))
+        queued = asyncio.ensure_future(executor.run(time.sleep, 0.2))
+        await asyncio.sleep(0.05)
+        assert executor.stats()["queue_depth"] == 1
+        queued.cancel()
+        await blocker
+        stats = executor.stats()
+        assert stats["queue_depth"] == 0
+        assert stats["cancelled"] == 1
+        executor.shutdown()
+
+
+class TestSingleFlight:
+    """請求合併"""
+
+    @pytest.mark.anyio
+    async def test_concurrent_calls_should_share_one_execution(self):
+        """【合併】相同鍵值的並行呼叫只應執行一次"""
+        flight = SingleFlight()
+        executions = []
+
+        async def fetch():
+            executions.append(1)
+            await asyncio.sleep(0.05)
+            return "data"
+
+        results = await asyncio.gather(*[flight.do("2330", fetch) for _ in range(5)])
+        assert results == ["data"] * 5
+        assert len(executions) == 1
+        stats = flight.stats()
+        assert stats["saved"] == 4
+        assert stats["in_flight"] == 0
+
+    @pytest.mark.anyio
+    async def test_cancelled_caller_should_not_cancel_others(self):
+        """【取消】單一呼叫端取消不應影響其他等待中的呼叫端"""
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return "data"
+
+        first = asyncio.ensure_future(flight.do("2330", fetch))
+        second = asyncio.ensure_future(flight.do("2330", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "data"
+
+    @pytest.mark.anyio
+    async def test_last_caller_leaving_should_cancel_shared_work(self):
+        """【取消】所有呼叫端都離開時應取消共用的工作，之後的呼叫重新執行"""
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.ensure_future(flight.do("2330", fetch)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        callers[0].cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled.is_set()
+
+        callers[1].cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert flight.stats()["in_flight"] == 0
+        assert flight.stats()["abandoned"] == 1
+
+        async def again():
+            return "data"
+
+        assert await flight.do("2330", again) == "data"
+
+    @pytest.mark.anyio
+    async def test_shared_work_should_use_highest_lane_and_earliest_deadline(self):
+        """【優先權】共用工作應採用等待者中最高優先的通道與最早的截止時間"""
+        flight = SingleFlight()
+        joined = asyncio.Event()
+        seen = {}
+
+        async def fetch():
+            seen["before"] = (current_lane(), current_deadline())
+            await joined.wait()
+            seen["after"] = (current_lane(), current_deadline())
+            return "data"
+
+        async def screen():
+            with fetch_deadline(600), fetch_priority(BACKGROUND):
+                return await flight.do("2330", fetch)
+
+        async def kline():
+            with fetch_deadline(5):
+                result = flight.do("2330", fetch)
+                joined.set()
+                return await result
+
+        screening = asyncio.ensure_future(screen())
+        await asyncio.sleep(0.01)
+        assert await kline() == "data"
+        assert await screening == "data"
+
+        assert seen["before"][0] == BACKGROUND
+        lane, deadline = seen["after"]
+        assert lane == INTERACTIVE
+        assert deadline <= time.monotonic() + 5 < seen["before"][1]
@@ -0,0 +1,199 @@
+"""
+抓取排程器測試
+"""
+import asyncio
+import time
+
+import pytest
+
+from services.fetch_executor import FetchExecutor, fetch_deadline
+from services.metrics import FETCH_SECONDS
+from services.fetch_scheduler import (
+    AIMDLimit, DeadlineExceeded, FetchScheduler, TokenBucket, BACKGROUND, INTERACTIVE,
+    fetch_priority, is_throttled
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RateLimited(Exception):
+    """模擬 yfinance 的 YFRateLimitError"""
+
+
+class TestTokenBucket:
+    """TokenBucket 行為"""
+
+    def test_should_allow_burst_then_refill(self):
+        """【速率】突發量用完後需等待，令牌依速率補充"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=3, clock=clock)
+
+        assert [bucket.try_take() for _ in range(4)] == [True, True, True, False]
+        assert bucket.delay() == pytest.approx(0.5)
+        clock.now = 0.5
+        assert bucket.try_take()
+
+    def test_drain_should_pause_requests(self):
+        """【限流】清空令牌後需等待補充"""
+        bucket = TokenBucket(rate=1, burst=5, clock=FakeClock())
+        bucket.drain()
+        assert not bucket.try_take()
+
+
+class TestAIMDLimit:
+    """AIMDLimit 行為"""
+
+    def test_healthy_latency_should_ramp_up(self):
+        """【加法增加】每完成約「上限」個低延遲請求，上限加一；延遲過高時不增加"""
+        limit = AIMDLimit(initial=2, minimum=1, maximum=8, latency_target=1.0, clock=FakeClock())
+        for _ in range(3):
+            limit.on_success(0.1)
+        assert limit.limit == 3
+        for _ in range(10):
+            limit.on_success(5.0)
+        assert limit.limit == 3
+
+    def test_failures_should_halve_once_per_window(self):
+        """【乘法減少】失敗時減半，同一時間窗內的連續失敗只減一次"""
+        clock = FakeClock()
+        limit = AIMDLimit(initial=8, minimum=1, maximum=8, latency_target=1.0, clock=clock)
+        limit.on_failure()
+        limit.on_failure()
+        assert limit.limit == 4
+        clock.now = 2.0
+        limit.on_failure()
+        assert limit.limit == 2
+        assert limit.decreases == 2
+
+
+class TestFetchScheduler:
+    """FetchScheduler 行為"""
+
+    @pytest.mark.anyio
+    async def test_interactive_should_preempt_queued_background(self):
+        """【優先通道】等待中的 K 線請求應先於較早排隊的篩選抓取取得名額"""
+        scheduler = FetchScheduler(max_concurrency=1, rate=0, initial_concurrency=1, interactive_reserve=0)
+        holder = await scheduler.acquire(lane=BACKGROUND)
+        order = []
+
+        async def fetch(lane, name):
+            ticket = await scheduler.acquire(lane=lane)
+            order.append(name)
+            scheduler.release(ticket)
+
+        tasks = [asyncio.ensure_future(fetch(BACKGROUND, f"screen{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(fetch(INTERACTIVE, "kline")))
+        await asyncio.sleep(0)
+
+        scheduler.release(holder)
+        await asyncio.gather(*tasks)
+        assert order == ["kline", "screen0", "screen1", "screen2"]
+
+    @pytest.mark.anyio
+    async def test_background_should_leave_reserved_slots(self):
+        """【保留名額】篩選抓取不可佔滿並行上限"""
+        scheduler = FetchScheduler(max_concurrency=4, rate=0, initial_concurrency=4, interactive_reserve=2)
+        tickets = [await scheduler.acquire(lane=BACKGROUND) for _ in range(2)]
+        blocked = asyncio.ensure_future(scheduler.acquire(lane=BACKGROUND))
+        await asyncio.sleep(0)
+
+        assert not blocked.done()
+        interactive = await asyncio.wait_for(scheduler.acquire(lane=INTERACTIVE), 1)
+
+        # 保留名額也計入並行數：interactive 結束前篩選抓取仍需等待
+        scheduler.release(tickets[0])
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        scheduler.release(interactive)
+        await asyncio.wait_for(blocked, 1)
+        for ticket in (tickets[1], blocked.result()):
+            scheduler.release(ticket)
+        assert scheduler.stats()["in_flight"] == 0
+
+    @pytest.mark.anyio
+    async def test_throttled_error_should_back_off(self):
+        """【限流】429 時並行上限減半並清空令牌"""
+        scheduler = FetchScheduler(max_concurrency=8, rate=100, burst=10, initial_concurrency=8)
+        ticket = await scheduler.acquire()
+        scheduler.release(ticket, RateLimited("Too Many Requests. Rate limited. Try after a while."))
+
+        stats = scheduler.stats()
+        assert stats["limit"] == 4
+        assert stats["throttled"] == 1
+        assert stats["tokens"] < 1
+
+    @pytest.mark.anyio
+    async def test_deadline_timeout_should_not_back_off(self):
+        """【截止時間】請求截止時間到期不應降低並行上限，上游逾時與限流才減半"""
+        scheduler = FetchScheduler(max_concurrency=8, rate=0, initial_concurrency=8)
+        executor = FetchExecutor(max_workers=4, default_timeout=0.1, scheduler=scheduler)
+
+        with fetch_deadline(0.02):
+            with pytest.raises(DeadlineExceeded):
+                await executor.run(time.sleep, 0.3)
+        scheduler.release(await scheduler.acquire(), ValueError("No data found"))
+        assert scheduler.stats()["limit"] == 8
+
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(time.sleep, 0.3)
+        assert scheduler.stats()["limit"] == 4
+        executor.shutdown()
+
+    @pytest.mark.anyio
+    async def test_queued_wait_should_respect_timeout(self):
+        """【逾時】等不到名額時應拋出 TimeoutError 且不佔用名額"""
+        scheduler = FetchScheduler(max_concurrency=1, rate=0, initial_concurrency=1, interactive_reserve=0)
+        holder = await scheduler.acquire()
+        with pytest.raises(asyncio.TimeoutError):
+            await scheduler.acquire(timeout=0.05)
+
+        scheduler.release(holder)
+        scheduler.release(await asyncio.wait_for(scheduler.acquire(), 1))
+        assert scheduler.stats()["in_flight"] == 0
+
+    @pytest.mark.anyio
+    async def test_executor_should_use_current_lane(self):
+        """【整合】FetchExecutor.run() 應依 fetch_priority() 的通道取得名額"""
+        scheduler = FetchScheduler(max_concurrency=4, rate=0)
+        executor = FetchExecutor(max_workers=4, scheduler=scheduler)
+
+        with fetch_priority(BACKGROUND):
+            await executor.run(time.sleep, 0)
+        await executor.run(time.sleep, 0)
+
+        stats = scheduler.stats()
+        assert stats["granted_background"] == 1
+        assert stats["granted_interactive"] == 1
+        assert stats["in_flight"] == 0
+        executor.shutdown()
+
+    @pytest.mark.anyio
+    async def test_fetch_latency_should_exclude_queue_wait(self):
+        """【延遲】上游延遲只計入取得名額後的抓取時間，不含排隊等待"""
+        scheduler = FetchScheduler(max_concurrency=1, rate=0, initial_concurrency=1, interactive_reserve=0)
+        executor = FetchExecutor(max_workers=2, scheduler=scheduler)
+        holder = await scheduler.acquire()
+        queued = asyncio.ensure_future(
+            executor.run(time.sleep, 0.01, fetch_labels=("queued", "1d"))
+        )
+        await asyncio.sleep(0.2)
+        scheduler.release(holder)
+        await queued
+
+        latency = FETCH_SECONDS.summary(provider="queued", interval="1d")
+        assert latency["count"] == 1
+        assert latency["sum"] < 0.15
+        executor.shutdown()
+
+    def test_is_throttled(self):
+        """【限流判斷】HTTP 429 與 rate limit 例外應視為限流"""
+        assert is_throttled(RateLimited("Too Many Requests"))
+        assert is_throttled(Exception("HTTP Error 429"))
+        assert not is_throttled(ValueError("No data found"))
@@ -0,0 +1,79 @@
+"""
+有界 LRU / TTL 快取測試
+"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.frame_cache import FrameCache, estimate_size
+
+
+def make_frame(rows=100):
+    return pd.DataFrame({"Close": np.arange(rows, dtype=float)})
+
+
+class TestFrameCache:
+    """FrameCache 行為"""
+
+    def test_should_evict_least_recently_used(self):
+        """【LRU】超過容量時應淘汰最久未使用的資料"""
+        size = estimate_size(make_frame())
+        cache = FrameCache(max_bytes=size * 2)
+        cache.set("a", make_frame(), "1d")
+        cache.set("b", make_frame(), "1d")
+        assert cache.get("a") is not None  # a 變成最近使用
+        cache.set("c", make_frame(), "1d")
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        stats = cache.stats()
+        assert stats["evictions"] == 1
+        assert stats["bytes"] <= stats["max_bytes"]
+
+    def test_should_expire_by_interval_ttl(self):
+        """【TTL】超過該週期有效時間的資料應視為不存在"""
+        cache = FrameCache(ttls={"15m": timedelta(0), "1d": timedelta(minutes=30)})
+        cache.set("intraday", make_frame(), "15m")
+        cache.set("daily", make_frame(), "1d")
+
+        assert cache.get("intraday") is None
+        assert cache.get("daily") is not None
+        assert cache.stats()["expirations"] == 1
+
+    def test_should_reject_oversized_entry(self):
+        """【容量】單筆超過總容量的資料不應被快取"""
+        cache = FrameCache(max_bytes=10)
+        cache.set("big", make_frame(), "1d")
+        assert cache.get("big") is None
+        assert cache.stats()["rejected"] == 1
+
+    def test_clear_should_filter_by_namespace(self):
+        """【清除】指定 namespace 時只清除該類資料"""
+        cache = FrameCache()
+        cache.set(("bars", "2330.TW", "1d"), make_frame(), "1d")
+        cache.set(("derived", "2330.TW", "4h"), make_frame(), "4h")
+        assert cache.clear("bars") == 1
+        assert cache.stats()["entries"] == 1
+
+
+class TestCacheAdminAPI:
+    """快取管理 API"""
+
+    @pytest.mark.anyio
+    async def test_cache_stats_should_return_counters(self, client):
+        """【API 回應】GET `/api/admin/cache` 應回傳命中與淘汰統計"""
+        response = await client.get("/api/admin/cache?entries=true")
+        assert response.status_code == 200
+        data = response.json()
+        for key in ("entries", "bytes", "max_bytes", "hits", "misses", "evictions", "items"):
+            assert key in data
+
+    @pytest.mark.anyio
+    async def test_flush_cache_should_return_removed_count(self, client):
+        """【API 回應】DELETE `/api/admin/cache` 應回傳清除筆數"""
+        response = await client.delete("/api/admin/cache")
+        assert response.status_code == 200
+        assert "removed" in response.json()
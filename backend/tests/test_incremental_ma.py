@@ -0,0 +1,116 @@
+"""
+增量均線糾結狀態測試 - 結果需與整段重算的 MACalculator 相同
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.incremental_ma import IncrementalConvergence, IncrementalIndicatorCache
+from services.ma_calculator import MACalculator
+
+
+def make_frame(n=150, vol=0.004, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2024-01-02 09:00", periods=n, freq="15min", tz="Asia/Taipei")
+    close = 100 * np.exp(np.cumsum(rng.normal(0, vol, n)))
+    return pd.DataFrame({"Close": close}, index=index)
+
+
+class TestIncrementalConvergence:
+    """IncrementalConvergence 行為"""
+
+    def test_appending_bars_should_match_full_recompute(self):
+        """【一致性】逐根新增後的結果應與每次整段重算相同"""
+        df = make_frame()
+        ma_periods = [5, 10, 20, 60]
+        state = IncrementalConvergence(ma_periods, 5)
+        for i in range(len(df)):
+            state.update(df.index[i], float(df["Close"].iloc[i]))
+            expected = MACalculator.check_convergence(df.iloc[:i + 1].copy(), ma_periods, 3.0, 5)
+            result = state.check(3.0)
+            assert result[0] == bool(expected[0]), i
+            assert result[1] == pytest.approx(expected[1]), i
+
+        assert state.ma(20) == pytest.approx(df["Close"].iloc[-20:].mean())
+
+    def test_missing_close_should_match_full_recompute(self):
+        """【缺值】含 NaN 收盤價時，逐根新增與重建的結果都應與 check_convergence 相同"""
+        df = make_frame()
+        df.iloc[[100, 140], 0] = np.nan
+        ma_periods = [5, 10, 20]
+        state = IncrementalConvergence(ma_periods, 3)
+        for i in range(len(df)):
+            state.update(df.index[i], float(df["Close"].iloc[i]))
+            expected = MACalculator.check_convergence(df.iloc[:i + 1].copy(), ma_periods, 3.0, 3)
+            result = state.check(3.0)
+            assert result[0] == bool(expected[0]), i
+            assert result[1] == pytest.approx(expected[1]), i
+
+            loaded = IncrementalConvergence(ma_periods, 3)
+            loaded.load(df.iloc[:i + 1])
+            assert loaded.check(3.0)[0] == result[0], i
+            assert loaded.check(3.0)[1] == pytest.approx(result[1]), i
+
+    def test_replacing_last_bar_should_update_in_place(self):
+        """【盤中更新】相同時間的 K 棒應取代最後一根而非新增"""
+        df = make_frame(80)
+        state = IncrementalConvergence([5, 10], 3)
+        state.load(df)
+        bars = state.bars
+
+        state.update(df.index[-1], 200.0)
+        expected = df["Close"].copy()
+        expected.iloc[-1] = 200.0
+        assert state.bars == bars
+        assert state.ma(5) == pytest.approx(expected.iloc[-5:].mean())
+
+    def test_should_reject_out_of_order_bar(self):
+        """【順序】較早的 K 棒時間應引發 ValueError"""
+        df = make_frame(10)
+        state = IncrementalConvergence([5], 1)
+        state.load(df)
+        with pytest.raises(ValueError):
+            state.update(df.index[0], 100.0)
+
+
+class TestIncrementalIndicatorCache:
+    """IncrementalIndicatorCache 行為"""
+
+    def test_sync_should_only_feed_new_bars(self):
+        """【增量】已同步的狀態只應餵入新的 K 棒"""
+        df = make_frame()
+        cache = IncrementalIndicatorCache()
+        cache.sync("2330", "15m", df.iloc[:-3], [5, 10, 20], 5)
+        state = cache.sync("2330", "15m", df, [5, 10, 20], 5)
+
+        stats = cache.stats()
+        assert stats["rebuilds"] == 1
+        assert stats["appended"] == 4  # 最後一根重新比對 + 3 根新 K 棒
+        expected = MACalculator.check_convergence(df.copy(), [5, 10, 20], 3.0, 5)
+        assert state.check(3.0)[1] == pytest.approx(expected[1])
+
+    def test_sync_should_not_rebuild_after_missing_close(self):
+        """【缺值】序列含 NaN 時重複同步不應每次重建"""
+        df = make_frame()
+        df.iloc[[60, len(df) - 1], 0] = np.nan
+        cache = IncrementalIndicatorCache()
+        cache.sync("2330", "1d", df.iloc[:-5], [5, 10], 3)
+        cache.sync("2330", "1d", df, [5, 10], 3)
+        state = cache.sync("2330", "1d", df, [5, 10], 3)
+
+        stats = cache.stats()
+        assert stats["rebuilds"] == 1
+        assert stats["unchanged"] == 1
+        expected = MACalculator.check_convergence(df.copy(), [5, 10], 3.0, 3)
+        assert state.check(3.0)[1] == pytest.approx(expected[1])
+
+    def test_sync_should_rebuild_when_history_changes(self):
+        """【重建】較早的收盤價被調整時應由整段資料重建"""
+        df = make_frame()
+        cache = IncrementalIndicatorCache()
+        cache.sync("2330", "1d", df, [5, 10], 3)
+
+        adjusted = df * 0.5
+        state = cache.sync("2330", "1d", adjusted, [5, 10], 3)
+        assert cache.stats()["rebuilds"] == 2
+        assert state.ma(5) == pytest.approx(adjusted["Close"].iloc[-5:].mean())
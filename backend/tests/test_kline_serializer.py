@@ -0,0 +1,69 @@
+"""
+K 線序列化測試
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from services.kline_serializer import build_kline_payload, encode_json
+
+
+def make_frame(n: int, freq: str = "D") -> pd.DataFrame:
+    index = pd.date_range("2024-01-01 09:00", periods=n, freq=freq, tz="Asia/Taipei")
+    close = 100 + np.arange(n, dtype=float) / 3
+    return pd.DataFrame(
+        {"Open": close, "High": close + 1, "Low": close - 1, "Close": close, "Volume": 1000.0},
+        index=index
+    )
+
+
+class TestKlineSerializer:
+    """K 線序列化"""
+
+    def test_rows_should_match_per_row_formatting(self):
+        """【列式】日K 應輸出四捨五入後的價格與 YYYY-MM-DD 時間"""
+        df = make_frame(30)
+        payload = build_kline_payload(df, "1d", [5], n_bars=10, decimals=2)
+
+        assert len(payload["ohlc"]) == 10
+        last = payload["ohlc"][-1]
+        assert last == {
+            "time": "2024-01-30", "open": round(df["Open"].iloc[-1], 2),
+            "high": round(df["High"].iloc[-1], 2), "low": round(df["Low"].iloc[-1], 2),
+            "close": round(df["Close"].iloc[-1], 2), "volume": 1000
+        }
+        # 均線以暖身資料計算，輸出區間內每根都有值
+        assert len(payload["ma_lines"]["MA5"]) == 10
+        assert payload["ma_lines"]["MA5"][-1]["value"] == round(df["Close"].iloc[-5:].mean(), 2)
+
+    def test_columnar_should_align_ma_with_time(self):
+        """【欄式】均線陣列應與時間等長，尚未形成的位置為 null"""
+        df = make_frame(8, freq="h")
+        payload = build_kline_payload(df, "1h", [5, 20], ma_prefix="ma", columnar=True)
+
+        assert payload["format"] == "columnar"
+        assert payload["time"][0] == int(df.index[0].timestamp())
+        assert len(payload["ma_lines"]["ma5"]) == len(payload["time"])
+        assert payload["ma_lines"]["ma5"][:4] == [None] * 4
+        assert "ma20" not in payload["ma_lines"]
+
+    def test_should_not_mutate_frame(self):
+        """【唯讀】序列化不應在傳入的 DataFrame 上新增欄位"""
+        df = make_frame(30)
+        build_kline_payload(df, "1d", [5, 10], n_bars=10)
+        assert list(df.columns) == ["Open", "High", "Low", "Close", "Volume"]
+
+    def test_precomputed_ma_should_match_computed(self):
+        """【共用均線】傳入已計算的均線時輸出應與自行計算相同"""
+        df = make_frame(30)
+        ma_series = {5: df["Close"].rolling(5).mean().to_numpy()}
+
+        expected = build_kline_payload(df, "1d", [5, 10], n_bars=10, decimals=2)
+        payload = build_kline_payload(df, "1d", [5, 10], n_bars=10, decimals=2, ma_series=ma_series)
+        assert payload == expected
+
+    def test_encode_should_roundtrip(self):
+        """【編碼】編碼結果應為合法 JSON，缺值為 null"""
+        encoded = encode_json({"value": [1.5, None]})
+        assert json.loads(encoded) == {"value": [1.5, None]}
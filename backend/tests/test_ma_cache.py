@@ -0,0 +1,103 @@
+"""
+共用均線快取測試
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.convergence_engine import PriceMatrix
+from services.frame_cache import FrameCache
+from services.ma_cache import MovingAverageCache
+from services.ma_calculator import MACalculator
+from tests.test_convergence_engine import make_frames
+
+
+def rolling(df: pd.DataFrame, period: int) -> np.ndarray:
+    return df["Close"].rolling(period).mean().to_numpy()
+
+
+class TestMovingAverageCache:
+    """MovingAverageCache 行為"""
+
+    def test_shorter_slice_should_reuse_cached_series(self):
+        """【切片】同一份歷史的較短切片應直接沿用，結果與只用切片計算相同"""
+        df = make_frames(n_stocks=1)["1000"]
+        ma_cache = MovingAverageCache(FrameCache())
+        ma_cache.series("1000", "1d", df, [5, 20])
+
+        short = df.iloc[50:]
+        series = ma_cache.series("1000", "1d", short, [5, 20])
+
+        assert ma_cache.stats() == {"computed": 2, "reused": 2, "published": 0}
+        for period in (5, 20):
+            np.testing.assert_allclose(series[period], rolling(short, period), equal_nan=True)
+
+    def test_new_bar_should_recompute(self):
+        """【資料版本】最後一根 K 棒或收盤價改變時應重新計算"""
+        df = make_frames(n_stocks=1)["1000"]
+        ma_cache = MovingAverageCache(FrameCache())
+        ma_cache.series("1000", "1d", df.iloc[:-1], [5])
+
+        series = ma_cache.series("1000", "1d", df, [5])
+        revised = df.copy()
+        revised.iloc[-1, 0] += 1
+        revised_series = ma_cache.series("1000", "1d", revised, [5])
+
+        assert ma_cache.stats()["computed"] == 3
+        assert series[5][-1] == pytest.approx(df["Close"].iloc[-5:].mean())
+        assert revised_series[5][-1] == pytest.approx(revised["Close"].iloc[-5:].mean())
+
+    def test_series_should_be_read_only(self):
+        """【唯讀】回傳的陣列不可修改，避免污染其他請求共用的資料"""
+        df = make_frames(n_stocks=1)["1000"]
+        series = MovingAverageCache(FrameCache()).series("1000", "1d", df, [5])
+        with pytest.raises(ValueError):
+            series[5][-1] = 0.0
+
+    def test_publish_should_match_per_symbol_computation(self):
+        """【整批寫入】由價格矩陣寫入的均線應與逐檔計算相同，之後開啟不需再計算"""
+        frames = make_frames()
+        ma_cache = MovingAverageCache(FrameCache())
+
+        published = ma_cache.publish("1d", frames, PriceMatrix.from_frames(frames), [5, 60])
+
+        assert published == 2 * len(frames)
+        for code, df in frames.items():
+            series = ma_cache.series(code, "1d", df, [5, 60])
+            for period in (5, 60):
+                np.testing.assert_allclose(series[period], rolling(df, period), equal_nan=True)
+        assert ma_cache.stats()["computed"] == 0
+
+
+    def test_publish_should_skip_unchanged_version(self):
+        """【資料版本】同一資料版本已寫入的均線不應重複寫入，新增的均線只寫入缺少的部分"""
+        frames = make_frames()
+        matrix = PriceMatrix.from_frames(frames)
+        ma_cache = MovingAverageCache(FrameCache())
+
+        assert ma_cache.publish("1d", frames, matrix, [5, 60], version="v1") == 2 * len(frames)
+        assert ma_cache.publish("1d", frames, matrix, [5, 60], version="v1") == 0
+        assert ma_cache.publish("1d", frames, matrix, [5, 20], version="v1") == len(frames)
+        assert ma_cache.publish("1d", frames, matrix, [5], version="v2") == len(frames)
+
+    def test_entry_should_share_bars_and_only_count_ma_values(self):
+        """【記憶體】每檔只有一筆項目，引用 K 線的時間索引，大小只計入均線陣列"""
+        df = make_frames(n_stocks=1)["1000"]
+        cache = FrameCache()
+        ma_cache = MovingAverageCache(cache)
+        ma_cache.series("1000", "1d", df, [5, 20, 60])
+
+        assert cache.stats()["entries"] == 1
+        entry = cache.get(("ma", "1000", "1d"))
+        assert entry.index is df.index
+        assert cache.stats()["bytes"] < 4 * len(df) * 8
+
+
+class TestCheckConvergence:
+    """MACalculator.check_convergence 不應修改傳入的資料"""
+
+    def test_should_not_add_ma_columns(self):
+        """【唯讀】檢查後 DataFrame 的欄位不變"""
+        df = make_frames(n_stocks=1)["1000"]
+        MACalculator.check_convergence(df, [5, 10, 20, 60], 3.0, 5)
+        assert list(df.columns) == ["Close"]
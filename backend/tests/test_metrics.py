@@ -0,0 +1,130 @@
+"""
+效能指標測試
+"""
+import asyncio
+
+import pytest
+
+from services.metrics import (
+    MetricsRegistry, LoopLagMonitor, RequestTimingMiddleware, STAGE_SECONDS, FETCH_ERRORS,
+    REQUEST_SECONDS, begin_request, end_request, fetch_timer, server_timing_header, stage, stats_collector
+)
+
+
+class TestMetricsRegistry:
+    """Prometheus 文字格式輸出"""
+
+    def test_histogram_should_render_cumulative_buckets(self):
+        """【直方圖】桶計數應為累計值，並輸出 +Inf、_sum、_count"""
+        registry = MetricsRegistry()
+        histogram = registry.histogram("t_seconds", "test", ["stage"], buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, stage="x")
+
+        text = registry.render()
+        assert "# TYPE t_seconds histogram" in text
+        assert 't_seconds_bucket{stage="x",le="0.1"} 2.0' in text
+        assert 't_seconds_bucket{stage="x",le="1.0"} 3.0' in text
+        assert 't_seconds_bucket{stage="x",le="+Inf"} 4.0' in text
+        assert 't_seconds_count{stage="x"} 4.0' in text
+
+    def test_collector_should_read_stats_at_render_time(self):
+        """【collector】既有 stats() 應在輸出時讀取"""
+        registry = MetricsRegistry()
+        stats = {"hits": 1, "misses": 0, "entries": 3}
+        registry.register_collector(stats_collector(
+            "c", "cache", lambda: stats, counters=["hits", "misses"], gauges=["entries"]
+        ))
+        stats["hits"] = 7
+
+        text = registry.render()
+        assert "c_hits_total 7.0" in text
+        assert "# TYPE c_entries gauge" in text
+
+    def test_label_values_should_be_escaped(self):
+        """【格式】標籤值中的引號應跳脫"""
+        registry = MetricsRegistry()
+        registry.counter("e_total", "test", ["route"]).inc(route='a"b')
+        assert 'e_total{route="a\\"b"} 1.0' in registry.render()
+
+
+class TestStageTiming:
+    """階段計時與 Server-Timing"""
+
+    def test_stage_should_accumulate_into_current_request(self):
+        """【Server-Timing】同一請求內的多次階段應累加"""
+        before = STAGE_SECONDS.summary(stage="unit")["count"]
+        token, timings = begin_request()
+        try:
+            with stage("unit"):
+                pass
+            with stage("unit"):
+                pass
+        finally:
+            end_request(token)
+
+        assert STAGE_SECONDS.summary(stage="unit")["count"] == before + 2
+        assert set(timings) == {"unit"}
+        header = server_timing_header(timings, 0.0123)
+        assert header.startswith("unit;dur=")
+        assert header.endswith("total;dur=12.3")
+
+    @pytest.mark.anyio
+    async def test_middleware_should_add_server_timing_and_observe_request(self):
+        """【中介層】應在回應標頭附上 Server-Timing，並於回應送完後記錄請求延遲"""
+        async def app(scope, receive, send):
+            with stage("unit_mw"):
+                pass
+            await send({"type": "http.response.start", "status": 201, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        labels = {"method": "GET", "route": "unmatched", "status": "201"}
+        before = REQUEST_SECONDS.summary(**labels)["count"]
+        middleware = RequestTimingMiddleware(app, server_timing=True)
+        await middleware({"type": "http", "method": "GET", "path": "/x"}, None, send)
+
+        headers = dict(sent[0]["headers"])
+        assert headers[b"server-timing"].startswith(b"unit_mw;dur=")
+        assert sent[1]["body"] == b"ok"
+        assert REQUEST_SECONDS.summary(**labels)["count"] == before + 1
+
+    def test_stage_outside_request_should_only_observe(self):
+        """【背景工作】沒有請求時只寫入直方圖"""
+        with stage("background"):
+            pass
+        assert STAGE_SECONDS.summary(stage="background")["count"] >= 1
+
+    @pytest.mark.anyio
+    async def test_fetch_errors_should_be_counted(self):
+        """【上游】抓取失敗應計入錯誤次數並照常拋出"""
+        with pytest.raises(RuntimeError):
+            with fetch_timer("unit", "1d"):
+                await asyncio.sleep(0)
+                raise RuntimeError("429")
+
+        assert 'screener_upstream_fetch_errors_total{provider="unit",interval="1d"}' in "\n".join(
+            FETCH_ERRORS.render()
+        )
+
+
+class TestLoopLagMonitor:
+    """事件迴圈延遲"""
+
+    @pytest.mark.anyio
+    async def test_blocking_call_should_show_as_lag(self):
+        """【延遲】同步阻塞事件迴圈的時間應反映在延遲量測"""
+        import time
+
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)
+        await asyncio.sleep(0.03)
+        await monitor.stop()
+
+        assert monitor.max_lag >= 0.05
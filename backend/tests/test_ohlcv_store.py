@@ -0,0 +1,71 @@
+"""
+本地 OHLCV 儲存測試
+"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from services.ohlcv_store import OHLCVStore, has_corporate_actions
+
+
+def make_bars(start, periods, base=100.0):
+    index = pd.bdate_range(start, periods=periods, tz="Asia/Taipei")
+    close = base + np.arange(periods, dtype=float)
+    return pd.DataFrame({
+        "Open": close - 1,
+        "High": close + 1,
+        "Low": close - 2,
+        "Close": close,
+        "Volume": np.full(periods, 1000.0),
+        "Dividends": 0.0,
+    }, index=index)
+
+
+class TestOHLCVStore:
+    """OHLCVStore 行為"""
+
+    def test_save_and_load_should_roundtrip(self, tmp_path):
+        """【儲存】存入的 K 線讀回後時間與數值應一致"""
+        store = OHLCVStore(str(tmp_path))
+        df = make_bars("2024-01-01", 10)
+        store.save("2330.TW", "1d", df)
+
+        loaded = store.load("2330.TW", "1d")
+        assert list(loaded.columns) == ["Open", "High", "Low", "Close", "Volume"]
+        assert loaded.index.equals(df.index)
+        np.testing.assert_array_equal(loaded["Close"].to_numpy(), df["Close"].to_numpy())
+
+    def test_append_should_replace_overlapping_bars(self, tmp_path):
+        """【增量】新資料與最後一根重疊時應以新資料取代"""
+        store = OHLCVStore(str(tmp_path))
+        store.save("2330.TW", "1d", make_bars("2024-01-01", 10))
+
+        new = make_bars("2024-01-12", 3, base=500.0)
+        merged = store.append("2330.TW", "1d", new)
+
+        assert len(merged) == 12
+        assert merged["Close"].iloc[9] == 500.0
+        assert merged["Close"].iloc[-1] == 502.0
+
+    def test_load_covering_should_check_coverage_and_age(self, tmp_path):
+        """【涵蓋範圍】請求起始早於已儲存範圍時應視為沒有資料"""
+        store = OHLCVStore(str(tmp_path))
+        df = make_bars("2024-01-01", 10)
+        store.save("2330.TW", "1d", df, coverage_start=df.index[0])
+
+        stored, fresh = store.load_covering("2330.TW", "1d", df.index[2], timedelta(minutes=30))
+        assert stored is not None and fresh
+
+        stored, _ = store.load_covering("2330.TW", "1d", df.index[0] - pd.Timedelta(days=30), timedelta(minutes=30))
+        assert stored is None
+
+        _, fresh = store.load_covering("2330.TW", "1d", df.index[2], timedelta(0))
+        assert not fresh
+
+    def test_corporate_actions_should_be_detected(self):
+        """【除權息】有配息的 K 棒應觸發完整重抓"""
+        df = make_bars("2024-01-01", 3)
+        assert not has_corporate_actions(df)
+        df.loc[df.index[1], "Dividends"] = 2.5
+        assert has_corporate_actions(df)
@@ -0,0 +1,42 @@
+"""
+多行程篩選測試 - 分片結果需與單一行程相同
+"""
+import numpy as np
+import pytest
+
+from services.convergence_engine import ConvergenceIndex, PriceMatrix
+from services.process_screener import ProcessScreenPool
+from tests.test_convergence_engine import make_frames
+
+
+class TestProcessScreenPool:
+    """ProcessScreenPool 行為"""
+
+    @pytest.mark.anyio
+    async def test_sharded_index_should_match_inline(self):
+        """【一致性】共享記憶體分片計算的索引應與單一行程相同"""
+        matrix = PriceMatrix.from_frames(make_frames(n_stocks=25))
+        ma_periods = [5, 10, 20, 60]
+        pool = ProcessScreenPool(processes=2, min_stocks=0)
+        try:
+            index = await pool.build_index(matrix, ma_periods, 10)
+        finally:
+            pool.shutdown()
+
+        expected = ConvergenceIndex.build(matrix, ma_periods, 10)
+        assert index.codes == expected.codes
+        np.testing.assert_array_equal(index.current_pct, expected.current_pct)
+        for days in (1, 5, 10):
+            assert set(index.query(3.0, days)) == set(expected.query(3.0, days))
+        assert pool.stats()["runs"] == 1
+
+    @pytest.mark.anyio
+    async def test_small_universe_should_run_inline(self):
+        """【門檻】股票數少於 min_stocks 時不應使用工作行程"""
+        matrix = PriceMatrix.from_frames(make_frames(n_stocks=5))
+        pool = ProcessScreenPool(processes=2, min_stocks=100)
+        try:
+            await pool.build_index(matrix, [5, 10], 5)
+        finally:
+            pool.shutdown()
+        assert pool.stats() == {"processes": 2, "min_stocks": 100, "runs": 0, "inline": 1}
@@ -0,0 +1,62 @@
+"""
+篩選結果快取測試
+"""
+import numpy as np
+import pandas as pd
+
+from services.result_cache import DataVersion, ScreenResultCache, data_version, etag_matches
+from services.snapshot_scheduler import snapshot_key
+
+
+def make_frames(last_close=110.0):
+    index = pd.bdate_range("2024-01-01", periods=10, tz="Asia/Taipei")
+    close = np.linspace(100, last_close, 10)
+    return {"2330": pd.DataFrame({"Close": close}, index=index)}
+
+
+class TestScreenResultCache:
+    """ScreenResultCache 行為"""
+
+    def test_normalized_params_should_share_entry(self):
+        """【正規化】均線順序與重複不應產生不同的快取"""
+        cache = ScreenResultCache()
+        version = data_version(make_frames())
+        key = snapshot_key({"ma_periods": [60, 5, 10, 20, 5], "convergence_pct": 3,
+                            "convergence_days": 5, "market": "all", "interval": "1d"})
+        cache.put(key, version, [{"code": "2330"}])
+
+        same = snapshot_key({"ma_periods": [5, 10, 20, 60], "convergence_pct": 3.0,
+                             "convergence_days": 5, "market": "all", "interval": "1d"})
+        assert cache.get(same, version)["results"] == [{"code": "2330"}]
+
+    def test_new_bar_should_invalidate(self):
+        """【失效】最後一根 K 棒變動時資料版本不同，應視為未命中"""
+        cache = ScreenResultCache()
+        key = ("k",)
+        entry = cache.put(key, data_version(make_frames()), [])
+
+        assert data_version(make_frames()) == entry["version"]
+        assert cache.get(key, data_version(make_frames(111.0))) is None
+        assert cache.stats()["misses"] == 1
+
+    def test_batched_version_should_match_whole(self):
+        """【分批版本】依任意順序分批加入的資料版本應與一次計算相同"""
+        frames = {**make_frames(), "2317": make_frames(120.0)["2330"]}
+        batched = DataVersion().update({"2317": frames["2317"]}).update({"2330": frames["2330"]})
+
+        assert batched.hexdigest() == data_version(frames)
+
+    def test_should_evict_oldest(self):
+        """【容量】超過上限時應淘汰最久未使用的結果"""
+        cache = ScreenResultCache(max_entries=2)
+        for key in ("a", "b", "c"):
+            cache.put((key,), "v", [])
+        assert cache.get(("a",), "v") is None
+        assert cache.get(("c",), "v") is not None
+
+    def test_etag_matching(self):
+        """【ETag】If-None-Match 應支援多個值、弱比較與 *"""
+        assert etag_matches('"x", W/"abc"', '"abc"')
+        assert etag_matches("*", '"abc"')
+        assert not etag_matches(None, '"abc"')
+        assert not etag_matches('"x"', '"abc"')
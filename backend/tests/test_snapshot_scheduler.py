@@ -0,0 +1,149 @@
+"""
+篩選快照排程器測試
+"""
+import json
+
+import pandas as pd
+import pytest
+
+from main import snapshots
+from services.snapshot_scheduler import (
+    DEFAULT_PARAMS,
+    SnapshotScheduler,
+    next_run_time,
+    snapshot_key,
+)
+
+
+def taipei(text: str) -> pd.Timestamp:
+    return pd.Timestamp(text, tz="Asia/Taipei")
+
+
+class FakeScreener:
+    def __init__(self):
+        self.calls = []
+
+    async def screen(self, **params):
+        self.calls.append(params)
+        return [{"code": "2330", "name": "台積電", "market": "TW", "close": 600.0, "convergence_pct": 1.2}]
+
+
+class TestSnapshotSchedule:
+    """排程時間與鍵值"""
+
+    def test_key_should_ignore_ma_order(self):
+        """【鍵值】均線順序與重複不應影響快照鍵值"""
+        a = dict(DEFAULT_PARAMS, ma_periods=[60, 20, 10, 5, 5])
+        assert snapshot_key(a) == snapshot_key(DEFAULT_PARAMS)
+
+    def test_next_run_should_follow_intraday_cadence(self):
+        """【排程】盤中依間隔執行，收盤後再執行一次"""
+        assert next_run_time(taipei("2024-06-03 09:07"), 15, "14:30") == taipei("2024-06-03 09:15")
+        assert next_run_time(taipei("2024-06-03 13:30"), 15, "14:30") == taipei("2024-06-03 14:30")
+        assert next_run_time(taipei("2024-06-03 15:00"), 15, "14:30") == taipei("2024-06-04 09:00")
+
+    def test_next_run_should_skip_weekend(self):
+        """【排程】週五收盤後的下一次執行為週一開盤"""
+        assert next_run_time(taipei("2024-06-07 16:00"), 15, "14:30") == taipei("2024-06-10 09:00")
+
+
+class TestSnapshotScheduler:
+    """快照保存與查詢"""
+
+    @pytest.mark.anyio
+    async def test_refresh_should_serve_snapshot_until_next_run(self):
+        """【快照】更新後的快照在下一次排程前有效，之後回到即時篩選"""
+        scheduler = SnapshotScheduler(FakeScreener(), top_n=0, intraday_minutes=15, after_close="14:30")
+        assert await scheduler.refresh_all() == 1
+        snapshot = scheduler._snapshots[snapshot_key(DEFAULT_PARAMS)]
+        snapshot["as_of"] = taipei("2024-06-03 14:30")
+
+        assert scheduler.lookup(DEFAULT_PARAMS, now=taipei("2024-06-04 08:00"))["version"] == 1
+        assert scheduler.lookup(DEFAULT_PARAMS, now=taipei("2024-06-04 09:30")) is None
+
+    def test_most_requested_params_should_be_tracked(self):
+        """【熱門條件】查詢次數最多的參數組應被納入預先計算"""
+        scheduler = SnapshotScheduler(FakeScreener(), top_n=1)
+        popular = dict(DEFAULT_PARAMS, convergence_pct=2.0)
+        rare = dict(DEFAULT_PARAMS, convergence_pct=4.0)
+        for _ in range(3):
+            scheduler.lookup(popular)
+        scheduler.lookup(rare)
+
+        tracked = [snapshot_key(p) for p in scheduler.tracked_params()]
+        assert tracked == [snapshot_key(DEFAULT_PARAMS), snapshot_key(popular)]
+
+
+    def test_tracking_should_be_bounded(self):
+        """【記憶體】大量不同的參數組不應讓查詢統計無限增長，熱門條件仍保留"""
+        scheduler = SnapshotScheduler(FakeScreener(), top_n=1, max_tracked=8)
+        popular = dict(DEFAULT_PARAMS, convergence_pct=2.0)
+        for i in range(100):
+            scheduler.lookup(popular)
+            scheduler.lookup(dict(DEFAULT_PARAMS, convergence_pct=10 + i / 100))
+
+        assert len(scheduler._requests) <= 8
+        assert len(scheduler._params) == len(scheduler._requests)
+        assert snapshot_key(popular) in [snapshot_key(p) for p in scheduler.tracked_params()]
+
+    def test_followers_should_read_leader_snapshots(self, tmp_path):
+        """【多 worker】非領導者應讀到領導者寫入共用目錄的快照，重啟後版本號延續"""
+        leader = SnapshotScheduler(FakeScreener(), directory=str(tmp_path))
+        follower = SnapshotScheduler(FakeScreener(), directory=str(tmp_path))
+        now = taipei("2024-01-15 10:01")
+        stored = leader.store(DEFAULT_PARAMS, [{"code": "2330"}], as_of=taipei("2024-01-15 10:00"))
+
+        snapshot = follower.lookup(DEFAULT_PARAMS, now=now)
+        assert snapshot["results"] == [{"code": "2330"}]
+        assert snapshot["version"] == stored["version"]
+        assert snapshot["as_of"] == stored["as_of"]
+
+        updated = leader.store(DEFAULT_PARAMS, [], as_of=taipei("2024-01-15 10:15"))
+        assert follower.lookup(DEFAULT_PARAMS, now=now)["version"] == updated["version"]
+        assert SnapshotScheduler(FakeScreener(), directory=str(tmp_path))._version == updated["version"]
+
+
+class TestSnapshotAPI:
+    """篩選 API 使用快照"""
+
+    @pytest.fixture(autouse=True)
+    def isolated_snapshots(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(snapshots, "directory", str(tmp_path))
+        yield
+        snapshots._snapshots.clear()
+        snapshots._loaded.clear()
+
+    @pytest.mark.anyio
+    async def test_screen_should_return_snapshot_with_as_of(self, client):
+        """【快照】符合快照的請求應直接回傳快照並附上 as_of"""
+        params = dict(DEFAULT_PARAMS, convergence_pct=2.5)
+        snapshot = snapshots.store(params, [
+            {"code": "2330", "name": "台積電", "market": "TW", "close": 600.0, "convergence_pct": 1.2}
+        ])
+        response = await client.post("/api/screen", json=params)
+        assert response.status_code == 200
+        assert response.headers["X-Screen-Source"] == "snapshot"
+        assert response.headers["X-Screen-As-Of"] == snapshot["as_of"].isoformat()
+        assert response.json()[0]["code"] == "2330"
+
+    @pytest.mark.anyio
+    async def test_stream_should_return_snapshot(self, client):
+        """【快照】串流篩選符合快照時應只送出快照的 done 事件，ETag 相符時送出 not_modified"""
+        params = dict(DEFAULT_PARAMS, convergence_pct=2.5)
+        snapshot = snapshots.store(params, [
+            {"code": "2330", "name": "台積電", "market": "TW", "close": 600.0, "convergence_pct": 1.2}
+        ])
+        response = await client.post("/api/screen/stream", json=params)
+        assert response.headers["X-Screen-Source"] == "snapshot"
+        events = [json.loads(line) for line in response.text.splitlines() if line]
+        assert [e["type"] for e in events] == ["done"]
+        assert events[0]["source"] == "snapshot"
+        assert events[0]["as_of"] == snapshot["as_of"].isoformat()
+        assert events[0]["results"][0]["code"] == "2330"
+
+        revalidated = await client.post(
+            "/api/screen/stream", json=params, headers={"If-None-Match": events[0]["etag"]}
+        )
+        assert json.loads(revalidated.text.splitlines()[-1]) == {
+            "type": "not_modified", "etag": events[0]["etag"]
+        }
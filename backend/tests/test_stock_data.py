@@ -0,0 +1,67 @@
+"""
+股票數據服務測試 (不需網路)
+"""
+import numpy as np
+import pandas as pd
+
+from services.fetch_executor import FetchExecutor
+from services.frame_cache import FrameCache
+from services.history_cache import HistoryCache
+from services.ohlcv_store import OHLCVStore
+from services.data_provider import split_bulk_frame
+
+
+class TestSplitBulkFrame:
+    """批次下載結果拆分"""
+
+    def _wide(self, symbols):
+        index = pd.date_range("2024-01-01", periods=4, tz="Asia/Taipei")
+        columns = pd.MultiIndex.from_product(
+            [symbols, ["Open", "High", "Low", "Close", "Volume"]]
+        )
+        return pd.DataFrame(
+            np.arange(4 * len(columns), dtype=float).reshape(4, len(columns)),
+            index=index,
+            columns=columns
+        )
+
+    def test_split_should_return_per_symbol_ohlcv(self):
+        """【拆分】寬表應拆成各股票的 OHLCV DataFrame"""
+        wide = self._wide(["2330.TW", "2317.TW"])
+        frames = split_bulk_frame(wide, ["2330.TW", "2317.TW"])
+        assert set(frames) == {"2330.TW", "2317.TW"}
+        assert list(frames["2330.TW"].columns) == ["Open", "High", "Low", "Close", "Volume"]
+        assert len(frames["2317.TW"]) == 4
+
+    def test_split_should_skip_empty_and_missing_symbols(self):
+        """【缺漏】整段無資料或未回傳的股票應被略過，交由逐檔抓取"""
+        wide = self._wide(["2330.TW", "2317.TW"])
+        wide.loc[:, ("2317.TW", slice(None))] = np.nan
+        frames = split_bulk_frame(wide, ["2330.TW", "2317.TW", "2454.TW"])
+        assert list(frames) == ["2330.TW"]
+
+    def test_split_should_drop_rows_without_close(self):
+        """【對齊】合併日期中某股票沒有交易的日子應被移除"""
+        wide = self._wide(["2330.TW", "2317.TW"])
+        wide.iloc[1, wide.columns.get_loc(("2317.TW", "Close"))] = np.nan
+        frames = split_bulk_frame(wide, ["2330.TW", "2317.TW"])
+        assert len(frames["2317.TW"]) == 3
+        assert len(frames["2330.TW"]) == 4
+
+
+class TestHistoryCache:
+    """標準歷史快取"""
+
+    def test_shorter_window_should_be_served_as_slice(self, tmp_path):
+        """【切片】較短的區間應直接由標準歷史切片取得，不重新下載"""
+        history = HistoryCache(FetchExecutor(max_workers=1), OHLCVStore(str(tmp_path)), FrameCache())
+        index = pd.bdate_range("2024-01-01", periods=300, tz="Asia/Taipei")
+        df = pd.DataFrame({"Close": np.arange(300, dtype=float)}, index=index)
+        history.put("2330.TW", "1d", df, coverage=index[0])
+
+        window = history.cached("2330.TW", "1d", index[200])
+        assert len(window) == 100
+        assert np.shares_memory(window["Close"].to_numpy(), df["Close"].to_numpy())
+
+        # 超出涵蓋範圍的請求不應命中
+        assert history.cached("2330.TW", "1d", index[0] - pd.Timedelta(days=30)) is None
@@ -0,0 +1,97 @@
+"""
+股票代碼註冊表測試
+"""
+import pytest
+
+from services.stock_data import StockDataService
+from services.symbol_registry import SymbolRegistry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    path = tmp_path / "symbols.csv"
+    path.write_text(
+        "code,name,market,industry\n"
+        "2330,台積電,TW,半導體業\n"
+        "2882,國泰金,TW,金融保險業\n"
+        "6488,環球晶,TWO,半導體業\n",
+        encoding="utf-8"
+    )
+    return SymbolRegistry(str(path))
+
+
+class TestSymbolRegistry:
+    """註冊表查詢與匯入"""
+
+    def test_lookup_by_code_and_market(self, registry):
+        """【查詢】應可依代碼、市場與產業查詢"""
+        assert registry.get("6488")["market"] == "TWO"
+        assert registry.get("9999") is None
+        assert [s["code"] for s in registry.list("TW")] == ["2330", "2882"]
+        assert [s["code"] for s in registry.list(industry="半導體業")] == ["2330", "6488"]
+        assert registry.industries() == ["半導體業", "金融保險業"]
+
+    def test_import_should_accept_chinese_headers(self, registry, tmp_path):
+        """【匯入】證交所格式的中文欄位應被正規化並取代本地清單"""
+        source = tmp_path / "export.csv"
+        source.write_text(
+            "有價證券代號,有價證券名稱,市場別,產業別\n"
+            "2317,鴻海,上市,其他電子業\n"
+            "5274,信驊,上櫃,半導體業\n"
+            "0000,無效,興櫃,\n",
+            encoding="utf-8-sig"
+        )
+        assert registry.import_csv(str(source)) == 2
+        assert registry.get("5274")["market"] == "TWO"
+        assert registry.get("2330") is None
+        assert len(SymbolRegistry(registry.path)) == 2
+
+    def test_import_without_market_column_should_use_default_market(self, registry, tmp_path):
+        """【匯入】沒有市場欄位的 ISIN 清單應以指定的市場匯入，並保留其他市場"""
+        source = tmp_path / "isin.csv"
+        source.write_text(
+            "有價證券代號及名稱,國際證券辨識號碼(ISIN Code),上市日,產業別\n"
+            "股票,,,\n"
+            "1101　台泥,TW0001101004,1962/02/09,水泥工業\n"
+            "2330　台積電,TW0002330008,1994/09/05,半導體業\n",
+            encoding="utf-8-sig"
+        )
+        with pytest.raises(ValueError):
+            registry.import_csv(str(source))
+
+        assert registry.import_csv(str(source), default_market="TW") == 3
+        assert registry.get("1101") == {"code": "1101", "name": "台泥", "market": "TW", "industry": "水泥工業"}
+        assert registry.get("2882") is None
+        assert registry.get("6488")["market"] == "TWO"
+
+    def test_isin_import_should_keep_common_stocks_only(self, registry, tmp_path):
+        """【匯入】ISIN 清單只應匯入「股票」分段的普通股，略過特別股、權證、ETF、ETN 與 TDR"""
+        source = tmp_path / "isin.csv"
+        source.write_text(
+            "有價證券代號及名稱,國際證券辨識號碼(ISIN Code),上市日,市場別,產業別,CFICode,備註\n"
+            "股票,,,,,,\n"
+            "1101　台泥,TW0001101004,1962/02/09,上市,水泥工業,ESVUFR,\n"
+            "2881A　富邦特,TW0002881A08,2016/12/26,上市,金融保險業,EPNRAR,\n"
+            "2330　台積電,TW0002330008,1994/09/05,上市,半導體業,ESVUFR,\n"
+            "上市認購(售)權證,,,,,,\n"
+            "030001　台積電元大49購01,TW18Z0300013,2024/01/02,上市,,RWSCCE,\n"
+            "ETF,,,,,,\n"
+            "0050　元大台灣50,TW0000050004,2003/06/30,上市,,CEOGEU,\n"
+            "ETN,,,,,,\n"
+            "020000　富邦特選蘋果N,TW0002000009,2020/01/15,上市,,CEOJLU,\n"
+            "臺灣存託憑證(TDR),,,,,,\n"
+            "9105　泰金寶-DR,TW0009105000,1997/04/30,上市,,EDSDDR,\n",
+            encoding="utf-8-sig"
+        )
+
+        assert registry.import_csv(str(source)) == 3
+        assert [s["code"] for s in registry.list(market="TW")] == ["1101", "2330"]
+        assert registry.get("6488")["market"] == "TWO"
+
+    def test_service_should_use_registry(self, registry):
+        """【服務】股票服務的名稱、市場與代碼轉換應查詢註冊表"""
+        service = StockDataService(registry=registry)
+        assert service.get_stock_name("2882") == "國泰金"
+        assert service.get_yfinance_symbol("6488") == "6488.TWO"
+        assert service.get_yfinance_symbol("9999") == "9999.TW"
+        assert len(service.get_stock_list(limit=None)) == 3
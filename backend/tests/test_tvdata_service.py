@@ -0,0 +1,112 @@
+"""
+多週期合併測試 (不需網路)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.frame_cache import FrameCache
+from services.ohlcv_store import OHLCVStore
+from services.tvdata_service import MultiTimeframeService, resample_bars
+
+
+def make_session(days=2):
+    """產生台股交易時段 (09:00-13:30) 的 15 分 K"""
+    bars = []
+    for day in pd.bdate_range("2024-03-04", periods=days, tz="Asia/Taipei"):
+        bars.extend(pd.date_range(day + pd.Timedelta(hours=9), periods=18, freq="15min"))
+    index = pd.DatetimeIndex(bars)
+    close = np.arange(len(index), dtype=float) + 100
+    return pd.DataFrame(
+        {"Open": close, "High": close + 1, "Low": close - 1, "Close": close, "Volume": 10.0},
+        index=index
+    )
+
+
+class TestResampleBars:
+    """resample_bars 行為"""
+
+    def test_hourly_should_align_to_session_open(self):
+        """【1h】應以 09:00 起算，最後一根為 13:00-13:30"""
+        df = make_session(1)
+        hourly = resample_bars(df, "1h")
+        assert [t.strftime("%H:%M") for t in hourly.index] == ["09:00", "10:00", "11:00", "12:00", "13:00"]
+        assert hourly["Open"].iloc[0] == df["Open"].iloc[0]
+        assert hourly["Close"].iloc[0] == df["Close"].iloc[3]
+        assert hourly["Volume"].iloc[-1] == 20.0
+
+    def test_four_hour_should_not_cross_days(self):
+        """【4h】每個交易日分為 09:00-13:00 與 13:00-13:30 兩根"""
+        df = make_session(2)
+        four = resample_bars(df, "4h")
+        assert len(four) == 4
+        assert four["High"].iloc[0] == df["High"].iloc[:16].max()
+        assert four.index[2].strftime("%Y-%m-%d %H:%M") == "2024-03-05 09:00"
+
+    def test_weekly_and_monthly_from_daily(self):
+        """【週/月K】日K 應合併到週一與每月 1 日"""
+        index = pd.bdate_range("2024-01-29", "2024-02-09", tz="Asia/Taipei")
+        df = pd.DataFrame({"Close": np.arange(len(index), dtype=float)}, index=index)
+
+        weekly = resample_bars(df, "1wk")
+        assert list(weekly.index.strftime("%Y-%m-%d")) == ["2024-01-29", "2024-02-05"]
+        assert weekly["Close"].iloc[0] == df["Close"].iloc[4]
+
+        monthly = resample_bars(df, "1mo")
+        assert list(monthly.index.strftime("%Y-%m-%d")) == ["2024-01-01", "2024-02-01"]
+
+    def test_unsupported_interval_should_raise(self):
+        with pytest.raises(ValueError):
+            resample_bars(make_session(1), "1d")
+
+
+class TestMultiTimeframeService:
+    """get_timeframes 行為"""
+
+    @pytest.mark.anyio
+    async def test_should_fetch_each_base_once(self, tmp_path):
+        """【單次抓取】30m 共用 15m 來源、4h 共用原生 1h 來源 (回溯較長)，並快取合併結果"""
+        cache = FrameCache()
+        service = MultiTimeframeService(store=OHLCVStore(str(tmp_path)), cache=cache)
+        bases = {"15m": make_session(3), "1h": resample_bars(make_session(3), "1h")}
+        calls = []
+
+        async def fake_get_bars(symbol, interval, start):
+            calls.append(interval)
+            return bases[interval]
+
+        service.history.get_bars = fake_get_bars
+        frames = await service.get_timeframes("2330", "TW", ["15m", "30m", "1h", "4h"], n_bars=100)
+
+        assert calls == ["15m", "1h"]
+        assert set(frames) == {"15m", "30m", "1h", "4h"}
+        assert len(frames["4h"]) == 6
+        assert frames["4h"].equals(resample_bars(make_session(3), "4h"))
+
+        # 來源未變時再次取得應命中合併快取
+        hits = cache.stats()["hits"]
+        assert service._derived("2330.TW", "30m", bases["15m"]).equals(frames["30m"])
+        assert cache.stats()["hits"] == hits + 1
+
+    @pytest.mark.anyio
+    async def test_kline_should_share_sources_and_derived_cache(self, tmp_path):
+        """【單一來源】get_kline_data 的 30m / 4h 應與 get_timeframes 相同來源，並共用合併快取"""
+        cache = FrameCache()
+        service = MultiTimeframeService(store=OHLCVStore(str(tmp_path)), cache=cache)
+        bases = {"15m": make_session(3), "1h": resample_bars(make_session(3), "1h")}
+        calls = []
+
+        async def fake_get_bars(symbol, interval, start):
+            calls.append(interval)
+            return bases[interval]
+
+        service.history.get_bars = fake_get_bars
+        frames = await service.get_timeframes("2330", "TW", ["30m", "4h"], n_bars=100)
+        hits = cache.stats()["hits"]
+        thirty = await service.get_kline_data("2330", "TW", "30m", n_bars=100)
+        four = await service.get_kline_data("2330", "TW", "4h", n_bars=100)
+
+        assert calls == ["15m", "1h", "15m", "1h"]
+        assert thirty.equals(frames["30m"])
+        assert four.equals(frames["4h"])
+        assert cache.stats()["hits"] == hits + 2
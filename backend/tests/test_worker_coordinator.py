@@ -0,0 +1,80 @@
+"""
+多 worker 協調測試
+"""
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.ohlcv_store import OHLCVStore, ZERO_COPY
+from services.worker_coordinator import WorkerCoordinator
+
+
+class TestWorkerCoordinator:
+    """WorkerCoordinator 行為"""
+
+    @pytest.mark.anyio
+    async def test_only_one_leader(self, tmp_path):
+        """【選舉】同一儲存目錄只能有一個領導者，領導者釋放後可由他人接手"""
+        first = WorkerCoordinator(str(tmp_path))
+        second = WorkerCoordinator(str(tmp_path))
+        if not first.enabled:
+            pytest.skip("fcntl not available")
+
+        assert first.try_acquire_leadership()
+        assert not second.try_acquire_leadership()
+
+        await first.stop()
+        assert second.try_acquire_leadership()
+        await second.stop()
+
+    @pytest.mark.anyio
+    async def test_symbol_lock_should_serialize_fetches(self, tmp_path):
+        """【逐檔鎖】同一 (股票, 週期) 的抓取應依序執行"""
+        coordinator = WorkerCoordinator(str(tmp_path))
+        if not coordinator.enabled:
+            pytest.skip("fcntl not available")
+        active = []
+        overlaps = []
+
+        async def fetch():
+            async with coordinator.symbol_lock("2330.TW", "1d"):
+                overlaps.append(len(active))
+                active.append(1)
+                await asyncio.sleep(0.01)
+                active.pop()
+
+        await asyncio.gather(fetch(), fetch(), fetch())
+        assert overlaps == [0, 0, 0]
+        assert coordinator.stats()["lock_waits"] == 2
+        assert not list((tmp_path / "locks" / "1d").iterdir())
+
+    @pytest.mark.anyio
+    async def test_reap_should_remove_only_unheld_locks(self, tmp_path):
+        """【鎖檔】領導者應清除殘留的鎖檔，但保留其他 worker 持有中的鎖"""
+        coordinator = WorkerCoordinator(str(tmp_path))
+        if not coordinator.enabled:
+            pytest.skip("fcntl not available")
+        directory = tmp_path / "locks" / "1d"
+        directory.mkdir(parents=True)
+        (directory / "1101.TW.lock").touch()
+
+        async with coordinator.symbol_lock("2330.TW", "1d"):
+            assert coordinator.reap_locks() == 1
+            assert [p.name for p in directory.iterdir()] == ["2330.TW.lock"]
+
+
+class TestZeroCopyLoad:
+    """本地儲存的零複製讀取"""
+
+    def test_loaded_frame_should_reference_memory_map(self, tmp_path):
+        """【共用】讀出的數值應直接引用 memory-map 而非複製"""
+        if not ZERO_COPY:
+            pytest.skip("zero-copy load is POSIX only")
+        store = OHLCVStore(str(tmp_path))
+        index = pd.bdate_range("2024-01-01", periods=5, tz="Asia/Taipei")
+        store.save("2330.TW", "1d", pd.DataFrame({"Close": np.arange(5.0)}, index=index))
+
+        close = store.load("2330.TW", "1d")["Close"].to_numpy()
+        assert isinstance(close.base, np.memmap) or not close.flags.writeable
@@ -11,6 +11,9 @@ const API = {
         ? `http://${window.location.hostname}:8000`
         : window.location.origin,
 
+    // 篩選結果與 ETag (以請求內容為鍵)
+    _screenCache: new Map(),
+
     /**
      * 設定 API 基礎 URL
      * @param {string} url - 新的基礎 URL
@@ -81,16 +84,126 @@ const API = {
      * @returns {Promise<Array>} - 符合條件的股票列表
      */
     async screenStocks({ maPeriods, convergencePct, convergenceDays, market, interval = '1d' }) {
-        return this.request('/api/screen', {
-            method: 'POST',
-            body: JSON.stringify({
-                ma_periods: maPeriods,
-                convergence_pct: convergencePct,
-                convergence_days: convergenceDays,
-                market: market,
-                interval: interval,
-            }),
+        const body = JSON.stringify({
+            ma_periods: maPeriods,
+            convergence_pct: convergencePct,
+            convergence_days: convergenceDays,
+            market: market,
+            interval: interval,
+        });
+
+        // 以 ETag 重新驗證，結果未變動時後端回傳 304，直接使用上次的結果
+        const cached = this._screenCache.get(body);
+        let response;
+        try {
+            response = await fetch(`${this.BASE_URL}/api/screen`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    ...(cached ? { 'If-None-Match': cached.etag } : {}),
+                },
+                body,
+            });
+        } catch (error) {
+            if (error.name === 'TypeError') {
+                throw new Error('無法連接到伺服器，請確認後端服務是否啟動');
+            }
+            throw error;
+        }
+
+        if (response.status === 304 && cached) {
+            return cached.results;
+        }
+        if (!response.ok) {
+            const errorData = await response.json().catch(() => ({}));
+            throw new Error(errorData.detail || `HTTP ${response.status}`);
+        }
+
+        const results = await response.json();
+        const etag = response.headers.get('ETag');
+        if (etag) {
+            this._screenCache.set(body, { etag, results });
+        }
+        return results;
+    },
+
+    /**
+     * 串流篩選均線糾結股票 (NDJSON)
+     * 每收到一個事件 (start / progress / match / done) 即呼叫 onEvent；
+     * 結果與上次相同時 (not_modified) 直接回傳快取的結果
+     * @param {Object} params - 篩選參數，同 screenStocks
+     * @param {Function} onEvent - 事件回呼
+     * @returns {Promise<Array>} - done 事件中排序後的結果
+     */
+    async screenStocksStream({ maPeriods, convergencePct, convergenceDays, market, interval = '1d' }, onEvent) {
+        const body = JSON.stringify({
+            ma_periods: maPeriods,
+            convergence_pct: convergencePct,
+            convergence_days: convergenceDays,
+            market: market,
+            interval: interval,
         });
+
+        // 與 screenStocks 共用 ETag 快取：結果未變動時後端只送出 not_modified 事件
+        const cached = this._screenCache.get(body);
+        let response;
+        try {
+            response = await fetch(`${this.BASE_URL}/api/screen/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'application/x-ndjson',
+                    ...(cached ? { 'If-None-Match': cached.etag } : {}),
+                },
+                body,
+            });
+        } catch (error) {
+            if (error.name === 'TypeError') {
+                throw new Error('無法連接到伺服器，請確認後端服務是否啟動');
+            }
+            throw error;
+        }
+
+        if (!response.ok) {
+            const errorData = await response.json().catch(() => ({}));
+            throw new Error(errorData.detail || `HTTP ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let results = null;
+
+        const handleLine = (line) => {
+            if (!line.trim()) return;
+            const event = JSON.parse(line);
+            if (event.type === 'not_modified' && cached) {
+                results = cached.results;
+                return;
+            }
+            if (event.type === 'done') {
+                results = event.results;
+                if (event.etag) {
+                    this._screenCache.set(body, { etag: event.etag, results });
+                }
+            }
+            onEvent(event);
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.forEach(handleLine);
+        }
+        handleLine(buffer + decoder.decode());
+
+        if (results === null) {
+            throw new Error('篩選串流中斷，請重試');
+        }
+        return results;
     },
 
     /**
@@ -99,11 +212,11 @@ const API = {
      * @param {number} days - 取幾天的數據
      * @param {number[]} maPeriods - 要計算的均線週期
      * @param {string} interval - K 線週期 (1m, 5m, 15m, 30m, 1h, 4h, 1d, 1wk, 1mo)
-     * @returns {Promise<Object>} - K 線數據與均線
+     * @returns {Promise<Object>} - K 線數據與均線 (欄式格式，ChartManager.setData 可直接使用)
      */
     async getStockKline(code, days = 120, maPeriods = [5, 10, 20, 60], interval = '1d') {
         const maPeriodsStr = maPeriods.join(',');
-        return this.request(`/api/stock/${code}/kline?days=${days}&ma_periods=${maPeriodsStr}&interval=${interval}`);
+        return this.request(`/api/stock/${code}/kline?days=${days}&ma_periods=${maPeriodsStr}&interval=${interval}&format=columnar`);
     },
 
     /**
@@ -117,8 +117,35 @@ const App = {
         this.showLoading(true);
         this.setButtonLoading(true);
 
+        this.elements.loadingProgress.textContent = '請稍候';
+
+        let renderFrame = null;
         try {
-            const stocks = await API.screenStocks(params);
+            // 邊掃描邊顯示：第一筆結果出現即關閉遮罩，按鈕維持載入狀態直到完成
+            // 結果以二分搜尋插入維持排序，同一畫面更新週期內到達的結果合併成一次繪製
+            const partial = [];
+            const stocks = await API.screenStocksStream(params, (event) => {
+                if (event.type === 'progress') {
+                    this.elements.loadingProgress.textContent =
+                        `已載入 ${event.scanned} / ${event.total} 檔`;
+                } else if (event.type === 'match') {
+                    let lo = 0;
+                    let hi = partial.length;
+                    while (lo < hi) {
+                        const mid = (lo + hi) >> 1;
+                        if (partial[mid].convergence_pct <= event.stock.convergence_pct) lo = mid + 1;
+                        else hi = mid;
+                    }
+                    partial.splice(lo, 0, event.stock);
+                    if (renderFrame === null) {
+                        renderFrame = requestAnimationFrame(() => {
+                            renderFrame = null;
+                            this.renderStockList(partial);
+                        });
+                    }
+                    this.showLoading(false);
+                }
+            });
             this.state.stocks = stocks;
             this.renderStockList(stocks);
             this.showToast(`找到 ${stocks.length} 檔符合條件的股票`, 'success');
@@ -126,6 +153,8 @@ const App = {
             console.error('Screen error:', error);
             this.showToast(error.message, 'error');
         } finally {
+            // 尚未繪製的部分結果已由完整結果取代
+            if (renderFrame !== null) cancelAnimationFrame(renderFrame);
             this.showLoading(false);
             this.setButtonLoading(false);
         }
@@ -83,8 +83,33 @@ const ChartManager = {
         resizeObserver.observe(this.container);
     },
 
+    /**
+     * 將欄式 K 線 ({time: [], open: [], ...}) 轉為列式 ({ohlc: [], ma_lines: {}})
+     * @param {Object} data - 欄式 K 線數據
+     * @returns {Object} - 列式 K 線數據
+     */
+    fromColumnar(data) {
+        const { time } = data;
+        const ohlc = time.map((t, i) => ({
+            time: t,
+            open: data.open[i],
+            high: data.high[i],
+            low: data.low[i],
+            close: data.close[i],
+            volume: data.volume[i],
+        }));
+        const maLines = {};
+        Object.entries(data.ma_lines || {}).forEach(([maName, values]) => {
+            maLines[maName] = values
+                .map((value, i) => ({ time: time[i], value }))
+                .filter(item => item.value !== null);
+        });
+        return { ...data, ohlc, ma_lines: maLines };
+    },
+
     setData(data) {
         if (!this.chart || !this.candleSeries) this.createChart();
+        if (data && data.format === 'columnar') data = this.fromColumnar(data);
         if (!data || !data.ohlc || data.ohlc.length === 0) return;
 
         // 清空舊圖例
@@ -3,7 +3,7 @@
  * 提供離線快取功能
  */
 
-const CACHE_NAME = 'tw-stock-screener-v18';
+const CACHE_NAME = 'tw-stock-screener-v21';
 const STATIC_ASSETS = [
     '/',
     '/index.html',
@@ -57,6 +57,11 @@ self.addEventListener('fetch', (event) => {
     const { request } = event;
     const url = new URL(request.url);
 
+    // 串流篩選直接交給瀏覽器，避免 Service Worker 緩衝整個回應
+    if (url.pathname === '/api/screen/stream') {
+        return;
+    }
+
     // API 請求使用 Network First 策略
     if (url.pathname.startsWith('/api/')) {
         event.respondWith(networkFirst(request));
@@ -101,7 +106,8 @@ async function cacheFirst(request) {
 async function networkFirst(request) {
     try {
         const networkResponse = await fetch(request);
-        if (networkResponse.ok) {
+        // Cache API 只能保存 GET；POST (如篩選) 由前端以 ETag 重新驗證，304 直接轉交
+        if (networkResponse.ok && request.method === 'GET') {
             // 快取 API 回應（可選）
             const cache = await caches.open(CACHE_NAME + '-api');
             cache.put(request, networkResponse.clone());